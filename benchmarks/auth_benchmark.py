@@ -0,0 +1,54 @@
+# Auth overhead benchmark: full HS256 verification on every request vs the per-worker
+# validated token cache.
+#
+# Usage (from the repo root):
+#   python -m benchmarks.auth_benchmark [--requests 10000] [--users 100]
+
+# Imports
+import os
+import time
+import argparse
+import numpy as np
+
+# A throwaway signing key if none is configured
+os.environ.setdefault('JWT_CREATION_SECRET', 'benchmark-secret')
+
+# In-App Dependencies
+import dependencies
+from dependencies import create_access_token, jwt_dependency
+
+###############################################################################
+# Benchmark
+###############################################################################
+# Times jwt_dependency over the header sequence; returns per-call latencies in microseconds
+def time_requests(headers: list, cached: bool):
+    latencies = []
+    for header in headers:
+        if not cached:
+            dependencies._token_cache.clear()
+        start = time.perf_counter()
+        jwt_dependency(authorization=header)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return np.array(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description='JWT validation overhead with and without the token cache.')
+    parser.add_argument('--requests', type=int, default=10000, help='Authenticated requests to simulate')
+    parser.add_argument('--users', type=int, default=100, help='Distinct tokens the requests are spread over')
+    args = parser.parse_args()
+
+    # One token per user, requests spread round-robin
+    tokens = [f'Bearer {create_access_token(60, {"sub": f"user{i}@example.com"})}' for i in range(args.users)]
+    headers = [tokens[i % len(tokens)] for i in range(args.requests)]
+
+    print(f"{'mode':<10}{'total ms':>10}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}")
+    for name, cached in (('uncached', False), ('cached', True)):
+        dependencies._token_cache.clear()
+        latencies = time_requests(headers, cached)
+        print(
+            f"{name:<10}{latencies.sum() / 1000:>10.1f}{latencies.mean():>10.1f}"
+            f"{np.percentile(latencies, 50):>10.1f}{np.percentile(latencies, 99):>10.1f}"
+        )
+
+if __name__ == '__main__':
+    main()
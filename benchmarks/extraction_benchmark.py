@@ -0,0 +1,171 @@
+# Peak memory & wall time of PDF text extraction + chunking on a 1,000-page fixture.
+# Compares the original path (whole upload in memory, text += page, one split over the full
+# text) with the streaming generator path and the page-parallel process pool path. Each
+# mode runs in a fresh interpreter so peaks are not shared; the fixture PDF is generated.
+#
+# Usage (from the repo root, Linux):
+#   python -m benchmarks.extraction_benchmark [--pages 1000] [--processes 4]
+
+# Imports
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import resource
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ('concat', 'stream', 'process_pool')
+
+# Words the fixture pages are made of
+FIXTURE_WORDS = (
+    'quarterly revenue forecast pipeline customer retention churn margin contract renewal '
+    'region latency incident review deployment rollback migration schema index storage '
+    'budget headcount roadmap milestone risk mitigation compliance audit vendor invoice'
+).split()
+
+###############################################################################
+# Fixture
+###############################################################################
+# Escapes text for a PDF string literal
+def _pdf_string(text: str):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+# Writes a text-only PDF with `pages` pages of `lines_per_page` lines (Helvetica, no compression)
+def write_pdf(path: str, pages: int, lines_per_page: int = 45, seed: int = 7):
+    rng = random.Random(seed)
+    objects = {
+        1: b'<< /Type /Catalog /Pages 2 0 R >>',
+        3: b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    }
+    kids = []
+    for page in range(pages):
+        page_id, content_id = 4 + 2 * page, 5 + 2 * page
+        kids.append(f'{page_id} 0 R')
+        lines = [
+            f'Page {page + 1}, line {line + 1}: ' + ' '.join(rng.choice(FIXTURE_WORDS) for _ in range(12)) + '.'
+            for line in range(lines_per_page)
+        ]
+        stream = ('BT /F1 9 Tf 12 TL 36 806 Td ' + ' '.join(f'({_pdf_string(line)}) Tj T*' for line in lines) + ' ET').encode('latin-1')
+        objects[page_id] = (
+            f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+            f'/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>'
+        ).encode('latin-1')
+        objects[content_id] = b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream'
+    objects[2] = f'<< /Type /Pages /Kids [{" ".join(kids)}] /Count {pages} >>'.encode('latin-1')
+
+    with open(path, 'wb') as f:
+        f.write(b'%PDF-1.4\n')
+        offsets = {}
+        for object_id in sorted(objects):
+            offsets[object_id] = f.tell()
+            f.write(b'%d 0 obj\n' % object_id + objects[object_id] + b'\nendobj\n')
+        xref_at = f.tell()
+        f.write(b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+        for object_id in sorted(objects):
+            f.write(b'%010d 00000 n \n' % offsets[object_id])
+        f.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref_at))
+
+###############################################################################
+# Modes (run in a child interpreter)
+###############################################################################
+# Peak resident set size of this process so far, in MiB
+def peak_rss_mib():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# The original extraction: the whole upload as bytes, pages concatenated with text +=
+def extract_text_concat(path: str):
+    from io import BytesIO
+    from PyPDF2 import PdfReader
+    with open(path, 'rb') as f:
+        file_data = f.read()
+    text = ''
+    reader = PdfReader(BytesIO(file_data))
+    for page in reader.pages:
+        page_text = page.extract_text()
+        if page_text:
+            text += page_text + '\n'
+    return text
+
+# Extracts & chunks the fixture in one mode; returns its measurements
+def run_mode(mode: str, path: str, trace_memory: bool):
+    import tracemalloc
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    from routers.ai_search import iter_text_from_pdf, iter_documents
+    from services.concurrency import shutdown_executor
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=50, length_function=len, is_separator_regex=False)
+    metadata = {'source': '/benchmark/fixture.pdf', 'container': 'benchmark', 'file_name': 'fixture.pdf'}
+    rss_before = peak_rss_mib()
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    if mode == 'concat':
+        text_stream = [extract_text_concat(path)]
+    else:
+        text_stream = iter_text_from_pdf(path)
+    chunks = sum(1 for _ in iter_documents(text_stream, text_splitter, metadata))
+    wall = time.perf_counter() - start
+
+    result = {'mode': mode, 'chunks': chunks, 'wall_s': wall, 'rss_before_mib': rss_before, 'rss_peak_mib': peak_rss_mib()}
+    if trace_memory:
+        result['traced_peak_mib'] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    shutdown_executor()
+    result['pool_rss_peak_mib'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return result
+
+###############################################################################
+# Benchmark
+###############################################################################
+# Runs one mode in a fresh interpreter and returns its measurements
+def run_child(mode: str, path: str, processes: int, trace_memory: bool):
+    env = dict(os.environ, CPU_WORKER_PROCESSES=str(processes if mode == 'process_pool' else 0), PDF_PARALLEL_MIN_PAGES='1')
+    command = [sys.executable, '-m', 'benchmarks.extraction_benchmark', '--child', mode, '--pdf', path]
+    if trace_memory:
+        command.append('--trace-memory')
+    output = subprocess.run(command, cwd=REPO_DIR, env=env, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def run(args):
+    with tempfile.TemporaryDirectory(prefix='extraction-benchmark-') as directory:
+        path = os.path.join(directory, 'fixture.pdf')
+        write_pdf(path, args.pages)
+        print(f'fixture: {args.pages} pages, {os.path.getsize(path) / 1024 / 1024:.1f} MiB; {len(os.sched_getaffinity(0))} cores, pool of {args.processes}')
+        print(f"{'mode':<14}{'chunks':>8}{'wall s':>9}{'rss peak MiB':>14}{'rss +MiB':>10}{'traced MiB':>12}{'pool rss MiB':>14}")
+        for mode in MODES:
+            # Wall time & RSS without tracing overhead; Python allocations in a second, traced run
+            timed = run_child(mode, path, args.processes, trace_memory=False)
+            traced = run_child(mode, path, args.processes, trace_memory=True)
+            print(
+                f"{mode:<14}{timed['chunks']:>8}{timed['wall_s']:>9.2f}{timed['rss_peak_mib']:>14.1f}"
+                f"{timed['rss_peak_mib'] - timed['rss_before_mib']:>10.1f}{traced['traced_peak_mib']:>12.1f}"
+                f"{timed['pool_rss_peak_mib'] if mode == 'process_pool' else 0:>14.1f}"
+            )
+
+###############################################################################
+# Entrypoint
+###############################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Peak memory & wall time of PDF extraction + chunking by path.')
+    parser.add_argument('--pages', type=int, default=1000, help='Pages in the generated fixture PDF')
+    parser.add_argument('--processes', type=int, default=len(os.sched_getaffinity(0)), help='Process pool size for the process_pool mode')
+    parser.add_argument('--child', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--pdf', help=argparse.SUPPRESS)
+    parser.add_argument('--trace-memory', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(run_mode(args.child, args.pdf, args.trace_memory)))
+    else:
+        run(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+# The FastAPI app wired to local stand-ins: fake Cosmos & Blob (benchmarks/fakes.py), the
+# local vector store and an OpenAI-compatible stub (benchmarks/fake_openai.py).
+# Started by the load benchmark as: gunicorn benchmarks.fake_app:app
+#
+# BENCH_FAKE_DIR: directory holding all fake state (shared by the workers)
+# BENCH_OPENAI_URL: base URL of the OpenAI stub
+
+# Imports
+import os
+
+FAKE_DIR = os.environ['BENCH_FAKE_DIR']
+
+# Settings the app reads at import time
+for name, value in {
+    'JWT_CREATION_SECRET': 'benchmark-secret',
+    'COSMOS_DB_NAME': 'benchmark',
+    'COSMOS_USERS_CONTAINER_NAME': 'users',
+    'COSMOS_USERCONTAINERNAME_CONTAINER_NAME': 'user_containers',
+    'COSMOS_CHAT_CONTAINER_NAME': 'chats',
+    'AZURE_OPENAI_ENDPOINT': os.environ.get('BENCH_OPENAI_URL', 'http://127.0.0.1:8701'),
+    'AZURE_OPENAI_API_KEY': 'benchmark-key',
+    'AZURE_OPENAI_API_VERSION': '2024-02-01',
+    'AZURE_OPENAI_CHAT_DEPLOYMENT_NAME': 'chat',
+    'AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME': 'embeddings',
+    'VECTOR_STORE_BACKEND': 'local',
+    'LOCAL_VECTOR_DIR': os.path.join(FAKE_DIR, 'vector_indexes'),
+    'INGESTION_JOB_DIR': os.path.join(FAKE_DIR, 'ingestion_jobs'),
+    'CHAT_JOURNAL_DIR': os.path.join(FAKE_DIR, 'chat_journal'),
+    'METRICS_DIR': os.path.join(FAKE_DIR, 'metrics'),
+    'OPENAI_RATE_LIMIT_PATH': os.path.join(FAKE_DIR, 'openai_rate_limit.bin'),
+}.items():
+    os.environ.setdefault(name, value)
+
+# In-App Dependencies (fakes first, so every module binds the fake clients)
+from benchmarks.fakes import install_fakes
+install_fakes(FAKE_DIR)
+
+from main import app
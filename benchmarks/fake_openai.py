@@ -0,0 +1,148 @@
+# OpenAI-compatible stand-in for the Azure OpenAI chat & embeddings deployments, used by the
+# load benchmark. Chat completions stream after a configurable delay at a configurable rate;
+# embeddings are deterministic hashed features (similar texts get similar vectors). A share
+# of embeddings calls can be answered 429 with Retry-After to exercise throttling.
+#
+# Usage (from the repo root):
+#   python -m benchmarks.fake_openai [--port 8701] [--ttft-ms 300] [--tokens-per-second 50] [--throttle-rate 0.1]
+
+# Imports
+import json
+import time
+import uuid
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+import numpy as np
+from aiohttp import web
+
+EMBEDDING_DIMENSIONS = 1536
+
+# Words the fake answers are made of
+ANSWER_WORDS = (
+    'the document describes how the team plans releases reviews changes and measures latency '
+    'across services so that regressions are caught before they reach users in production'
+).split()
+
+###############################################################################
+# Fake Models
+###############################################################################
+# Deterministic stand-in for the embeddings model: hashed character trigrams of a text,
+# or hashed token bigrams when the client sends token ids
+def fake_embedding(text):
+    vector = np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32)
+    if isinstance(text, str):
+        text = f' {text.lower()} '
+        features = [text[i:i + 3].encode('utf-8') for i in range(len(text) - 2)]
+    else:
+        features = [f'{a}:{b}'.encode('utf-8') for a, b in zip(text, text[1:])] or [str(text).encode('utf-8')]
+    for feature in features:
+        digest = hashlib.blake2b(feature, digest_size=4).digest()
+        vector[int.from_bytes(digest, 'little') % EMBEDDING_DIMENSIONS] += 1.0
+    return vector.tolist()
+
+# Answer tokens (word pieces with their leading space, like a real tokenizer)
+def answer_tokens(count: int):
+    return [('' if i == 0 else ' ') + ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(count)]
+
+###############################################################################
+# Handlers
+###############################################################################
+# Chat completions: streamed as server-sent events when requested
+async def chat_completions(request: web.Request):
+    options = request.app['options']
+    body = await request.json()
+    completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+    created = int(time.time())
+    tokens = answer_tokens(options.response_tokens)
+
+    # Builds one streamed chunk
+    def chunk(delta: dict, finish_reason: str = None):
+        return {
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': body.get('model') or request.match_info['deployment'],
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+        }
+
+    await asyncio.sleep(options.ttft_ms / 1000)
+    if not body.get('stream'):
+        await asyncio.sleep(len(tokens) / options.tokens_per_second)
+        return web.json_response({
+            'id': completion_id,
+            'object': 'chat.completion',
+            'created': created,
+            'model': body.get('model') or request.match_info['deployment'],
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': ''.join(tokens)}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': len(tokens), 'total_tokens': len(tokens)},
+        })
+
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+    await response.prepare(request)
+    await response.write(f"data: {json.dumps(chunk({'role': 'assistant', 'content': ''}))}\n\n".encode('utf-8'))
+    for i, token in enumerate(tokens):
+        if i:
+            await asyncio.sleep(1 / options.tokens_per_second)
+        await response.write(f"data: {json.dumps(chunk({'content': token}))}\n\n".encode('utf-8'))
+    await response.write(f"data: {json.dumps(chunk({}, 'stop'))}\n\n".encode('utf-8'))
+    await response.write(b'data: [DONE]\n\n')
+    await response.write_eof()
+    return response
+
+# Embeddings (float lists, or base64 float32 as the OpenAI SDK requests by default)
+async def embeddings(request: web.Request):
+    options = request.app['options']
+    body = await request.json()
+    inputs = body['input']
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+
+    await asyncio.sleep(options.embedding_ms / 1000)
+    if random.random() < options.throttle_rate:
+        return web.json_response(
+            {'error': {'code': '429', 'message': 'Requests to the Embeddings API have exceeded the rate limit.'}},
+            status=429,
+            headers={'retry-after': str(options.retry_after_ms / 1000), 'retry-after-ms': str(int(options.retry_after_ms))}
+        )
+    data = []
+    for i, text in enumerate(inputs):
+        vector = fake_embedding(text)
+        if body.get('encoding_format') == 'base64':
+            vector = base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode('ascii')
+        data.append({'object': 'embedding', 'index': i, 'embedding': vector})
+    return web.json_response({
+        'object': 'list',
+        'data': data,
+        'model': body.get('model') or request.match_info['deployment'],
+        'usage': {'prompt_tokens': 0, 'total_tokens': 0},
+    })
+
+###############################################################################
+# Entrypoint
+###############################################################################
+# Builds the stub server (Azure OpenAI deployment routes)
+def build_app(options):
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app['options'] = options
+    app.router.add_post('/openai/deployments/{deployment}/chat/completions', chat_completions)
+    app.router.add_post('/openai/deployments/{deployment}/embeddings', embeddings)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI-compatible chat & embeddings stub.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8701)
+    parser.add_argument('--ttft-ms', type=float, default=300, help='Delay before the first streamed token')
+    parser.add_argument('--tokens-per-second', type=float, default=50, help='Streaming rate after the first token')
+    parser.add_argument('--response-tokens', type=int, default=60, help='Tokens per answer')
+    parser.add_argument('--embedding-ms', type=float, default=20, help='Latency of an embeddings call')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='Share of embeddings calls answered 429')
+    parser.add_argument('--retry-after-ms', type=float, default=200, help='Retry-After sent with a 429')
+    options = parser.parse_args()
+    web.run_app(build_app(options), host=options.host, port=options.port, print=None, access_log=None)
+
+if __name__ == '__main__':
+    main()
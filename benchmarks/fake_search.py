@@ -0,0 +1,135 @@
+# Azure AI Search stand-in for the TTFT & ingestion benchmarks: answers the index lookup the
+# langchain AzureSearch vector store makes when it is built, vector/keyword document searches
+# with fixed results, and document uploads. Nothing is stored. The Search SDK only talks to https endpoints, so the stub
+# serves TLS with a self-signed certificate (see write_self_signed_cert).
+#
+# Usage (from the repo root):
+#   python -m benchmarks.fake_search --certfile cert.pem --keyfile key.pem [--port 8702] [--search-ms 15]
+
+# Imports
+import os
+import re
+import ssl
+import json
+import asyncio
+import argparse
+import datetime
+import ipaddress
+from aiohttp import web
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+# Fields of every fake index (the app's and langchain's schema)
+INDEX_FIELDS = [
+    {'name': 'id', 'type': 'Edm.String', 'key': True, 'filterable': True},
+    {'name': 'content', 'type': 'Edm.String', 'searchable': True},
+    {'name': 'content_vector', 'type': 'Collection(Edm.Single)', 'searchable': True, 'dimensions': 1536},
+    {'name': 'metadata', 'type': 'Edm.String', 'searchable': True},
+]
+
+INDEX_PATH = re.compile(r"^/indexes(?:\('([^']+)'\)|/([^/]+))$")
+SEARCH_PATH = re.compile(r"^/indexes(?:\('([^']+)'\)|/([^/]+))/docs/search\.post\.search$")
+INDEX_DOCS_PATH = re.compile(r"^/indexes(?:\('([^']+)'\)|/([^/]+))/docs/search\.index$")
+
+###############################################################################
+# TLS
+###############################################################################
+# Writes a self-signed certificate for 127.0.0.1/localhost; returns (cert path, key path)
+# (clients trust it through SSL_CERT_FILE / REQUESTS_CA_BUNDLE)
+def write_self_signed_cert(directory: str):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([
+            x509.DNSName('localhost'), x509.IPAddress(ipaddress.ip_address('127.0.0.1'))
+        ]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = os.path.join(directory, 'search-cert.pem'), os.path.join(directory, 'search-key.pem')
+    with open(cert_path, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return cert_path, key_path
+
+###############################################################################
+# Handlers
+###############################################################################
+# Index definition (GET /indexes('name'))
+async def get_index(request: web.Request, index_name: str):
+    return web.json_response({'name': index_name, 'fields': INDEX_FIELDS})
+
+# Document search: the same k chunks for every query
+async def search(request: web.Request, index_name: str):
+    options = request.app['options']
+    body = await request.json()
+    await asyncio.sleep(options.search_ms / 1000)
+    return web.json_response({
+        'value': [
+            {
+                '@search.score': 1.0 / (i + 1),
+                'id': f'{index_name}-{i}',
+                'content': f'Chunk {i} of the fixture documents about release planning and latency budgets.',
+                'metadata': json.dumps({'file_name': f'fixture-{i}.txt', 'container': index_name}),
+            }
+            for i in range(int(body.get('top') or 3))
+        ]
+    })
+
+# Document upload/delete batch: every action succeeds (the documents are discarded)
+async def index_documents(request: web.Request, index_name: str):
+    body = await request.json()
+    return web.json_response({
+        'value': [
+            {'key': action.get('id'), 'status': True, 'errorMessage': None, 'statusCode': 201}
+            for action in body.get('value', [])
+        ]
+    })
+
+# Routes by path (index names may be addressed as /indexes('name') or /indexes/name)
+async def dispatch(request: web.Request):
+    match = SEARCH_PATH.match(request.path)
+    if match and request.method == 'POST':
+        return await search(request, match.group(1) or match.group(2))
+    match = INDEX_DOCS_PATH.match(request.path)
+    if match and request.method == 'POST':
+        return await index_documents(request, match.group(1) or match.group(2))
+    match = INDEX_PATH.match(request.path)
+    if match and request.method == 'GET':
+        return await get_index(request, match.group(1) or match.group(2))
+    return web.json_response({'error': {'code': 'NotFound', 'message': request.path}}, status=404)
+
+###############################################################################
+# Entrypoint
+###############################################################################
+def build_app(options):
+    app = web.Application(client_max_size=64 * 1024 * 1024)  # document upload batches carry vectors
+    app['options'] = options
+    app.router.add_route('*', '/{tail:.*}', dispatch)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description='Azure AI Search stub.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8702)
+    parser.add_argument('--search-ms', type=float, default=15, help='Latency of a search call')
+    parser.add_argument('--certfile', required=True, help='TLS certificate (see write_self_signed_cert)')
+    parser.add_argument('--keyfile', required=True, help='TLS private key')
+    options = parser.parse_args()
+    ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ssl_context.load_cert_chain(options.certfile, options.keyfile)
+    web.run_app(build_app(options), host=options.host, port=options.port, ssl_context=ssl_context, print=None, access_log=None)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+# In-process stand-ins for Cosmos DB and Blob Storage used by the load benchmark.
+# State lives in a directory shared by all gunicorn workers (SQLite items, plain blob files),
+# so a user registered by one worker can log in through another.
+# install_fakes() swaps them in at the client registry (services/clients.py) and must run
+# before any other app module is imported.
+
+# Imports
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.cosmos.exceptions import (
+    CosmosResourceExistsError,
+    CosmosResourceNotFoundError,
+    CosmosAccessConditionFailedError,
+)
+
+###############################################################################
+# Fake Cosmos DB
+###############################################################################
+# Items of every container, keyed by (container, partition key, id)
+class FakeCosmosStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            'container TEXT NOT NULL, pk TEXT NOT NULL, id TEXT NOT NULL, body TEXT NOT NULL, '
+            'PRIMARY KEY (container, pk, id))'
+        )
+
+    # One connection per thread
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    # Runs fn(conn) in one write transaction
+    def transaction(self, fn):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            result = fn(conn)
+            conn.execute('COMMIT')
+            return result
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def read(self, conn, container: str, pk: str, item_id: str):
+        row = conn.execute(
+            'SELECT body FROM items WHERE container = ? AND pk = ? AND id = ?', (container, pk, item_id)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def write(self, conn, container: str, body: dict):
+        body = dict(body, _etag=uuid.uuid4().hex, _ts=int(time.time()))
+        conn.execute(
+            'INSERT OR REPLACE INTO items (container, pk, id, body) VALUES (?, ?, ?, ?)',
+            (container, str(body['UserId']), body['id'], json.dumps(body))
+        )
+        return body
+
+    def partition(self, container: str, pk: str):
+        rows = self._conn().execute(
+            'SELECT body FROM items WHERE container = ? AND pk = ? ORDER BY rowid', (container, pk)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+# Python implementations of the (few) queries the app sends, keyed by query text
+def _query_handlers():
+    from dependencies import INDEX_NAME_QUERY, MAPPING_TYPE
+    from routers.chat_history import LAST_TURNS_QUERY, CHAT_HEADERS_QUERY, CHAT_TURNS_QUERY
+
+    def last_turns(items, params):
+        turns = sorted(
+            (item for item in items if item.get('type') == 'turn' and item.get('ChatId') == params['@chat_id']),
+            key=lambda item: item['timestamp'], reverse=True
+        )
+        return [
+            {key: turn.get(key) for key in ('human', 'ai', 'timestamp', 'human_tokens', 'ai_tokens')}
+            for turn in turns[:params['@n']]
+        ]
+
+    def chat_headers(items, params):
+        chats = [item for item in items if item.get('type', 'chat') == 'chat']
+        return sorted(chats, key=lambda item: item['_ts'], reverse=True)
+
+    def chat_turns(items, params):
+        turns = sorted(
+            (item for item in items if item.get('type') == 'turn' and item.get('ChatId') in params['@chat_ids']),
+            key=lambda item: item['timestamp']
+        )
+        return [{key: turn.get(key) for key in ('ChatId', 'human', 'ai', 'timestamp')} for turn in turns]
+
+    return {
+        INDEX_NAME_QUERY: lambda items, params: [
+            {'id': item['id']} for item in items if item.get('type', MAPPING_TYPE) == MAPPING_TYPE
+        ][:1],
+        LAST_TURNS_QUERY: last_turns,
+        CHAT_HEADERS_QUERY: chat_headers,
+        CHAT_TURNS_QUERY: chat_turns,
+        'SELECT TOP 10 * FROM c': lambda items, params: items[:10],
+        'SELECT VALUE COUNT(1) FROM c': lambda items, params: [len(items)],
+    }
+
+# Container proxy with the sync Cosmos SDK's item methods
+class FakeContainer:
+    def __init__(self, store: FakeCosmosStore, name: str):
+        self.store = store
+        self.name = name
+        self._handlers = None
+
+    def read_item(self, item, partition_key, **kwargs):
+        body = self.store.read(self.store._conn(), self.name, str(partition_key), item)
+        if body is None:
+            raise CosmosResourceNotFoundError(status_code=404, message=f'{self.name}/{item} not found')
+        return body
+
+    def create_item(self, body: dict, **kwargs):
+        def create(conn):
+            if self.store.read(conn, self.name, str(body['UserId']), body['id']) is not None:
+                raise CosmosResourceExistsError(status_code=409, message=f"{self.name}/{body['id']} exists")
+            return self.store.write(conn, self.name, body)
+        return self.store.transaction(create)
+
+    def upsert_item(self, body: dict, **kwargs):
+        return self.store.transaction(lambda conn: self.store.write(conn, self.name, body))
+
+    def replace_item(self, item, body: dict, **kwargs):
+        self.read_item(item, body['UserId'])
+        return self.upsert_item(body)
+
+    def delete_item(self, item, partition_key, etag: str = None, match_condition=None, **kwargs):
+        item_id = item['id'] if isinstance(item, dict) else item
+
+        def delete(conn):
+            current = self.store.read(conn, self.name, str(partition_key), item_id)
+            if current is None:
+                raise CosmosResourceNotFoundError(status_code=404, message=f'{self.name}/{item_id} not found')
+            if etag is not None and current['_etag'] != etag:
+                raise CosmosAccessConditionFailedError(status_code=412, message=f'{self.name}/{item_id} changed')
+            conn.execute(
+                'DELETE FROM items WHERE container = ? AND pk = ? AND id = ?', (self.name, str(partition_key), item_id)
+            )
+        self.store.transaction(delete)
+
+    # Single-partition queries the app is known to send
+    def query_items(self, query: str, parameters: list = None, partition_key=None, **kwargs):
+        if self._handlers is None:
+            self._handlers = _query_handlers()
+        handler = self._handlers.get(query)
+        if handler is None or partition_key is None:
+            raise NotImplementedError(f'Fake Cosmos does not support this query: {query}')
+        params = {param['name']: param['value'] for param in parameters or []}
+        return iter(handler(self.store.partition(self.name, str(partition_key)), params))
+
+    # Transactional batch of upsert/create/patch operations (patch supports set & incr)
+    def execute_item_batch(self, batch_operations: list, partition_key, **kwargs):
+        def execute(conn):
+            results = []
+            for operation, args in batch_operations:
+                if operation == 'upsert':
+                    results.append(self.store.write(conn, self.name, args[0]))
+                elif operation == 'create':
+                    if self.store.read(conn, self.name, str(partition_key), args[0]['id']) is not None:
+                        raise CosmosResourceExistsError(status_code=409, message=f"{self.name}/{args[0]['id']} exists")
+                    results.append(self.store.write(conn, self.name, args[0]))
+                elif operation == 'patch':
+                    body = self.store.read(conn, self.name, str(partition_key), args[0])
+                    if body is None:
+                        raise CosmosResourceNotFoundError(status_code=404, message=f'{self.name}/{args[0]} not found')
+                    for patch in args[1]:
+                        field = patch['path'].lstrip('/')
+                        body[field] = body.get(field, 0) + patch['value'] if patch['op'] == 'incr' else patch['value']
+                    results.append(self.store.write(conn, self.name, body))
+                else:
+                    raise NotImplementedError(f'Fake Cosmos does not support batch operation: {operation}')
+            return results
+        return self.store.transaction(execute)
+
+# Same container with the async SDK's method shapes (query_items returns an async iterable)
+class FakeAsyncContainer:
+    def __init__(self, container: FakeContainer):
+        self.container = container
+
+    async def read_item(self, *args, **kwargs):
+        return self.container.read_item(*args, **kwargs)
+
+    async def create_item(self, *args, **kwargs):
+        return self.container.create_item(*args, **kwargs)
+
+    async def upsert_item(self, *args, **kwargs):
+        return self.container.upsert_item(*args, **kwargs)
+
+    async def delete_item(self, *args, **kwargs):
+        return self.container.delete_item(*args, **kwargs)
+
+    async def execute_item_batch(self, *args, **kwargs):
+        return self.container.execute_item_batch(*args, **kwargs)
+
+    def query_items(self, *args, **kwargs):
+        async def iterate():
+            for item in self.container.query_items(*args, **kwargs):
+                yield item
+        return iterate()
+
+###############################################################################
+# Fake Blob Storage
+###############################################################################
+# Blob contents as read back by download_blob()
+class FakeDownload:
+    def __init__(self, path: str):
+        self.path = path
+
+    def readall(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+class FakeBlobClient:
+    def __init__(self, path: str):
+        self.path = path
+
+    def upload_blob(self, data, length: int = None, overwrite: bool = False, **kwargs):
+        if os.path.exists(self.path) and not overwrite:
+            raise ResourceExistsError(f'Blob exists: {self.path}')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f'{self.path}.tmp', 'wb') as f:
+            if isinstance(data, (bytes, str)):
+                f.write(data.encode('utf-8') if isinstance(data, str) else data)
+            else:
+                shutil.copyfileobj(data, f, 1024 * 1024)
+        os.replace(f'{self.path}.tmp', self.path)
+
+    def download_blob(self, **kwargs):
+        if not os.path.exists(self.path):
+            raise ResourceNotFoundError(f'Blob not found: {self.path}')
+        return FakeDownload(self.path)
+
+class FakeContainerClient:
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def get_blob_client(self, blob: str):
+        if not os.path.isdir(self.directory):
+            raise ResourceNotFoundError(f'Container not found: {self.directory}')
+        return FakeBlobClient(os.path.join(self.directory, blob))
+
+class FakeBlobServiceClient:
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def create_container(self, name: str, **kwargs):
+        try:
+            os.mkdir(os.path.join(self.directory, name))
+        except FileExistsError:
+            error = ResourceExistsError(f'Container exists: {name}')
+            error.status_code = 409
+            error.error_code = 'ContainerAlreadyExists'
+            raise error
+
+    def delete_container(self, name: str, **kwargs):
+        if not os.path.isdir(os.path.join(self.directory, name)):
+            raise ResourceNotFoundError(f'Container not found: {name}')
+        shutil.rmtree(os.path.join(self.directory, name))
+
+    def get_container_client(self, name: str):
+        return FakeContainerClient(os.path.join(self.directory, name))
+
+    def close(self):
+        pass
+
+###############################################################################
+# Installation
+###############################################################################
+# Replaces the Cosmos & Blob clients of services/clients.py with fakes stored under directory
+def install_fakes(directory: str):
+    import services.clients as clients
+
+    os.makedirs(directory, exist_ok=True)
+    store = FakeCosmosStore(os.path.join(directory, 'cosmos.sqlite'))
+    blob_service = FakeBlobServiceClient(os.path.join(directory, 'blobs'))
+    containers = {}
+
+    def get_container(name: str):
+        if name not in containers:
+            containers[name] = FakeContainer(store, name)
+        return containers[name]
+
+    clients.get_cosmos_client = lambda: store
+    clients.get_cosmos_database = lambda database_name=None: store
+    clients.get_cosmos_container = get_container
+    clients.get_async_cosmos_client = lambda: store
+    clients.get_async_cosmos_container = lambda name: FakeAsyncContainer(get_container(name))
+    clients.get_blob_service_client = lambda: blob_service
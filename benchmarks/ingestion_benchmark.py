@@ -0,0 +1,227 @@
+# Chunks per second of the ingestion engine (embed_and_index_documents) on a large fixture
+# document, against the local embeddings stub (benchmarks/fake_openai.py) and the local
+# vector store. Compares one embeddings call at a time with the batched, concurrent engine,
+# with and without injected 429s.
+# Then the peak RSS of one whole upload (spool, hash, extract, chunk, embed, index, blob
+# upload, manifest) for a few file sizes, each in a fresh interpreter after a warm-up upload,
+# against the embeddings stub, the AI Search stub (benchmarks/fake_search.py) and the fake
+# Blob Storage (benchmarks/fakes.py). The RSS growth should not depend on the file size.
+#
+# Usage (from the repo root, Linux):
+#   python -m benchmarks.ingestion_benchmark [--size-mb 2] [--throttle-rate 0.1] [--embedding-ms 20] [--rss-sizes-mb 1,4,16]
+
+# Imports
+import os
+import sys
+import json
+import time
+import asyncio
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.load_benchmark import free_port, wait_until_up, make_document, REPO_DIR
+from benchmarks.extraction_benchmark import peak_rss_mib
+from benchmarks.fake_search import write_self_signed_cert
+
+BENCH_DIR = tempfile.mkdtemp(prefix='ingestion-benchmark-')
+
+# Settings the app reads at import time (the engine talks to the stub started below)
+for name, value in {
+    'AZURE_OPENAI_ENDPOINT': 'http://127.0.0.1:8701',
+    'AZURE_OPENAI_API_KEY': 'benchmark-key',
+    'AZURE_OPENAI_API_VERSION': '2024-02-01',
+    'AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME': 'embeddings',
+    'AZURE_SEARCH_ADMIN_KEY': 'benchmark-key',
+    'VECTOR_STORE_BACKEND': 'local',
+    'LOCAL_VECTOR_DIR': os.path.join(BENCH_DIR, 'vector_indexes'),
+    'INGESTION_JOB_DIR': os.path.join(BENCH_DIR, 'ingestion_jobs'),
+    'METRICS_DIR': os.path.join(BENCH_DIR, 'metrics'),
+    'OPENAI_RATE_LIMIT_PATH': os.path.join(BENCH_DIR, 'openai_rate_limit.bin'),
+}.items():
+    os.environ.setdefault(name, value)
+
+# In-App Dependencies (fake Blob Storage first, so every module binds the fake client)
+from benchmarks.fakes import install_fakes
+install_fakes(os.path.join(BENCH_DIR, 'fakes'))
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+import services.ingestion as ingestion
+from services.clients import close_async_clients, get_blob_service_client
+from services.concurrency import run_blocking
+from services.jobs import init_job_store, new_spool_path
+from services.vector_store import get_vector_store
+from routers.ai_search import iter_documents, spool_upload, process_uploaded_file
+
+# Engine configurations compared: (embedding batch size, batches in flight)
+CONFIGS = {
+    'sequential': (16, 1),
+    'concurrent': (ingestion.EMBEDDING_BATCH_SIZE, ingestion.EMBEDDING_MAX_CONCURRENCY),
+}
+
+###############################################################################
+# Helper Functions
+###############################################################################
+# Splits the fixture into Documents the way an upload is split
+def chunk_fixture(size_mb: float):
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=50, length_function=len, is_separator_regex=False)
+    metadata = {'source': '/benchmark/fixture.txt', 'container': 'benchmark', 'file_name': 'fixture.txt'}
+    text = make_document('ingestion-benchmark', int(size_mb * 1024)).decode('utf-8')
+    return list(iter_documents(text.splitlines(keepends=True), text_splitter, metadata))
+
+# Starts an embeddings stub; returns (process, base url)
+def start_stub(args, throttle_rate: float):
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, '-m', 'benchmarks.fake_openai', '--port', str(port),
+        '--embedding-ms', str(args.embedding_ms), '--throttle-rate', str(throttle_rate),
+        '--retry-after-ms', str(args.retry_after_ms)
+    ], cwd=REPO_DIR)
+    return process, f'http://127.0.0.1:{port}'
+
+# Indexes the documents with one engine configuration; returns (chunks indexed, seconds)
+async def run_config(documents: list, base_url: str, batch_size: int, concurrency: int, run_id: str):
+    os.environ['AZURE_OPENAI_ENDPOINT'] = base_url
+    ingestion.EMBEDDING_BATCH_SIZE = batch_size
+    ingestion.EMBEDDING_MAX_CONCURRENCY = concurrency
+    await close_async_clients()  # embeddings clients bind the endpoint when built
+
+    index_name = f'ingestion-benchmark-{run_id}'
+    await run_blocking(get_vector_store().create_index, index_name)
+    start = time.perf_counter()
+    indexed = await ingestion.embed_and_index_documents(documents, index_name)
+    return indexed, time.perf_counter() - start
+
+# Writes a text fixture of about size_mb; returns its path
+def write_fixture(size_mb: float, name: str):
+    path = os.path.join(BENCH_DIR, name)
+    with open(path, 'wb') as f:
+        f.write(make_document(name, int(size_mb * 1024)))
+    return path
+
+###############################################################################
+# Upload RSS (run in a child interpreter)
+###############################################################################
+# Spools a file the way upload_files does and ingests it with process_uploaded_file
+async def upload(path: str, index_name: str):
+    async def progress(stage: str = None, chunks: int = None):
+        pass
+
+    file_name = os.path.basename(path)
+    spool_path = new_spool_path(file_name)
+    try:
+        with open(path, 'rb') as source:
+            await run_blocking(spool_upload, source, spool_path)
+        return await process_uploaded_file('benchmark@example.com', index_name, file_name, spool_path, progress)
+    finally:
+        os.remove(spool_path)
+
+# Uploads a warm-up file (clients, tokenizer, lazy imports) then the fixture; returns measurements
+async def measure_upload(path: str):
+    index_name = 'ingestion-benchmark-rss'
+    await run_blocking(init_job_store)
+    await run_blocking(get_blob_service_client().create_container, index_name)
+    try:
+        await upload(write_fixture(0.25, 'warmup.txt'), index_name)
+        rss_before = peak_rss_mib()
+        start = time.perf_counter()
+        chunks = await upload(path, index_name)
+        return {'chunks': chunks, 'wall_s': time.perf_counter() - start, 'rss_before_mib': rss_before, 'rss_peak_mib': peak_rss_mib()}
+    finally:
+        await close_async_clients()
+
+# Runs one upload in a fresh interpreter (Azure AI Search backend on the stub) and returns its measurements
+def run_rss_child(path: str, env: dict):
+    command = [sys.executable, '-m', 'benchmarks.ingestion_benchmark', '--child-rss', path]
+    output = subprocess.run(command, cwd=REPO_DIR, env=env, check=True, stdout=subprocess.PIPE, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+# Peak RSS of one upload per file size
+async def run_rss(args, openai_url: str):
+    search_port = free_port()
+    cert_path, key_path = write_self_signed_cert(BENCH_DIR)
+    search = subprocess.Popen([
+        sys.executable, '-m', 'benchmarks.fake_search', '--port', str(search_port), '--search-ms', '0',
+        '--certfile', cert_path, '--keyfile', key_path
+    ], cwd=REPO_DIR)
+    os.environ['SSL_CERT_FILE'] = cert_path  # trust the stub's certificate (here and in the children)
+    env = dict(
+        os.environ,
+        AZURE_OPENAI_ENDPOINT=openai_url,
+        VECTOR_STORE_BACKEND='azure',
+        AZURE_SEARCH_SERVICE_ENDPOINT=f'https://127.0.0.1:{search_port}',
+    )
+    try:
+        await wait_until_up(f'https://127.0.0.1:{search_port}/indexes')
+        print()
+        print(f"{'upload MB':<11}{'chunks':>8}{'seconds':>9}{'rss peak MiB':>14}{'rss +MiB':>10}")
+        for size_mb in args.rss_sizes_mb:
+            path = write_fixture(size_mb, f'upload-{size_mb:g}mb.txt')
+            result = await asyncio.to_thread(run_rss_child, path, env)
+            os.remove(path)
+            print(
+                f"{size_mb:<11g}{result['chunks']:>8}{result['wall_s']:>9.2f}{result['rss_peak_mib']:>14.1f}"
+                f"{result['rss_peak_mib'] - result['rss_before_mib']:>10.1f}"
+            )
+    finally:
+        search.terminate()
+        search.wait(timeout=30)
+
+###############################################################################
+# Benchmark
+###############################################################################
+async def run(args):
+    documents = chunk_fixture(args.size_mb)
+    print(f'fixture: {args.size_mb} MB, {len(documents)} chunks; stub {args.embedding_ms:.0f} ms per embeddings call')
+
+    stubs = {0.0: start_stub(args, 0.0), args.throttle_rate: start_stub(args, args.throttle_rate)}
+    try:
+        for _, base_url in stubs.values():
+            await wait_until_up(f'{base_url}/openai/deployments/embeddings/embeddings')
+
+        print(f"{'config':<12}{'batch':>7}{'in flight':>11}{'429 rate':>10}{'chunks':>8}{'seconds':>9}{'chunks/s':>10}")
+        for throttle_rate, (_, base_url) in stubs.items():
+            for config, (batch_size, concurrency) in CONFIGS.items():
+                indexed, seconds = await run_config(
+                    documents, base_url, batch_size, concurrency, f'{config}-{int(throttle_rate * 100)}'
+                )
+                print(
+                    f'{config:<12}{batch_size:>7}{concurrency:>11}{throttle_rate:>10.2f}'
+                    f'{indexed:>8}{seconds:>9.2f}{indexed / seconds:>10.1f}'
+                )
+
+        if args.rss_sizes_mb:
+            await run_rss(args, stubs[0.0][1])
+    finally:
+        await close_async_clients()
+        for process, _ in stubs.values():
+            process.terminate()
+            process.wait(timeout=30)
+        shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+###############################################################################
+# Entrypoint
+###############################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Ingestion chunks/s against a local embeddings stub.')
+    parser.add_argument('--size-mb', type=float, default=2, help='Size of the fixture document')
+    parser.add_argument('--embedding-ms', type=float, default=20, help='Latency of an embeddings call')
+    parser.add_argument('--throttle-rate', type=float, default=0.1, help='Share of embeddings calls answered 429 in the throttled runs')
+    parser.add_argument('--retry-after-ms', type=float, default=200, help='Retry-After sent with a 429')
+    parser.add_argument(
+        '--rss-sizes-mb', type=lambda value: [float(size) for size in value.split(',') if size], default=[1, 4, 16],
+        help='Comma-separated upload sizes for the peak RSS runs (empty to skip)'
+    )
+    parser.add_argument('--child-rss', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child_rss:
+        try:
+            print(json.dumps(asyncio.run(measure_upload(args.child_rss))))
+        finally:
+            shutil.rmtree(BENCH_DIR, ignore_errors=True)
+    else:
+        asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+# Offline load test: starts the app under gunicorn against local stand-ins (fake Cosmos &
+# Blob, local vector store, OpenAI-compatible streaming stub) and replays a recorded workload
+# of registrations, logins, uploads and concurrent WebSocket chats.
+# Reports time to first token, upload throughput, sockets and RSS per worker; exits non-zero
+# when a --max-* limit is exceeded, so it can gate CI.
+#
+# Usage (from the repo root, Linux):
+#   python -m benchmarks.load_benchmark [--workload benchmarks/fixtures/load_workload.jsonl]
+#       [--workers 2] [--speed 1] [--ttft-ms 300] [--tokens-per-second 50] [--json report.json]
+#       [--max-ttft-p95-ms 1500] [--min-upload-mbps 1]
+
+# Imports
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+import aiohttp
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Words the uploaded documents are made of (the workload's queries are about these topics)
+DOCUMENT_WORDS = (
+    'release planning review latency budget regression dashboard incident rollback deploy '
+    'capacity forecast quarterly roadmap customer onboarding invoice contract renewal '
+    'security audit encryption retention policy backup restore migration schema index '
+    'search embedding vector prompt answer upload storage throughput worker queue'
+).split()
+
+###############################################################################
+# Helper Functions
+###############################################################################
+# Reads a jsonl workload
+def load_workload(path: str):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# Returns a free local TCP port
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+# Deterministic text document of about size_kb kilobytes
+def make_document(seed: str, size_kb: int):
+    rng = random.Random(seed)
+    sentences = []
+    size = 0
+    while size < size_kb * 1024:
+        sentence = ' '.join(rng.choice(DOCUMENT_WORDS) for _ in range(rng.randint(8, 20))).capitalize() + '.'
+        sentences.append(sentence)
+        size += len(sentence) + 1
+    return '\n'.join(sentences).encode('utf-8')
+
+# Waits until a URL answers
+async def wait_until_up(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status < 500:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f'{url} did not come up within {timeout}s')
+
+# Percentile in milliseconds (None when there are no samples)
+def percentile_ms(samples: list, q: float):
+    return round(float(np.percentile(samples, q)) * 1000, 1) if samples else None
+
+###############################################################################
+# Worker Sampling (Linux /proc)
+###############################################################################
+# Pids of the gunicorn master's workers
+def worker_pids(master_pid: int):
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                if int(f.read().rsplit(')', 1)[1].split()[1]) == master_pid:
+                    pids.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return pids
+
+# Open sockets & resident memory (bytes) of a process
+def process_usage(pid: int):
+    sockets = 0
+    try:
+        for fd in os.listdir(f'/proc/{pid}/fd'):
+            try:
+                if os.readlink(f'/proc/{pid}/fd/{fd}').startswith('socket:'):
+                    sockets += 1
+            except OSError:
+                continue
+        with open(f'/proc/{pid}/status') as f:
+            rss = next(int(line.split()[1]) * 1024 for line in f if line.startswith('VmRSS:'))
+    except (OSError, StopIteration):
+        return None
+    return sockets, rss
+
+# Samples every worker until cancelled; samples: {pid: [(sockets, rss)]}
+async def sample_workers(master_pid: int, samples: dict, interval: float = 0.5):
+    while True:
+        for pid in worker_pids(master_pid):
+            usage = process_usage(pid)
+            if usage:
+                samples.setdefault(pid, []).append(usage)
+        await asyncio.sleep(interval)
+
+###############################################################################
+# Workload Replay
+###############################################################################
+# Replays one user's events in order (each event starts no earlier than its 'at' offset)
+async def replay_user(session: aiohttp.ClientSession, base_url: str, events: list, started_at: float, speed: float, results: dict):
+    jwt = None
+    email = events[0]['user']
+    websocket = None
+    try:
+        for event in events:
+            delay = started_at + event['at'] / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            op = event['op']
+            start = time.monotonic()
+            try:
+                if op == 'register':
+                    async with session.post(f'{base_url}/auth/register', json={'email': email, 'password_hash': 'benchmark'}) as response:
+                        body = await response.json()
+                    if body.get('status') != 201:
+                        raise RuntimeError(body.get('detail'))
+                    results['register'].append(time.monotonic() - start)
+
+                elif op == 'login':
+                    async with session.post(f'{base_url}/auth/login', json={'email': email, 'password_hash': 'benchmark'}) as response:
+                        body = await response.json()
+                    if 'jwt' not in body:
+                        raise RuntimeError(body.get('detail'))
+                    jwt = f"Bearer {body['jwt']}"
+                    results['login'].append(time.monotonic() - start)
+
+                elif op == 'upload':
+                    data = make_document(f"{email}/{event['file']}", event['size_kb'])
+                    form = aiohttp.FormData()
+                    form.add_field('files', data, filename=event['file'], content_type='text/plain')
+                    async with session.post(f'{base_url}/upload_files', data=form, headers={'Authorization': jwt}) as response:
+                        job_id = (await response.json())['job_id']
+                    while True:
+                        async with session.get(f'{base_url}/upload_jobs/{job_id}', headers={'Authorization': jwt}) as response:
+                            job = (await response.json())['job']
+                        if job['status'] in ('completed', 'failed', 'completed_with_errors'):
+                            break
+                        await asyncio.sleep(0.1)
+                    if job['status'] != 'completed':
+                        raise RuntimeError(f"upload {job['status']}: {[file['error'] for file in job['files']]}")
+                    results['upload'].append((len(data), time.monotonic() - start))
+
+                elif op == 'chat':
+                    if websocket is None:
+                        websocket = await session.ws_connect(f"{base_url.replace('http', 'ws', 1)}/ws", headers={'Authorization': jwt})
+                    await websocket.send_json({'query': event['query'], 'chatId': event['chat_id'], 'email': email})
+                    first_frame = None
+                    while True:
+                        frame = await websocket.receive_str()
+                        if frame.startswith('<<E:'):
+                            raise RuntimeError(frame)
+                        if frame == '<<END>>':
+                            break
+                        if first_frame is None:
+                            first_frame = time.monotonic()
+                    results['ttft'].append(first_frame - start if first_frame else time.monotonic() - start)
+                    results['chat'].append(time.monotonic() - start)
+
+                else:
+                    raise ValueError(f'Unknown workload op: {op}')
+
+            except Exception as e:
+                results['errors'].append(f'{op} <{email}>: {e}')
+                if op in ('register', 'login'):
+                    return
+    finally:
+        if websocket is not None:
+            await websocket.close()
+
+# Replays the whole workload (users run concurrently); returns the raw results
+async def replay(base_url: str, workload: list, speed: float):
+    users = {}
+    for event in sorted(workload, key=lambda event: event['at']):
+        users.setdefault(event['user'], []).append(event)
+
+    results = {'register': [], 'login': [], 'upload': [], 'chat': [], 'ttft': [], 'errors': []}
+    started_at = time.monotonic()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0), timeout=aiohttp.ClientTimeout(total=300)) as session:
+        await asyncio.gather(*(
+            replay_user(session, base_url, events, started_at, speed, results)
+            for events in users.values()
+        ))
+    results['wall_seconds'] = time.monotonic() - started_at
+    return results
+
+###############################################################################
+# Report
+###############################################################################
+def build_report(results: dict, samples: dict, args):
+    upload_bytes = sum(size for size, _ in results['upload'])
+    upload_seconds = sum(seconds for _, seconds in results['upload'])
+    return {
+        'config': {'workers': args.workers, 'speed': args.speed, 'ttft_ms': args.ttft_ms, 'tokens_per_second': args.tokens_per_second},
+        'wall_seconds': round(results['wall_seconds'], 2),
+        'errors': results['errors'],
+        'register': {'count': len(results['register']), 'p50_ms': percentile_ms(results['register'], 50), 'p95_ms': percentile_ms(results['register'], 95)},
+        'login': {'count': len(results['login']), 'p50_ms': percentile_ms(results['login'], 50), 'p95_ms': percentile_ms(results['login'], 95)},
+        'chat': {
+            'count': len(results['chat']),
+            'ttft_p50_ms': percentile_ms(results['ttft'], 50),
+            'ttft_p95_ms': percentile_ms(results['ttft'], 95),
+            'ttft_p99_ms': percentile_ms(results['ttft'], 99),
+            'total_p50_ms': percentile_ms(results['chat'], 50),
+        },
+        'upload': {
+            'count': len(results['upload']),
+            'mb': round(upload_bytes / 1e6, 2),
+            # Bytes over the summed per-upload time (upload + ingestion until the job finished)
+            'mb_per_second': round(upload_bytes / 1e6 / upload_seconds, 3) if upload_seconds else None,
+        },
+        'workers': {
+            str(pid): {
+                'max_sockets': max(sockets for sockets, _ in usage),
+                'mean_sockets': round(float(np.mean([sockets for sockets, _ in usage])), 1),
+                'max_rss_mb': round(max(rss for _, rss in usage) / 1e6, 1),
+            }
+            for pid, usage in samples.items()
+        },
+    }
+
+def print_report(report: dict):
+    chat = report['chat']
+    upload = report['upload']
+    print(f"wall time            {report['wall_seconds']}s, {len(report['errors'])} errors")
+    print(f"register p50/p95     {report['register']['p50_ms']} / {report['register']['p95_ms']} ms ({report['register']['count']})")
+    print(f"login p50/p95        {report['login']['p50_ms']} / {report['login']['p95_ms']} ms ({report['login']['count']})")
+    print(f"ttft p50/p95/p99     {chat['ttft_p50_ms']} / {chat['ttft_p95_ms']} / {chat['ttft_p99_ms']} ms ({chat['count']} chats)")
+    print(f"upload               {upload['mb']} MB at {upload['mb_per_second']} MB/s ({upload['count']} files)")
+    print(f"{'worker':<10}{'max sockets':>12}{'mean sockets':>14}{'max RSS MB':>12}")
+    for pid, usage in report['workers'].items():
+        print(f"{pid:<10}{usage['max_sockets']:>12}{usage['mean_sockets']:>14}{usage['max_rss_mb']:>12}")
+    for error in report['errors'][:10]:
+        print(f'error: {error}')
+
+###############################################################################
+# Entrypoint
+###############################################################################
+async def run(args):
+    workload = load_workload(args.workload)
+    app_port = free_port()
+    openai_port = free_port()
+
+    with tempfile.TemporaryDirectory() as fake_dir:
+        env = dict(os.environ, BENCH_FAKE_DIR=fake_dir, BENCH_OPENAI_URL=f'http://127.0.0.1:{openai_port}')
+        processes = []
+        try:
+            # OpenAI stub
+            processes.append(subprocess.Popen([
+                sys.executable, '-m', 'benchmarks.fake_openai', '--port', str(openai_port),
+                '--ttft-ms', str(args.ttft_ms), '--tokens-per-second', str(args.tokens_per_second),
+                '--response-tokens', str(args.response_tokens), '--embedding-ms', str(args.embedding_ms)
+            ], cwd=REPO_DIR, env=env))
+
+            # The app (worker recycling off so every worker lives through the run)
+            server = subprocess.Popen([
+                sys.executable, '-m', 'gunicorn', 'benchmarks.fake_app:app',
+                '--worker-class', 'uvicorn.workers.UvicornWorker', '--workers', str(args.workers),
+                '--bind', f'127.0.0.1:{app_port}', '--max-requests', '0', '--log-level', 'warning'
+            ], cwd=REPO_DIR, env=env)
+            processes.append(server)
+
+            await wait_until_up(f'http://127.0.0.1:{openai_port}/openai/deployments/chat/embeddings')
+            await wait_until_up(f'http://127.0.0.1:{app_port}/openapi.json')
+
+            # Replay while sampling the workers
+            samples = {}
+            sampler = asyncio.create_task(sample_workers(server.pid, samples))
+            try:
+                results = await replay(f'http://127.0.0.1:{app_port}', workload, args.speed)
+            finally:
+                sampler.cancel()
+                await asyncio.gather(sampler, return_exceptions=True)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    return build_report(results, samples, args)
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test of the app against local fakes.')
+    parser.add_argument('--workload', default=os.path.join(FIXTURES_DIR, 'load_workload.jsonl'), help='Recorded workload (jsonl)')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed-up of the recorded timeline')
+    parser.add_argument('--ttft-ms', type=float, default=300, help='Stub model delay before the first token')
+    parser.add_argument('--tokens-per-second', type=float, default=50, help='Stub model streaming rate')
+    parser.add_argument('--response-tokens', type=int, default=60, help='Tokens per stub answer')
+    parser.add_argument('--embedding-ms', type=float, default=20, help='Stub embeddings latency')
+    parser.add_argument('--json', help='Also write the report to this file')
+    parser.add_argument('--max-ttft-p95-ms', type=float, help='Fail if p95 time to first token is above this')
+    parser.add_argument('--min-upload-mbps', type=float, help='Fail if upload throughput is below this')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    # CI gates
+    failures = []
+    if report['errors']:
+        failures.append(f"{len(report['errors'])} workload errors")
+    if args.max_ttft_p95_ms is not None and (report['chat']['ttft_p95_ms'] or 0) > args.max_ttft_p95_ms:
+        failures.append(f"ttft p95 {report['chat']['ttft_p95_ms']}ms > {args.max_ttft_p95_ms}ms")
+    if args.min_upload_mbps is not None and (report['upload']['mb_per_second'] or 0) < args.min_upload_mbps:
+        failures.append(f"upload {report['upload']['mb_per_second']} MB/s < {args.min_upload_mbps} MB/s")
+    if failures:
+        print('FAILED: ' + '; '.join(failures))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+# Recall/latency benchmark of the retrieval engine on a fixture corpus.
+# Runs fully offline: the corpus is indexed into a local vector store (temp dir) with
+# deterministic hashed character-trigram embeddings instead of Azure OpenAI.
+#
+# Usage (from the repo root):
+#   python -m benchmarks.retrieval_benchmark [--k 3] [--repeat 20]
+
+# Imports
+import os
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import numpy as np
+
+# In-App Dependencies
+from services.vector_store import LocalVectorStore
+from services.search_engine import hybrid_search, content_terms, jaccard, RERANK_WEIGHT, MMR_LAMBDA
+from benchmarks.fake_openai import fake_embedding
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+INDEX_NAME = 'retrieval-benchmark'
+
+# Engine configurations compared (each adds one stage)
+CONFIGS = {
+    'vector': {'hybrid': False, 'rerank_weight': 0.0, 'mmr_lambda': 1.0},
+    'hybrid': {'hybrid': True, 'rerank_weight': 0.0, 'mmr_lambda': 1.0},
+    'hybrid+rerank': {'hybrid': True, 'rerank_weight': RERANK_WEIGHT, 'mmr_lambda': 1.0},
+    'hybrid+rerank+mmr': {'hybrid': True, 'rerank_weight': RERANK_WEIGHT, 'mmr_lambda': MMR_LAMBDA},
+}
+
+###############################################################################
+# Helper Functions
+###############################################################################
+# Reads a jsonl fixture
+def load_jsonl(file_name: str):
+    with open(os.path.join(FIXTURES_DIR, file_name), encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# Share of relevant chunks found (out of at most k findable)
+def recall_at_k(found_ids: list, relevant_ids: list, k: int):
+    return len(set(found_ids) & set(relevant_ids)) / min(len(relevant_ids), k)
+
+# Pairs of returned chunks that are near duplicates (term Jaccard > 0.5)
+def redundant_pairs(results: list):
+    terms = [content_terms(result['content']) for result in results]
+    return sum(
+        1
+        for i in range(len(terms))
+        for j in range(i + 1, len(terms))
+        if jaccard(terms[i], terms[j]) > 0.5
+    )
+
+###############################################################################
+# Benchmark
+###############################################################################
+async def run(k: int, repeat: int):
+    corpus = load_jsonl('retrieval_corpus.jsonl')
+    queries = load_jsonl('retrieval_queries.jsonl')
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Index the corpus
+        store = LocalVectorStore(directory=directory)
+        store.create_index(INDEX_NAME)
+        await store.add(INDEX_NAME, [
+            {
+                'id': doc['id'],
+                'content': doc['content'],
+                'content_vector': fake_embedding(doc['content']),
+                'metadata': json.dumps({'file_name': doc['file_name']}),
+            }
+            for doc in corpus
+        ])
+        query_vectors = [fake_embedding(query['query']) for query in queries]
+
+        # Run every configuration
+        print(f"{'config':<20}{'recall@' + str(k):>10}{'dup pairs':>11}{'p50 ms':>9}{'p95 ms':>9}")
+        for name, options in CONFIGS.items():
+            recalls = []
+            duplicates = 0
+            latencies = []
+            for query, query_vector in zip(queries, query_vectors):
+                for attempt in range(repeat):
+                    start = time.perf_counter()
+                    results = await hybrid_search(store, INDEX_NAME, query['query'], query_vector, k=k, **options)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(recall_at_k([result['id'] for result in results], query['relevant'], k))
+                duplicates += redundant_pairs(results)
+            print(
+                f"{name:<20}{np.mean(recalls):>10.3f}{duplicates:>11}"
+                f"{np.percentile(latencies, 50):>9.2f}{np.percentile(latencies, 95):>9.2f}"
+            )
+
+###############################################################################
+# Entrypoint
+###############################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Retrieval recall/latency benchmark on the fixture corpus.')
+    parser.add_argument('--k', type=int, default=3, help='Chunks returned per query')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query')
+    args = parser.parse_args()
+    asyncio.run(run(args.k, args.repeat))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+# Worker CPU per streamed answer: one frame per token vs coalesced frames.
+# Starts a single uvicorn worker whose /ws endpoint streams synthetic tokens through the same
+# FrameCoalescer the chat endpoint uses, drives many concurrent sockets against it and reads
+# the worker's CPU time from /proc.
+#
+# Usage (from the repo root, Linux):
+#   python -m benchmarks.stream_benchmark [--sockets 200] [--answers 5] [--tokens 300] [--rate 100]
+
+# Imports
+import os
+import sys
+import time
+import asyncio
+import argparse
+import subprocess
+import numpy as np
+import aiohttp
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+
+# In-App Dependencies
+from services.streaming import FrameCoalescer
+from benchmarks.load_benchmark import free_port, wait_until_up, REPO_DIR
+
+###############################################################################
+# Streaming Server (run by uvicorn in a subprocess)
+###############################################################################
+app = FastAPI()
+
+# Streams {"tokens"} synthetic tokens at {"rate"} tokens/s in the requested frame mode, then <<END>>
+@app.websocket('/ws')
+async def stream_tokens(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        while True:
+            request = await websocket.receive_json()
+            frames = FrameCoalescer(websocket.send_text, mode=request['frames'])
+            for i in range(request['tokens']):
+                await frames.write(' tok' if i else 'tok')
+                await asyncio.sleep(1 / request['rate'])
+            await frames.close()
+            await websocket.send_text('<<END>>')
+    except WebSocketDisconnect:
+        pass
+
+# Health check used to wait for startup
+@app.get('/health')
+def health():
+    return {'status': 'ok'}
+
+###############################################################################
+# Helper Functions
+###############################################################################
+# CPU seconds (user + system) used so far by a process
+def process_cpu_seconds(pid: int):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+# One socket asking for several answers; returns [(frames, first frame latency, total latency)]
+async def run_socket(session: aiohttp.ClientSession, url: str, mode: str, answers: int, tokens: int, rate: float):
+    results = []
+    async with session.ws_connect(url) as websocket:
+        for _ in range(answers):
+            start = time.monotonic()
+            await websocket.send_json({'frames': mode, 'tokens': tokens, 'rate': rate})
+            frames = 0
+            first = None
+            while (await websocket.receive_str()) != '<<END>>':
+                frames += 1
+                first = first or time.monotonic() - start
+            results.append((frames, first, time.monotonic() - start))
+    return results
+
+###############################################################################
+# Benchmark
+###############################################################################
+async def run_mode(pid: int, url: str, mode: str, args):
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+        cpu_start = process_cpu_seconds(pid)
+        runs = await asyncio.gather(*(
+            run_socket(session, url, mode, args.answers, args.tokens, args.rate)
+            for _ in range(args.sockets)
+        ))
+        cpu = process_cpu_seconds(pid) - cpu_start
+    results = [result for run in runs for result in run]
+    return {
+        'cpu_ms_per_answer': cpu * 1000 / len(results),
+        'frames_per_answer': np.mean([frames for frames, _, _ in results]),
+        'first_frame_p50_ms': np.percentile([first for _, first, _ in results], 50) * 1000,
+        'total_p50_ms': np.percentile([total for _, _, total in results], 50) * 1000,
+    }
+
+async def run(args):
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, '-m', 'uvicorn', 'benchmarks.stream_benchmark:app',
+        '--port', str(port), '--log-level', 'warning'
+    ], cwd=REPO_DIR)
+    try:
+        await wait_until_up(f'http://127.0.0.1:{port}/health')
+        print(f"{'mode':<11}{'cpu ms/answer':>14}{'frames/answer':>15}{'first p50 ms':>14}{'total p50 ms':>14}")
+        for mode in ('token', 'coalesced'):
+            result = await run_mode(server.pid, f'ws://127.0.0.1:{port}/ws', mode, args)
+            print(
+                f"{mode:<11}{result['cpu_ms_per_answer']:>14.2f}{result['frames_per_answer']:>15.1f}"
+                f"{result['first_frame_p50_ms']:>14.1f}{result['total_p50_ms']:>14.1f}"
+            )
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+###############################################################################
+# Entrypoint
+###############################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Worker CPU per streamed answer by WebSocket frame mode.')
+    parser.add_argument('--sockets', type=int, default=200, help='Concurrent WebSockets')
+    parser.add_argument('--answers', type=int, default=5, help='Answers streamed per socket')
+    parser.add_argument('--tokens', type=int, default=300, help='Tokens per answer')
+    parser.add_argument('--rate', type=float, default=100, help='Tokens per second per answer')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# Time to first token with clients built per message vs the worker's pooled clients.
+# per_message: what every chat message used to do: build AzureOpenAIEmbeddings, the langchain
+#   AzureSearch vector store (which embeds a probe text and fetches the index definition) and
+#   AzureChatOpenAI, each on fresh connections.
+# pooled: the singletons from services/clients.py sharing keep-alive pools.
+# Both embed the query, run one vector search and stream an answer from local stubs
+# (benchmarks/fake_openai.py, benchmarks/fake_search.py).
+#
+# Usage (from the repo root):
+#   python -m benchmarks.ttft_benchmark [--messages 200] [--concurrency 8] [--ttft-ms 50]
+
+# Imports
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+from benchmarks.load_benchmark import free_port, wait_until_up, REPO_DIR
+from benchmarks.fake_search import write_self_signed_cert
+
+# Settings the app reads at import time (endpoints are set once the stubs are up)
+for name, value in {
+    'AZURE_OPENAI_API_KEY': 'benchmark-key',
+    'AZURE_OPENAI_API_VERSION': '2024-02-01',
+    'AZURE_OPENAI_CHAT_DEPLOYMENT_NAME': 'chat',
+    'AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME': 'embeddings',
+    'AZURE_SEARCH_ADMIN_KEY': 'benchmark-key',
+    'VECTOR_STORE_BACKEND': 'azure',
+}.items():
+    os.environ.setdefault(name, value)
+
+# In-App Dependencies
+from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
+from langchain_community.vectorstores.azuresearch import AzureSearch
+from services.clients import get_chat_llm, get_embeddings, close_async_clients, close_clients
+from services.concurrency import run_blocking, shutdown_executor
+from services.vector_store import get_vector_store
+
+INDEX_NAME = 'ttft-benchmark'
+MODES = ('per_message', 'pooled')
+
+###############################################################################
+# Message Paths
+###############################################################################
+# Prompt over the retrieved chunks
+def build_benchmark_prompt(query: str, contents: list):
+    return 'Context:\n' + '\n'.join(contents) + f'\nQuestion: {query}'
+
+# Streams the answer; returns seconds from start to the first token
+async def stream_answer(llm, prompt: str, start: float):
+    first_token_at = None
+    async for token in llm.astream(prompt):
+        first_token_at = first_token_at or time.perf_counter()
+    return first_token_at - start
+
+# Builds every client for this message (the path before the per-worker client registry)
+async def answer_per_message(query: str):
+    start = time.perf_counter()
+    embeddings = AzureOpenAIEmbeddings(
+        azure_deployment=os.environ['AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME'],
+        openai_api_version=os.environ['AZURE_OPENAI_API_VERSION'],
+        azure_endpoint=os.environ['AZURE_OPENAI_ENDPOINT'],
+        api_key=os.environ['AZURE_OPENAI_API_KEY'],
+    )
+    vector_store = await run_blocking(
+        AzureSearch,
+        azure_search_endpoint=os.environ['AZURE_SEARCH_SERVICE_ENDPOINT'],
+        azure_search_key=os.environ['AZURE_SEARCH_ADMIN_KEY'],
+        index_name=INDEX_NAME,
+        embedding_function=embeddings.embed_query,
+    )
+    docs = await run_blocking(vector_store.similarity_search, query, k=3)
+    llm = AzureChatOpenAI(
+        openai_api_version=os.environ['AZURE_OPENAI_API_VERSION'],
+        azure_deployment=os.environ['AZURE_OPENAI_CHAT_DEPLOYMENT_NAME'],
+        temperature=0.7
+    )
+    return await stream_answer(llm, build_benchmark_prompt(query, [doc.page_content for doc in docs]), start)
+
+# Uses the worker's pooled clients
+async def answer_pooled(query: str):
+    start = time.perf_counter()
+    query_vector = await get_embeddings().aembed_query(query)
+    results = await get_vector_store().search(INDEX_NAME, query_vector, 3)
+    return await stream_answer(get_chat_llm(), build_benchmark_prompt(query, [result['content'] for result in results]), start)
+
+###############################################################################
+# Benchmark
+###############################################################################
+# Sends `messages` distinct queries over `concurrency` sequential senders; returns TTFTs in seconds
+async def run_mode(mode: str, messages: int, concurrency: int):
+    answer = answer_per_message if mode == 'per_message' else answer_pooled
+    queue = asyncio.Queue()
+    for i in range(messages):
+        queue.put_nowait(f'What does the plan say about latency budgets, question {mode}-{i}?')
+    ttfts = []
+
+    async def sender():
+        while not queue.empty():
+            ttfts.append(await answer(queue.get_nowait()))
+
+    await asyncio.gather(*(sender() for _ in range(concurrency)))
+    return ttfts
+
+async def run(args):
+    openai_port, search_port = free_port(), free_port()
+    cert_dir = tempfile.mkdtemp(prefix='ttft-benchmark-')
+    cert_path, key_path = write_self_signed_cert(cert_dir)
+    processes = [
+        subprocess.Popen([
+            sys.executable, '-m', 'benchmarks.fake_openai', '--port', str(openai_port),
+            '--ttft-ms', str(args.ttft_ms), '--embedding-ms', str(args.embedding_ms),
+            '--response-tokens', '20', '--tokens-per-second', '1000'
+        ], cwd=REPO_DIR),
+        subprocess.Popen([
+            sys.executable, '-m', 'benchmarks.fake_search', '--port', str(search_port), '--search-ms', str(args.search_ms),
+            '--certfile', cert_path, '--keyfile', key_path
+        ], cwd=REPO_DIR),
+    ]
+    os.environ['AZURE_OPENAI_ENDPOINT'] = f'http://127.0.0.1:{openai_port}'
+    os.environ['AZURE_SEARCH_SERVICE_ENDPOINT'] = f'https://127.0.0.1:{search_port}'
+    # Trust the stub's certificate (the Search SDK refuses plain http)
+    os.environ['SSL_CERT_FILE'] = os.environ['REQUESTS_CA_BUNDLE'] = cert_path
+    try:
+        await wait_until_up(f'http://127.0.0.1:{openai_port}/openai/deployments/chat/embeddings')
+        await wait_until_up(f'https://127.0.0.1:{search_port}/indexes')
+
+        print(f'stubs: chat ttft {args.ttft_ms:.0f} ms, embeddings {args.embedding_ms:.0f} ms, search {args.search_ms:.0f} ms')
+        print(f"{'mode':<13}{'messages':>9}{'ttft p50 ms':>13}{'ttft p95 ms':>13}{'ttft mean ms':>14}")
+        for mode in MODES:
+            await run_mode(mode, args.concurrency, args.concurrency)  # warm up imports & pools
+            ttfts = np.array(await run_mode(mode, args.messages, args.concurrency)) * 1000
+            print(f'{mode:<13}{len(ttfts):>9}{np.percentile(ttfts, 50):>13.1f}{np.percentile(ttfts, 95):>13.1f}{ttfts.mean():>14.1f}')
+    finally:
+        await close_async_clients()
+        close_clients()
+        shutdown_executor()
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=30)
+        shutil.rmtree(cert_dir, ignore_errors=True)
+
+###############################################################################
+# Entrypoint
+###############################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Time to first token: per-message clients vs pooled clients.')
+    parser.add_argument('--messages', type=int, default=200, help='Chat messages per mode')
+    parser.add_argument('--concurrency', type=int, default=8, help='Messages in flight at once')
+    parser.add_argument('--ttft-ms', type=float, default=50, help='Stub delay before the first streamed token')
+    parser.add_argument('--embedding-ms', type=float, default=10, help='Stub latency of an embeddings call')
+    parser.add_argument('--search-ms', type=float, default=10, help='Stub latency of a search call')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
@@ -3,21 +3,15 @@ import jwt
 from dotenv import load_dotenv
 import os
 import datetime
+import time
+import hashlib
 from fastapi import HTTPException, status, Header
 import uuid
-from azure.cosmos import CosmosClient
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
-from azure.search.documents.indexes import SearchIndexClient
-from azure.core.credentials import AzureKeyCredential
-from azure.search.documents.indexes.models import (
-    SearchIndex,
-    SearchField,
-    SearchFieldDataType,
-    SimpleField,
-    VectorSearch,
-    VectorSearchProfile,
-    HnswAlgorithmConfiguration,
-)
+
+# In-App Dependencies
+from services.clients import get_cosmos_container, get_async_cosmos_container
+from services.cache import TTLCache, get_shared_cache
+from services.concurrency import run_blocking
 
 # Load Environment Variables
 load_dotenv('.env')
@@ -26,6 +20,21 @@ load_dotenv('.env')
 # JWT Authentication Helper Functions
 ###############################################################################
 JWT_ALGORITHM = "HS256"
+# Max validated tokens cached per worker
+JWT_CACHE_SIZE = int(os.getenv('JWT_CACHE_SIZE', '10000'))
+# Seconds a validated token without an 'exp' claim stays cached
+JWT_CACHE_TTL = float(os.getenv('JWT_CACHE_TTL', '300'))
+
+# Signing key (loaded once per worker) & validated token payloads (expire at the token's 'exp')
+_jwt_secret = None
+_token_cache = TTLCache(maxsize=JWT_CACHE_SIZE)
+
+# Loads the JWT signing key (called on startup; later calls reuse it)
+def load_jwt_keys():
+    global _jwt_secret
+    if _jwt_secret is None:
+        _jwt_secret = os.environ['JWT_CREATION_SECRET']
+    return _jwt_secret
 
 # Function to Create JWT Token Signing
 def create_access_token(exp_mins: int, data: dict):
@@ -39,28 +48,38 @@ def create_access_token(exp_mins: int, data: dict):
     to_encode.update({"exp": expire})
     
     # Creates JWT Token
-    encoded_jwt = jwt.encode(to_encode, os.environ['JWT_CREATION_SECRET'], algorithm=JWT_ALGORITHM)
+    encoded_jwt = jwt.encode(to_encode, load_jwt_keys(), algorithm=JWT_ALGORITHM)
     
     # returns JWT Token
     return encoded_jwt
 
 # Function to Decode and Validate JWT Token
+# Valid tokens are cached by digest until they expire, so repeat calls skip the signature check
 def decode_and_validate_token(token: str):
+    # Check Cache
+    token_digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    payload = _token_cache.get(token_digest)
+    if payload is not None:
+        return payload
+    
     try:
         # Decodes JWT token
-        payload = jwt.decode(token, os.environ['JWT_CREATION_SECRET'], algorithms=[JWT_ALGORITHM])
-        return payload
+        payload = jwt.decode(token, load_jwt_keys(), algorithms=[JWT_ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    
+    # Cache until the token expires
+    expires_at = payload.get('exp')
+    _token_cache.set(token_digest, payload, expires_at=float(expires_at) if expires_at is not None else time.time() + JWT_CACHE_TTL)
+    return payload
 
 ###############################################################################
 # JWT Dependency Function
 ###############################################################################
-# Function to secure API endpoints by checking for valid JWT token in Header
-# PASS IN THIS TO PARAMS OF ENDPOINT TO SECURE: "email: str = Depends(jwt_dependency)""
-def jwt_dependency(authorization: str = Header(...)):
+# Validates a "Bearer <token>" value and returns the token's payload
+def validate_authorization(authorization: str):
     if authorization is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -77,10 +96,7 @@ def jwt_dependency(authorization: str = Header(...)):
             )
         
         # Decode and validate JWT token
-        payload = decode_and_validate_token(token)
-        
-        # Return the 'sub' value from the payload
-        return str(payload.get('sub')).lower()
+        return decode_and_validate_token(token)
     
     except Exception as e:
         raise HTTPException(
@@ -88,170 +104,87 @@ def jwt_dependency(authorization: str = Header(...)):
             detail=f"Invalid Authorization Header Format. Error: {e}"
         )
 
+# Function to secure API endpoints by checking for valid JWT token in Header
+# PASS IN THIS TO PARAMS OF ENDPOINT TO SECURE: "email: str = Depends(jwt_dependency)""
+def jwt_dependency(authorization: str = Header(...)):
+    # Return the 'sub' value from the payload
+    return str(validate_authorization(authorization).get('sub')).lower()
+
 ###############################################################################
 # Azure Helper Functions
 ###############################################################################
 # Creates UUID for Azure Blob Container Name
+# (122 random bits, so no uniqueness check against Cosmos is needed)
 def get_uuid_for_blob_container():
-    # Generate UUID for Container Name
-    unique_id = str(uuid.uuid4())
-    
-    # Remove hyphens from UUID
-    unique_id = unique_id.replace('-', '').lower()[:63]
-    
-    # Get Cosmos Container
-    client = CosmosClient.from_connection_string(conn_str=os.environ['COSMOS_CONNECTION_STRING'])
-    database = client.get_database_client(os.environ['COSMOS_DB_NAME'])
-    container = database.get_container_client(os.environ['COSMOS_USERCONTAINERNAME_CONTAINER_NAME'])
-    
-    while True:
-        # Check if UUID Container Already Exists in Cosmos
-        try:
-            query = "SELECT * FROM c WHERE c.id = @id"
-            params = [
-                {'name': '@id', 'value': str(unique_id)}
-            ]
-            query_iterable = container.query_items(
-                query=query,
-                parameters=params,
-                enable_cross_partition_query=True
-            )
-            items = list(query_iterable)
-            if not items:
-                return unique_id
-        except:
-            return False
+    return uuid.uuid4().hex
 
+###############################################################################
+# Cosmos Helper Functions
+###############################################################################
+# Mapping items (user -> container/index name); pre-provisioned pool entries share the container
+# with another type, so they never resolve as a user's index (items saved before types had none)
+MAPPING_TYPE = 'mapping'
+POOL_TYPE = 'pool'
 
-# Creates a User's Azure AI Search Index
-def create_user_search_index(unique_id: str):
-    try:
-        # Get Azure Search Client
-        search_client = SearchIndexClient(
-            endpoint=os.environ['AZURE_SEARCH_SERVICE_ENDPOINT'],
-            credential=AzureKeyCredential(os.environ['AZURE_SEARCH_ADMIN_KEY'])
-        )
+# The user's container/index name (the mapping item's id)
+INDEX_NAME_QUERY = (
+    "SELECT TOP 1 c.id FROM c WHERE c.UserId = @user_email "
+    f"AND (c.type = '{MAPPING_TYPE}' OR NOT IS_DEFINED(c.type))"
+)
 
-        # Initialize AI Search Index w/ vector search
-        index = SearchIndex(
-            name=unique_id,
-            fields=[
-                SimpleField(name="id", type=SearchFieldDataType.String, key=True),
-                SimpleField(name="content", type=SearchFieldDataType.String, searchable=True),
-                SimpleField(name="metadata", type=SearchFieldDataType.String, searchable=True),
-                SearchField(
-                    name="content_vector",
-                    type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
-                    searchable=True,
-                    vector_search_dimensions=1536,
-                    vector_search_profile_name=f'{unique_id}-vector-config'
-                )
-            ],
-            vector_search = VectorSearch(
-                profiles=[VectorSearchProfile(
-                    name=f'{unique_id}-vector-config',
-                    algorithm_configuration_name=f'{unique_id}-algorithms-config'
-                )],
-                algorithms=[HnswAlgorithmConfiguration(name=f'{unique_id}-algorithms-config')],
-            )
-        )
+# User -> Container/Index Name cache (the mapping never changes after registration)
+INDEX_NAME_CACHE_SIZE = int(os.getenv('INDEX_NAME_CACHE_SIZE', '10000'))
+INDEX_NAME_CACHE_TTL = float(os.getenv('INDEX_NAME_CACHE_TTL', '3600'))
+_index_name_cache = TTLCache(maxsize=INDEX_NAME_CACHE_SIZE, ttl=INDEX_NAME_CACHE_TTL)
+_shared_index_name_cache = get_shared_cache('index_name', ttl=INDEX_NAME_CACHE_TTL)
 
-        # Create AI Search Index
-        search_client.create_index(index)
-        
-        # Return Success
-        return True
-    except:
-        return False
-    
+# Drops a user's cached Container/Index Name on every tier
+def invalidate_user_container_or_index_name(user_email: str):
+    user_email = user_email.lower()
+    _index_name_cache.delete(user_email)
+    if _shared_index_name_cache is not None:
+        _shared_index_name_cache.delete(user_email)
 
-# Creates a User's Azure Blob Container & AI Search Index
-def create_user_blob_container_and_index(user_email: str):
-    # save to lower
+# Return's the Container/Search Index Name for a user
+# Container Names and Search Index Names are the same
+async def get_user_container_or_index_name(user_email: str):
+    # Ensure email is lower case
     user_email = user_email.lower()
     
-    # To check if container was created or not
-    container_created = False
-    cosmos_item_saved = False
-    
-    # Generate UUID for Container Name
-    unique_id = get_uuid_for_blob_container()
-    if not unique_id:
-        return False
-    
-    # Try to create the Blob Container
-    try:
-        # Create Blob Container
-        blob_service_client = BlobServiceClient.from_connection_string(os.environ['AZURE_BLOB_CONN_STR'])
-        container_client = blob_service_client.create_container(unique_id)
-        container_created = True
-    except Exception as e:
-        print(f'ERROR IN CONTAINER CREATION FOR {user_email}: {e}')
-        return False
+    # Check In-Process Cache
+    index_name = _index_name_cache.get(user_email)
+    if index_name:
+        return index_name
     
-    # Try to save the Blob Container Name to Cosmos
-    try:
-        # Get Cosmos Container
-        client = CosmosClient.from_connection_string(conn_str=os.environ['COSMOS_CONNECTION_STRING'])
-        database = client.get_database_client(os.environ['COSMOS_DB_NAME'])
-        container = database.get_container_client(os.environ['COSMOS_USERCONTAINERNAME_CONTAINER_NAME'])
-        
-        # Create User Container Item for Cosmos
-        container.upsert_item(body={
-            'id': unique_id,
-            'UserId': user_email
-        })
-        cosmos_item_saved = True
-        
-    except:
-        # Delete Blob Container if Cosmos Save Fails
-        if container_created:
-            blob_service_client.delete_container(unique_id)        
-        return False
+    # Check Shared Cache
+    if _shared_index_name_cache is not None:
+        index_name = await run_blocking(_shared_index_name_cache.get, user_email)
+        if index_name:
+            _index_name_cache.set(user_email, index_name)
+            return index_name
     
-    # Try to create the Azure AI Search Index
-    if create_user_search_index(unique_id):
-        
-        # return success
-        return True
-    else:
-        try:
-            # Rollback Creations if failure
-            if container_created:
-                blob_service_client.delete_container(unique_id)
-            if cosmos_item_saved:
-                container.delete_item(unique_id, user_email)
-        except:
-            pass
-        
-        # Return Fail
-        return False
-
-###############################################################################
-# Cosmos Helper Functions
-###############################################################################
-# Return's the Container/Search Index Name for a user
-# Container Names and Search Index Names are the same
-def get_user_container_or_index_name(user_email: str):
     # Get Cosmos Container
-    client = CosmosClient.from_connection_string(conn_str=os.environ['COSMOS_CONNECTION_STRING'])
-    database = client.get_database_client(os.environ['COSMOS_DB_NAME'])
-    container = database.get_container_client(os.environ['COSMOS_USERCONTAINERNAME_CONTAINER_NAME'])
+    container = get_async_cosmos_container(os.environ['COSMOS_USERCONTAINERNAME_CONTAINER_NAME'])
     
     try:
-        query = "SELECT * FROM c WHERE c.UserId = @user_email"
+        # Single-partition read scoped to the user's partition key
         params = [
             {'name': '@user_email', 'value': user_email}
         ]
         query_iterable = container.query_items(
-            query=query,
+            query=INDEX_NAME_QUERY,
             parameters=params,
-            enable_cross_partition_query=True
+            partition_key=user_email
         )
-        items = list(query_iterable)
-        if items:
-            return items[0]['id']
-        else:
+        items = [item async for item in query_iterable]
+        if not items:
             return False
+        
+        # Cache the mapping on every tier
+        index_name = items[0]['id']
+        _index_name_cache.set(user_email, index_name)
+        if _shared_index_name_cache is not None:
+            await run_blocking(_shared_index_name_cache.set, user_email, index_name)
+        return index_name
     except:
         return False
\ No newline at end of file
@@ -1,19 +1,50 @@
 # Imports
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, PlainTextResponse
 
 # In-App Dependencies
 from routers.stream import router as stream_router
 from routers.auth import router as auth_router
 from routers.chat_history import router as chat_history_router
-from routers.ai_search import router as ai_search_router
+from routers.ai_search import router as ai_search_router, process_uploaded_file
+from services.clients import init_clients, close_clients, init_async_clients, close_async_clients
+from services.concurrency import shutdown_executor, run_blocking
+from services.jobs import start_ingestion_workers, stop_ingestion_workers
+from services.persistence import chat_write_behind
+from services.provisioning import start_provisioning_pool, stop_provisioning_pool
+from services.metrics import metrics, start_metrics, stop_metrics, METRICS_ENABLED
+from dependencies import load_jwt_keys
+
+
+###############################################################################
+# Lifespan
+###############################################################################
+# Builds the worker's pooled Azure clients on startup and closes them on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load_jwt_keys()
+    init_clients()
+    await init_async_clients()
+    await start_ingestion_workers(process_uploaded_file)
+    await chat_write_behind.start()
+    await start_provisioning_pool()
+    await start_metrics()
+    yield
+    await stop_metrics()
+    await stop_provisioning_pool()
+    await chat_write_behind.stop()
+    await stop_ingestion_workers()
+    await close_async_clients()
+    shutdown_executor()
+    close_clients()
 
 
 ###############################################################################
 # Initialize FastAPI
 ###############################################################################
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 ###############################################################################
@@ -43,4 +74,17 @@ app.add_middleware(
 # Default to docs
 @app.get("/", tags=["General"])
 def root_route():
-    return RedirectResponse(url="/docs")
\ No newline at end of file
+    return RedirectResponse(url="/docs")
+
+
+###############################################################################
+# Metrics Endpoint
+###############################################################################
+# Prometheus metrics of every worker on this host
+if METRICS_ENABLED:
+    @app.get("/metrics", tags=["General"], response_class=PlainTextResponse)
+    async def metrics_route():
+        return PlainTextResponse(
+            await run_blocking(metrics.render),
+            media_type='text/plain; version=0.0.4'
+        )
\ No newline at end of file
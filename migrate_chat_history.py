@@ -0,0 +1,115 @@
+# Migrates legacy chat documents (one document with a growing 'history' array)
+# to the append-only layout (one item per turn + a small chat header).
+#
+# Usage:
+#   python migrate_chat_history.py [--dry-run] [--user <email>]
+#
+# Safe to re-run: turn items get deterministic ids and are upserted, and the
+# header is only rewritten after all of its turns were saved.
+
+# Imports
+import os
+import argparse
+import logging
+from dotenv import load_dotenv
+from azure.core import MatchConditions
+
+# In-App Dependencies
+from services.clients import get_cosmos_container, close_clients
+from routers.chat_history import build_turn_item, build_chat_header
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Migration
+###############################################################################
+# Returns every legacy chat document (optionally for one user)
+def get_legacy_chats(container, user_email: str = None):
+    query = "SELECT * FROM c WHERE IS_DEFINED(c.history)"
+    if user_email:
+        return container.query_items(
+            query=query,
+            partition_key=user_email
+        )
+    return container.query_items(
+        query=query,
+        enable_cross_partition_query=True
+    )
+
+# Splits one legacy chat document into turn items + a header
+def migrate_chat(container, chat: dict, dry_run: bool = False):
+    chat_id = chat['id']
+    user_email = chat['UserId']
+    history = chat.get('history') or []
+
+    # Build Turn Items (deterministic ids so re-runs overwrite instead of duplicating)
+    turns = [
+        build_turn_item(
+            chat_id=chat_id,
+            user_email=user_email,
+            user_query=msg.get('human'),
+            ai_response=msg.get('ai'),
+            timestamp=msg.get('timestamp'),
+            turn_id=f'{chat_id}-legacy-{i:06d}'
+        )
+        for i, msg in enumerate(history)
+    ]
+    if dry_run:
+        return len(turns)
+
+    # Save Turns
+    for turn in turns:
+        container.upsert_item(body=turn)
+
+    # Replace the legacy document with a header
+    # Turns saved since the new layout went live were already counted in turn_count by the header patch
+    if turns:
+        header = build_chat_header(
+            chat_id, user_email, turns[0], turns[-1],
+            turn_count=len(turns) + chat.get('turn_count', 0)
+        )
+        header['last_timestamp'] = max(turns[-1]['timestamp'], chat.get('last_timestamp') or '')
+    else:
+        header = {'id': chat_id, 'UserId': user_email, 'type': 'chat', 'title': '', 'turn_count': chat.get('turn_count', 0)}
+
+    # Only replace if nobody wrote the document meanwhile (a re-run picks it up)
+    container.replace_item(
+        item=chat,
+        body=header,
+        etag=chat.get('_etag'),
+        match_condition=MatchConditions.IfNotModified
+    )
+    return len(turns)
+
+###############################################################################
+# Entrypoint
+###############################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Migrate chat history to one item per turn.')
+    parser.add_argument('--dry-run', action='store_true', help='Only count what would be migrated')
+    parser.add_argument('--user', help='Only migrate chats of this user email')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    container = get_cosmos_container(os.environ['COSMOS_CHAT_CONTAINER_NAME'])
+
+    chats_migrated = 0
+    turns_migrated = 0
+    failures = 0
+    for chat in get_legacy_chats(container, args.user.lower() if args.user else None):
+        try:
+            turns_migrated += migrate_chat(container, chat, dry_run=args.dry_run)
+            chats_migrated += 1
+        except Exception as e:
+            failures += 1
+            logging.error(f"Failed to migrate chat <{chat['id']}> for <{chat.get('UserId')}>: {e}")
+
+    logging.info(
+        f"{'Would migrate' if args.dry_run else 'Migrated'} {chats_migrated} chats "
+        f"({turns_migrated} turns), {failures} failures"
+    )
+    close_clients()
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,33 @@
 # Imports
-from azure.storage.blob import BlobServiceClient
-from fastapi import APIRouter, status, Depends, File, UploadFile, HTTPException
+from fastapi import APIRouter, status, Depends, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect
 from dotenv import load_dotenv
 import os
-from langchain_community.vectorstores.azuresearch import AzureSearch
-from langchain_openai import AzureOpenAIEmbeddings
+import json
+import time
+import asyncio
+import logging
+import mmap
+import shutil
+from contextlib import contextmanager
+from langchain_core.documents import Document as LangchainDocument
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from docx import Document
-from io import BytesIO
 from PyPDF2 import PdfReader
 
 
 # In-App Dependencies
 from dependencies import get_user_container_or_index_name, jwt_dependency
+from services.clients import get_blob_service_client, get_embeddings
+from services.concurrency import run_blocking, iterate_blocking, get_process_pool
+from services.embedding_cache import embedding_cache
+from services.ingestion import embed_and_index_documents, delete_documents_from_index
+from services.vector_store import get_vector_store
+from services.search_engine import hybrid_search, RETRIEVAL_K
+from services.manifest import hash_file, chunk_id, load_manifest, save_manifest
+from services.prompt import count_tokens
+from services.response_cache import response_cache
+from services.jobs import create_job, get_job, new_spool_path, TERMINAL_STATUSES
+from services.metrics import metrics, span, timed_iter
 
 # Load Environment Variables
 load_dotenv('.env')
@@ -22,58 +37,150 @@ load_dotenv('.env')
 ###############################################################################
 router = APIRouter()
 
+###############################################################################
+# Extraction Settings
+###############################################################################
+# PDFs with at least this many pages are extracted on the process pool (if CPU_WORKER_PROCESSES > 0)
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '50'))
+# Pages per process pool task
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', '25'))
+# Characters buffered before the streaming splitter emits chunks
+SPLIT_BUFFER_CHARS = int(os.getenv('SPLIT_BUFFER_CHARS', '16000'))
+# Bytes copied per read when spooling an upload to disk
+SPOOL_CHUNK_SIZE = int(os.getenv('SPOOL_CHUNK_SIZE', str(1024 * 1024)))
+# Blocks staged in parallel per blob upload
+BLOB_UPLOAD_CONCURRENCY = int(os.getenv('BLOB_UPLOAD_CONCURRENCY', '4'))
 
 ###############################################################################
 # Helper Functions
 ###############################################################################
-# Extracts Text from .docx Files
-def extract_text_from_docx(file_data):
-    file_stream = BytesIO(file_data)
-    doc = Document(file_stream)
-    return "\n".join([para.text for para in doc.paragraphs])
+# Opens a spooled file as a read-only memory-mapped view (pages are loaded on demand)
+@contextmanager
+def open_mapped(path: str):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield f
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield view
 
-# Extracts Text from .pdf Files
-def extract_text_from_pdf(file_data):
-    # init ret var
-    text = ''
-    
-    # init file stream
-    file_stream = BytesIO(file_data)
+# Yields Text from .docx Files paragraph by paragraph
+def iter_text_from_docx(path: str):
+    with open_mapped(path) as view:
+        doc = Document(view)
+        for para in doc.paragraphs:
+            yield para.text + '\n'
+
+# Extracts the text of pdf pages [start, end) (runs in a worker process)
+def extract_text_from_pdf_pages(path: str, start: int, end: int):
+    with open_mapped(path) as view:
+        reader = PdfReader(view)
+        return [reader.pages[i].extract_text() for i in range(start, end)]
+
+# Yields Text from .pdf Files page by page
+def iter_text_from_pdf(path: str):
+    with open_mapped(path) as view:
+        # init pdf reader
+        reader = PdfReader(view)
+        page_count = len(reader.pages)
+        
+        # Large PDFs: extract page ranges on separate cores, yielded in page order
+        process_pool = get_process_pool()
+        if process_pool is not None and page_count >= PDF_PARALLEL_MIN_PAGES:
+            starts = list(range(0, page_count, PDF_PAGES_PER_TASK))
+            ends = [min(start + PDF_PAGES_PER_TASK, page_count) for start in starts]
+            page_ranges = process_pool.map(extract_text_from_pdf_pages, [path] * len(starts), starts, ends)
+        else:
+            page_ranges = ([page.extract_text()] for page in reader.pages)
+        
+        # Iterate through each page and yield its text
+        for page_texts in page_ranges:
+            for page_text in page_texts:
+                if page_text:  # Check if text was extracted
+                    yield page_text + '\n'
+
+# Yields Text from .txt Files line by line
+def iter_text_from_txt(path: str):
+    with open(path, 'r', encoding='utf-8') as f:  # Assuming UTF-8 encoded text file
+        for line in f:
+            yield line
+
+# Yields Text from a spooled file based on its extension
+def iter_text_from_file(path: str, extension: str):
+    if extension == '.txt':
+        return iter_text_from_txt(path)
+    elif extension == '.docx':
+        return iter_text_from_docx(path)
+    elif extension == '.pdf':
+        return iter_text_from_pdf(path)
+    raise ValueError(f"Unsupported file type: {extension}")
+
+# Splits a stream of text pieces into Documents without holding the whole text
+# Splits once SPLIT_BUFFER_CHARS are buffered; the last (possibly partial) chunk is carried over
+# Each Document gets a content-hash 'chunk_id' and its 'token_count' in its metadata
+def iter_documents(text_stream, text_splitter, metadata: dict):
     
-    # init pdf reader
-    reader = PdfReader(file_stream)
+    # Builds the Document for one chunk
+    def make_document(chunk: str):
+        doc_metadata = metadata.copy()
+        doc_metadata['chunk_id'] = chunk_id(metadata['container'], metadata['file_name'], chunk)
+        doc_metadata['token_count'] = count_tokens(chunk)
+        return LangchainDocument(page_content=chunk, metadata=doc_metadata)
     
-    # Iterate through each page and concatenate its text
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text:  # Check if text was extracted
-            text += page_text + '\n'
+    parts = []
+    size = 0
+    chunking = 0.0
+    for piece in text_stream:
+        parts.append(piece)
+        size += len(piece)
+        if size >= SPLIT_BUFFER_CHARS:
+            start = time.perf_counter()
+            chunks = text_splitter.split_text(''.join(parts))
+            documents = [make_document(chunk) for chunk in chunks[:-1]]
+            chunking += time.perf_counter() - start
+            yield from documents
+            parts = [chunks[-1] + '\n'] if chunks else []
+            size = len(parts[0]) if parts else 0
     
-    # Return pdf text
-    return text
+    # Split whatever is left
+    start = time.perf_counter()
+    documents = [make_document(chunk) for chunk in text_splitter.split_text(''.join(parts))]
+    metrics.observe('ingestion_stage_seconds', chunking + time.perf_counter() - start, stage='chunking')
+    yield from documents
 
-# Extracts Text from .txt Files
-def extract_text_from_txt(file_data):
-    return file_data.decode('utf-8')  # Assuming UTF-8 encoded text file
+# Drops repeated chunks and chunks already in the index, recording every chunk id seen
+def filter_new_documents(docs, known_chunk_ids: set, chunk_ids: set):
+    for doc in docs:
+        doc_chunk_id = doc.metadata['chunk_id']
+        if doc_chunk_id in chunk_ids:
+            continue
+        chunk_ids.add(doc_chunk_id)
+        if doc_chunk_id not in known_chunk_ids:
+            yield doc
+
+# Spools an upload to disk in fixed-size chunks (never holds the whole file in memory)
+def spool_upload(source, path: str):
+    source.seek(0)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(source, f, SPOOL_CHUNK_SIZE)
+
+# Uploads a spooled file to blob storage as parallel staged blocks
+def upload_file_to_blob(path: str, index_name: str, file_name: str):
+    container_client = get_blob_service_client().get_container_client(index_name)
+    blob_client = container_client.get_blob_client(file_name)
+    with open(path, 'rb') as f:
+        blob_client.upload_blob(
+            f,
+            length=os.fstat(f.fileno()).st_size,
+            overwrite=True,
+            max_concurrency=BLOB_UPLOAD_CONCURRENCY
+        )
 
 # Chunks and Embeds Text from Files and uploads to vector index store
-def save_text_to_vector_index(text: str, file_name: str, index_name: str):
-    
-    # Use AzureOpenAIEmbeddings with an Azure account
-    embeddings: AzureOpenAIEmbeddings = AzureOpenAIEmbeddings(
-        azure_deployment=os.environ['AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME'],
-        openai_api_version=os.environ['AZURE_OPENAI_API_VERSION'],
-        azure_endpoint=os.environ['AZURE_OPENAI_ENDPOINT'],
-        api_key=os.environ['AZURE_OPENAI_API_KEY'],
-    )
-    
-    # Get Azure AI Search Vector Store Index Instance
-    vector_store: AzureSearch = AzureSearch(
-        azure_search_endpoint=os.environ['AZURE_SEARCH_SERVICE_ENDPOINT'],
-        azure_search_key=os.environ['AZURE_SEARCH_ADMIN_KEY'],
-        index_name=index_name,
-        embedding_function=embeddings.embed_query,
-    )
+# text: the full text, or an iterable of text pieces (pages, paragraphs, lines)
+# known_chunk_ids: chunks already in the index (not re-embedded)
+# chunk_ids: optional set that collects the id of every chunk in the text
+async def save_text_to_vector_index(text, file_name: str, index_name: str, known_chunk_ids: set = None, chunk_ids: set = None):
     
     # Load Recursive Text Splitter
     text_splitter = RecursiveCharacterTextSplitter(
@@ -83,106 +190,192 @@ def save_text_to_vector_index(text: str, file_name: str, index_name: str):
         is_separator_regex=False,
     )
     
-    # Get Documents from Text
-    docs = text_splitter.create_documents([text])
-    
-    # Update Document Metadata
+    # Document Metadata
     updated_metadata = {
         "source": f'/{index_name}/{file_name}',
         "container": index_name,
         "file_name": file_name,
     }
-    for doc in docs:
-        doc.metadata = updated_metadata.copy()
     
-    # Embed & Store Docs in Vector Store
-    vector_store.add_documents(documents=docs)
+    # Stream new Documents from Text (parsing & splitting run off the event loop)
+    text_stream = [text] if isinstance(text, str) else text
+    docs = filter_new_documents(
+        iter_documents(text_stream, text_splitter, updated_metadata),
+        known_chunk_ids or set(),
+        chunk_ids if chunk_ids is not None else set()
+    )
     
-    # Return Success
-    return True
+    # Embed & Store Docs in Vector Store (batched, concurrent, bulk upload)
+    # Return Number of Chunks Indexed
+    return await embed_and_index_documents(iterate_blocking(docs), index_name)
 
-# Returns the n most similar documents to a given query
-def search_vector_index(query: str, index_name: str, n: int = 3):
+# Returns the query's embedding (repeated queries are served from the embedding cache)
+async def embed_query(query: str):
     
-    # Use AzureOpenAIEmbeddings with an Azure account
-    embeddings: AzureOpenAIEmbeddings = AzureOpenAIEmbeddings(
-        azure_deployment=os.environ['AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME'],
-        openai_api_version=os.environ['AZURE_OPENAI_API_VERSION'],
-        azure_endpoint=os.environ['AZURE_OPENAI_ENDPOINT'],
-        api_key=os.environ['AZURE_OPENAI_API_KEY'],
-    )
+    with span('chat_stage_seconds', stage='embedding'):
+        return await embedding_cache.aembed_query(
+            get_embeddings(),
+            os.environ['AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME'],
+            query
+        )
+
+# Returns the n most relevant documents to a given query
+# (hybrid vector + keyword search, reranked and diversified, see services/search_engine.py)
+async def search_vector_index(query: str, index_name: str, n: int = RETRIEVAL_K):
     
-    # Get Azure AI Search Vector Store Index Instance
-    vector_store: AzureSearch = AzureSearch(
-        azure_search_endpoint=os.environ['AZURE_SEARCH_SERVICE_ENDPOINT'],
-        azure_search_key=os.environ['AZURE_SEARCH_ADMIN_KEY'],
-        index_name=index_name,
-        embedding_function=embeddings.embed_query,
-    )
+    # Embed the query (repeated queries are served from the embedding cache)
+    query_vector = await embed_query(query)
     
-    # Perform a similarity search
-    return vector_store.similarity_search(
-        query=query,
-        k=n,
-        search_type="similarity",
-    )
+    # Search the index
+    with span('chat_stage_seconds', stage='search'):
+        results = await hybrid_search(get_vector_store(), index_name, query, query_vector, k=n)
+    
+    # Convert results to the Documents the vector store used to return
+    return [
+        LangchainDocument(
+            page_content=result['content'],
+            metadata=json.loads(result['metadata']) if result.get('metadata') else {}
+        )
+        for result in results
+    ]
+
+# Processes one spooled upload: extract, chunk, embed & index, then upload to blob
+# Unchanged files are skipped and changed files only embed their new chunks
+# Runs on the background ingestion workers; returns the file's number of chunks
+async def process_uploaded_file(user_email: str, index_name: str, file_name: str, path: str, progress):
+    extension = os.path.splitext(file_name)[1].lower()
+    
+    # Compare against the last indexed version of this file
+    await progress(stage='hashing')
+    with span('ingestion_stage_seconds', stage='hashing'):
+        file_hash = await run_blocking(hash_file, path)
+        manifest = await run_blocking(load_manifest, index_name, file_name)
+    known_chunk_ids = set(manifest['chunk_ids']) if manifest else set()
+    if manifest and manifest['file_hash'] == file_hash:
+        await progress(stage='unchanged')
+        return len(known_chunk_ids)
+    
+    # Stream text out of the file while new chunks are embedded
+    await progress(stage='embedding')
+    chunk_ids = set()
+    with span('ingestion_stage_seconds', stage='embedding'):
+        await save_text_to_vector_index(
+            text = timed_iter(iter_text_from_file(path, extension), 'ingestion_stage_seconds', stage='extraction'),
+            file_name = file_name,
+            index_name = index_name,
+            known_chunk_ids = known_chunk_ids,
+            chunk_ids = chunk_ids
+        )
+    
+    # Remove chunks that are no longer in the file
+    removed_chunk_ids = known_chunk_ids - chunk_ids
+    if removed_chunk_ids:
+        await progress(stage='pruning')
+        with span('ingestion_stage_seconds', stage='pruning'):
+            await delete_documents_from_index(removed_chunk_ids, index_name)
+    
+    # Upload File to Azure Blob
+    await progress(stage='uploading', chunks=len(chunk_ids))
+    with span('ingestion_stage_seconds', stage='blob_upload'):
+        await run_blocking(upload_file_to_blob, path, index_name, file_name)
+    
+    # Record the new version last, so a failure above is retried in full next time
+    with span('ingestion_stage_seconds', stage='manifest'):
+        await run_blocking(save_manifest, index_name, file_name, file_hash, list(chunk_ids))
+    
+    # Cached answers may rely on the old version of this file
+    await response_cache.invalidate(index_name)
+    
+    return len(chunk_ids)
 
 ###############################################################################
 # Endpoints
 ###############################################################################
+# Accepts files and queues them for background ingestion; returns a job id to poll
 @router.post('/upload_files', tags=['AI Search'])
 async def upload_files(
     files: list[UploadFile] = File(...),
     user_email: str = Depends(jwt_dependency)
 ):  
-    # Azure Blob Storage Connection Client
-    blob_service_client = BlobServiceClient.from_connection_string(os.getenv('AZURE_BLOB_CONN_STR'))
-    
     # Get Container Name
-    user_continer_name = get_user_container_or_index_name(user_email)
-    
-    # Connect to Container Client
-    container_client = blob_service_client.get_container_client(user_continer_name)
+    user_continer_name = await get_user_container_or_index_name(user_email)
+    if not user_continer_name:
+        raise HTTPException(status_code=404, detail='User container not found.')
     
     # Allowed File Extension Types
     allowed_file_extensions = ['.docx', '.pdf', '.txt']
     
-    # Upload Files
+    # Check File Types before accepting anything
     for file in files:
-        # Check File Type
         extension = os.path.splitext(file.filename)[1].lower()
         if extension not in allowed_file_extensions:
             raise HTTPException(status_code=400, detail=f"Unsupported file type: {extension}")
-        
-        # Read File Data
-        file_data = await file.read()
-        
-        # extract text from file
-        if extension == '.txt':
-            file_text = extract_text_from_txt(file_data)
-        elif extension == '.docx':
-            file_text = extract_text_from_docx(file_data)
-        elif extension == '.pdf':
-            file_text = extract_text_from_pdf(file_data)
-        
-        # Save Text to Vector Index
-        txt_saved_to_index = save_text_to_vector_index(
-            text = file_text,
-            file_name = file.filename,
-            index_name = user_continer_name
-        )
-        
-        # Check if text was saved to index
-        if txt_saved_to_index:
-            # Try and Upload File to Azure Blob
+    
+    # Spool Files to Disk & Queue Ingestion Job (the job owns the spooled files once created)
+    spooled_files = []
+    try:
+        for file in files:
+            path = new_spool_path(file.filename)
+            spooled_files.append((file.filename, path))
+            await run_blocking(spool_upload, file.file, path)
+        job_id = await run_blocking(create_job, user_email, user_continer_name, spooled_files)
+    except BaseException:
+        # Remove what was spooled if a later file (or the job) fails
+        for _, path in spooled_files:
             try:
-                blob_client = container_client.get_blob_client(file.filename)
-                blob_client.upload_blob(file_data, overwrite=True)
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=str(e))
-        else:
-            raise HTTPException(status_code=500, detail='Failed to save text to vector index.')
+                os.remove(path)
+            except OSError:
+                pass
+        raise
     
-    # Return Success
-    return {'status_code': status.HTTP_200_OK, 'detail': 'Files Uploaded Successfully'}
+    # Return Accepted
+    return {
+        'status_code': status.HTTP_202_ACCEPTED,
+        'detail': 'Files Queued for Upload',
+        'job_id': job_id
+    }
 
+# Returns an upload job's status with per-file progress
+@router.get('/upload_jobs/{job_id}', tags=['AI Search'])
+def get_upload_job(job_id: str, user_email: str = Depends(jwt_dependency)):
+    job = get_job(job_id)
+    if not job or job['user_email'] != user_email:
+        raise HTTPException(status_code=404, detail='Upload job not found.')
+    
+    return {'status_code': status.HTTP_200_OK, 'job': job}
+
+# Pushes an upload job's progress until it finishes
+# EXAMPLE FIRST MESSAGE: {"jwt": "<JWT token>"}
+@router.websocket('/ws/upload_jobs/{job_id}')
+async def upload_job_websocket(websocket: WebSocket, job_id: str):
+    await websocket.accept()
+    
+    try:
+        # Authenticate
+        data = await websocket.receive_json()
+        try:
+            user_email = jwt_dependency(authorization=data.get('jwt', ''))
+        except Exception:
+            await websocket.send_text('<<E:INVALID_JWT>>')
+            await websocket.close()
+            return
+        
+        # Push progress whenever it changes
+        last_job = None
+        while True:
+            job = await run_blocking(get_job, job_id)
+            if not job or job['user_email'] != user_email:
+                await websocket.send_text('<<E:NO_JOB>>')
+                break
+            if job != last_job:
+                await websocket.send_json(job)
+                last_job = job
+            if job['status'] in TERMINAL_STATUSES:
+                await websocket.send_text('<<END>>')
+                break
+            await asyncio.sleep(1)
+        
+        await websocket.close()
+    
+    except WebSocketDisconnect:
+        logging.info("Upload Job Websocket Disconnected")
@@ -1,12 +1,15 @@
 # Imports
 from fastapi import APIRouter, status, Depends
 from pydantic import BaseModel
-from azure.cosmos import CosmosClient
 import os
+import re
 from dotenv import load_dotenv
+from azure.cosmos.exceptions import CosmosResourceExistsError
 
 # In-App Dependencies
-from dependencies import create_access_token, jwt_dependency, create_user_blob_container_and_index
+from dependencies import create_access_token, jwt_dependency
+from services.clients import get_cosmos_container, get_async_cosmos_container
+from services.provisioning import provision_user_resources, ProvisioningError
 
 # Load Environment Variables
 load_dotenv('.env')
@@ -19,63 +22,54 @@ router = APIRouter()
 ###############################################################################
 # Endpoints
 ###############################################################################
+# Accepted email addresses (also keeps reserved partition keys such as the provisioning pool's out)
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
 # Register Request Body Class
 class RegisterRequest(BaseModel):
     email: str
     password_hash: str
 
-# Adds User to Database
+# Adds User to Database, then provisions the user's blob container & search index
 @router.post("/auth/register", tags=["Authentication"])
-def register(request: RegisterRequest):
+async def register(request: RegisterRequest):
     email = str(request.email).lower()
+    if not EMAIL_PATTERN.match(email):
+        return {
+            'status': status.HTTP_400_BAD_REQUEST,
+            'detail': 'Invalid Email Address!'
+        }
     try:
-        # Get Cosmos Client
-        client = CosmosClient.from_connection_string(conn_str=os.environ['COSMOS_CONNECTION_STRING'])
-        
-        # Get Cosmos DB
-        database = client.get_database_client(os.environ['COSMOS_DB_NAME'])
-        
         # Get Cosmos Container
-        container = database.get_container_client(os.environ['COSMOS_USERS_CONTAINER_NAME'])
+        container = get_async_cosmos_container(os.environ['COSMOS_USERS_CONTAINER_NAME'])
         
-        # Check if Unique
+        # Create User (fails if not unique)
         try:
-            user = container.read_item(
-                item=f'id-{email}',
-                partition_key=email
-            )
+            await container.create_item(body={
+                'id': f'id-{email}',
+                'UserId': email,
+                'password': request.password_hash
+            })
+        except CosmosResourceExistsError:
             return {
                 'status': status.HTTP_400_BAD_REQUEST,
                 'detail': 'User Already Exists!'
             }
-        except Exception as e:
-            pass
         
-        # Create User
-        container.upsert_item(body={
-            'id': f'id-{email}',
-            'UserId': email,
-            'password': request.password_hash
-        })
-        
-        # Create User Blob Container
-        if create_user_blob_container_and_index(email):
-            # return Success
-            return {
-                'status': status.HTTP_201_CREATED,
-                'detail': 'User Created Successfully!'
-            }
-        else:
+        # Create User Blob Container & Search Index
+        try:
+            await provision_user_resources(email)
+        except ProvisioningError as e:
             # delete user
             try:
-                container.delete_item(
+                await container.delete_item(
                     item=f'id-{email}',
                     partition_key=email
                 )
-            except Exception as e:
+            except Exception as delete_error:
                 return {
                     'status': status.HTTP_400_BAD_REQUEST,
-                    'detail': f'User Creation + Deletion Failed. Error: {e}'
+                    'detail': f'User Creation + Deletion Failed. Error: {delete_error}'
                 }
             
             # return Failure
@@ -83,6 +77,12 @@ def register(request: RegisterRequest):
                 'status': status.HTTP_400_BAD_REQUEST,
                 'detail': f'User Creation Failed 1. Error: {e}'
             }
+        
+        # return Success
+        return {
+            'status': status.HTTP_201_CREATED,
+            'detail': 'User Created Successfully!'
+        }
     
     except Exception as e:
         # return Failure
@@ -101,14 +101,8 @@ class LoginRequest(BaseModel):
 def login(request: LoginRequest):
     email = str(request.email).lower()
     try:
-        # Get Cosmos Client
-        client = CosmosClient.from_connection_string(conn_str=os.environ['COSMOS_CONNECTION_STRING'])
-        
-        # Get Cosmos DB
-        database = client.get_database_client(os.environ['COSMOS_DB_NAME'])
-        
         # Get Cosmos Container
-        container = database.get_container_client(os.environ['COSMOS_USERS_CONTAINER_NAME'])
+        container = get_cosmos_container(os.environ['COSMOS_USERS_CONTAINER_NAME'])
         
         # Find User
         user = container.read_item(
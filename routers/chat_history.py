@@ -1,13 +1,19 @@
 # Imports
-from fastapi import APIRouter, Depends
-from azure.cosmos import CosmosClient
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
 import os
+import json
+import uuid
 from dotenv import load_dotenv
 import logging
 from datetime import datetime
+from azure.cosmos.exceptions import CosmosHttpResponseError, CosmosBatchOperationError
 
 # In-App Dependencies
 from dependencies import jwt_dependency
+from services.clients import get_cosmos_container, get_async_cosmos_container
+from services.prompt import count_tokens
 
 # Load Environment Variables
 load_dotenv('.env')
@@ -17,110 +23,294 @@ load_dotenv('.env')
 ###############################################################################
 router = APIRouter()
 
+###############################################################################
+# Chat Storage Layout
+###############################################################################
+# All items live in the user's partition (UserId):
+# Chat header: {'id': chat_id, 'UserId', 'type': 'chat', 'title', 'created_at', 'last_timestamp', 'turn_count'}
+# Chat turn:   {'id': '<chat_id>-<uuid>', 'UserId', 'type': 'turn', 'ChatId', 'human', 'ai', 'timestamp', 'human_tokens', 'ai_tokens'}
+# Legacy chats (a single document with a 'history' array) are still read until migrated
+CHAT_TYPE = 'chat'
+TURN_TYPE = 'turn'
+TITLE_LENGTH = 80
+MAX_PAGE_SIZE = 100
+
+# Last-N turns of a chat, newest first (single partition, bounded)
+LAST_TURNS_QUERY = (
+    "SELECT TOP @n c.human, c.ai, c.timestamp, c.human_tokens, c.ai_tokens FROM c "
+    "WHERE c.ChatId = @chat_id AND c.type = 'turn' ORDER BY c.timestamp DESC"
+)
+
 ###############################################################################
 # Helper Functions
 ###############################################################################
-# Saves Message to Cosmos Conversation Document
-def save_msg_to_cosmos(chat_id: str, user_email: str, user_query: str,  ai_response: str):
+# Returns a new turn item
+def build_turn_item(chat_id: str, user_email: str, user_query: str, ai_response: str, timestamp: str = None, turn_id: str = None):
+    return {
+        'id': turn_id or f'{chat_id}-{uuid.uuid4().hex}',
+        'UserId': user_email,
+        'type': TURN_TYPE,
+        'ChatId': chat_id,
+        'human': user_query,
+        'ai': ai_response,
+        'timestamp': timestamp or datetime.now().isoformat(),
+        'human_tokens': count_tokens(str(user_query)),
+        'ai_tokens': count_tokens(str(ai_response))
+    }
+
+# Returns a new chat header item
+def build_chat_header(chat_id: str, user_email: str, first_turn: dict, last_turn: dict = None, turn_count: int = 1):
+    last_turn = last_turn or first_turn
+    return {
+        'id': chat_id,
+        'UserId': user_email,
+        'type': CHAT_TYPE,
+        'title': str(first_turn['human'])[:TITLE_LENGTH],
+        'created_at': first_turn['timestamp'],
+        'last_timestamp': last_turn['timestamp'],
+        'turn_count': turn_count
+    }
+
+# Returns the header patch for appended turns (ordered oldest first)
+def header_patch_operations(turns: list):
+    return [
+        {'op': 'incr', 'path': '/turn_count', 'value': len(turns)},
+        {'op': 'set', 'path': '/last_timestamp', 'value': turns[-1]['timestamp']}
+    ]
+
+# Returns True if a batch failed because the chat header does not exist yet
+def _is_missing_header(error: Exception):
+    if isinstance(error, CosmosBatchOperationError):
+        return any(
+            response.get('statusCode') == 404
+            for response in error.operation_responses
+        )
+    return isinstance(error, CosmosHttpResponseError) and error.status_code == 404
+
+# Saves turns of one chat in a single transactional batch: inserts the turn items and
+# bumps the chat header (or creates it for a new chat). Raises on failure.
+async def save_turns_to_cosmos(chat_id: str, user_email: str, turns: list):
+    # Get Cosmos Container
+    container = get_async_cosmos_container(os.environ['COSMOS_CHAT_CONTAINER_NAME'])
+    turns = sorted(turns, key=lambda turn: turn['timestamp'])
+    turn_operations = [('upsert', (turn,)) for turn in turns]
+
+    # Existing Chat: insert turns + patch header
     try:
-        # Get Cosmos Client
-        client = CosmosClient.from_connection_string(conn_str=os.environ['COSMOS_CONNECTION_STRING'])
-        
-        # Get Cosmos DB
-        database = client.get_database_client(os.environ['COSMOS_DB_NAME'])
-        
-        # Get Cosmos Container
-        container = database.get_container_client(os.environ['COSMOS_CHAT_CONTAINER_NAME'])
-        
-        # Check if chat history exists
-        try:
-            # Get Chat History
-            chat = container.read_item(
-                item=chat_id,
-                partition_key=user_email
-            )
-            
-            # Append new msg to history
-            chat['history'].append({
-                'human': user_query,
-                'ai': ai_response,
-                'timestamp': datetime.now().isoformat()
-            })
-            
-            # Update Chat History Cosmos Document
-            container.replace_item(item=chat, body=chat)
-        
-        # If chat history does not exist
-        except:
-            # Create Chat History
-            container.upsert_item(body={
-                'id': chat_id,
-                'UserId': user_email,
-                'history': [{
-                    'human': user_query,
-                    'ai': ai_response,
-                    'timestamp': datetime.now().isoformat()
-                }]
-            })
-            
+        await container.execute_item_batch(
+            batch_operations=turn_operations + [
+                ('patch', (chat_id, header_patch_operations(turns)))
+            ],
+            partition_key=user_email
+        )
+
+    # New Chat: insert turns + create header
+    except Exception as e:
+        if not _is_missing_header(e):
+            raise
+        await container.execute_item_batch(
+            batch_operations=turn_operations + [
+                ('create', (build_chat_header(chat_id, user_email, turns[0], turns[-1], turn_count=len(turns)),))
+            ],
+            partition_key=user_email
+        )
+
+# Saves one chat turn
+async def save_msg_to_cosmos(chat_id: str, user_email: str, user_query: str,  ai_response: str, timestamp: str = None, turn_id: str = None):
+    try:
+        turn = build_turn_item(chat_id, user_email, user_query, ai_response, timestamp, turn_id)
+        await save_turns_to_cosmos(chat_id, user_email, [turn])
     except Exception as e:
         logging.error(f"Error Saving Chat for <{user_email}> to Cosmos: {e}")
 
-# Returns Chat History for stream prompt
-def get_chat_history_by_id(chat_id: str, user_email: str, n: int = 5):
-    
+# Returns Chat History for stream prompt (oldest first), or None for a new chat
+# Raises on Cosmos errors, so callers can tell a failed lookup from an empty chat
+async def get_chat_history_by_id(chat_id: str, user_email: str, n: int = 5):
+
     # Ensure email is lower case
     user_email = user_email.lower()
-    
-    # Try and Get Chat History
-    try:
-        # Get Cosmos Container Client
-        client = CosmosClient.from_connection_string(conn_str=os.environ['COSMOS_CONNECTION_STRING'])
-        database = client.get_database_client(os.environ['COSMOS_DB_NAME'])
-        container = database.get_container_client(os.environ['COSMOS_CHAT_CONTAINER_NAME'])
-        
-        # Get Chat History Object
-        chat_history = container.read_item(
-            item=chat_id,
-            partition_key=user_email
-        )
-        
-        # Return Chat History
-        return chat_history.get("history")[-n:]
-        
-    except Exception as e:
-        return None
+
+    # Get Cosmos Container Client
+    container = get_async_cosmos_container(os.environ['COSMOS_CHAT_CONTAINER_NAME'])
+
+    # Get the last n Turns
+    query_iterable = container.query_items(
+        query=LAST_TURNS_QUERY,
+        parameters=[
+            {'name': '@n', 'value': n},
+            {'name': '@chat_id', 'value': chat_id}
+        ],
+        partition_key=user_email
+    )
+    turns = [turn async for turn in query_iterable]
+    turns.reverse()
+
+    # Fill up from a legacy (not yet migrated) history document
+    if len(turns) < n:
+        try:
+            chat = await container.read_item(item=chat_id, partition_key=user_email)
+            legacy_history = chat.get('history') or []
+            if legacy_history:
+                turns = legacy_history[-(n - len(turns)):] + turns
+        except CosmosHttpResponseError as e:
+            if e.status_code != 404:
+                raise
+
+    # Return Chat History
+    return turns or None
+
+# Chat headers in the user's partition, most recently active first (legacy documents included)
+CHAT_HEADERS_QUERY = (
+    "SELECT * FROM c WHERE c.UserId = @email AND (c.type = 'chat' OR NOT IS_DEFINED(c.type)) "
+    "ORDER BY c._ts DESC"
+)
+# Lightweight listing: projected header fields only (legacy fields are derived from 'history')
+CHAT_SUMMARIES_QUERY = (
+    "SELECT c.id, c.title, c.last_timestamp, c.turn_count, "
+    "ARRAY_LENGTH(c.history) AS legacy_turn_count, c.history[0].human AS legacy_title, "
+    "ARRAY_SLICE(c.history, -1) AS legacy_last FROM c "
+    "WHERE c.UserId = @email AND (c.type = 'chat' OR NOT IS_DEFINED(c.type)) "
+    "ORDER BY c._ts DESC"
+)
+# All turns of the given chats, oldest first
+CHAT_TURNS_QUERY = (
+    "SELECT c.ChatId, c.human, c.ai, c.timestamp FROM c "
+    "WHERE c.type = 'turn' AND ARRAY_CONTAINS(@chat_ids, c.ChatId) ORDER BY c.timestamp ASC"
+)
+
+# Returns the listing fields of a chat (id, title, last timestamp, turn count)
+def summarize_chat(item: dict):
+    legacy_last = item.get('legacy_last') or []
+    legacy_turn_count = item.get('legacy_turn_count') or 0
+    return {
+        'id': item['id'],
+        'title': item.get('title') or str(item.get('legacy_title') or '')[:TITLE_LENGTH],
+        'last_timestamp': max(
+            item.get('last_timestamp') or '',
+            (legacy_last[0].get('timestamp') or '') if legacy_last else ''
+        ) or None,
+        'turn_count': (item.get('turn_count') or 0) + legacy_turn_count
+    }
+
+# Adds the full, ordered 'history' to chat headers (one single-partition query per page)
+def attach_history(container, email: str, chats: list):
+    if not chats:
+        return chats
+    turns = {}
+    for turn in container.query_items(
+        query=CHAT_TURNS_QUERY,
+        parameters=[
+            {'name': '@chat_ids', 'value': [chat['id'] for chat in chats]}
+        ],
+        partition_key=email
+    ):
+        turns.setdefault(turn.pop('ChatId'), []).append(turn)
+    for chat in chats:
+        chat['history'] = (chat.get('history') or []) + turns.get(chat['id'], [])
+    return chats
+
+# Yields pages of a user's chats: (chats, continuation token)
+# page_size None returns every chat in one page
+def iter_chat_pages(email: str, view: str = 'full', page_size: int = None, continuation: str = None):
+    # Get Cosmos Container
+    container = get_cosmos_container(os.environ['COSMOS_CHAT_CONTAINER_NAME'])
+
+    # Parameterized single-partition query
+    pager = container.query_items(
+        query=CHAT_SUMMARIES_QUERY if view == 'summary' else CHAT_HEADERS_QUERY,
+        parameters=[{'name': '@email', 'value': email}],
+        partition_key=email,
+        max_item_count=page_size or -1
+    ).by_page(continuation)
+
+    for page in pager:
+        items = list(page)
+        if view == 'summary':
+            chats = [summarize_chat(item) for item in items]
+        else:
+            chats = attach_history(container, email, items)
+        token = pager.continuation_token
+        yield chats, token
+        if page_size:
+            return
+
+# Streams chats as newline-delimited JSON (last line carries the continuation token)
+def iter_chat_ndjson(email: str, view: str, page_size: int, continuation: str):
+    token = None
+    for chats, token in iter_chat_pages(email, view, page_size, continuation):
+        for chat in chats:
+            yield json.dumps(chat) + '\n'
+    yield json.dumps({'continuation': token}) + '\n'
+
 ###############################################################################
 # Endpoints
 ###############################################################################
 
 # Returns a user's chat history
+# view: 'full' (chats with history) or 'summary' (id, title, last_timestamp, turn_count)
+# page_size/continuation: page through chats (all chats if page_size is not set)
+# format: 'json' or 'ndjson' (streamed, one chat per line)
 @router.get("/all_chat_history", tags=["Chat History"])
-def get_all_chat_history(email: str = Depends(jwt_dependency)):
+def get_all_chat_history(
+    email: str = Depends(jwt_dependency),
+    view: Literal['full', 'summary'] = 'full',
+    page_size: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    continuation: Optional[str] = None,
+    response_format: Literal['json', 'ndjson'] = Query('json', alias='format')
+):
     try:
-        # Get Cosmos Client
-        client = CosmosClient.from_connection_string(conn_str=os.environ['COSMOS_CONNECTION_STRING'])
-        
-        # Get Cosmos DB
-        database = client.get_database_client(os.environ['COSMOS_DB_NAME'])
-        
-        # Get Cosmos Container
-        container = database.get_container_client(os.environ['COSMOS_CHAT_CONTAINER_NAME'])
-        
+        # Stream NDJSON
+        if response_format == 'ndjson':
+            return StreamingResponse(
+                iter_chat_ndjson(email, view, page_size, continuation),
+                media_type='application/x-ndjson'
+            )
+
         # Get Chat History
-        chat_history = container.query_items(
-            query=f"SELECT * FROM c WHERE c.UserId = '{email}'",
-            enable_cross_partition_query=True
-        )
-        
+        chat_history = []
+        token = None
+        for chats, token in iter_chat_pages(email, view, page_size, continuation):
+            chat_history.extend(chats)
+
         # Return Chat History
         return {
             'status': 200,
-            'chat_history': list(chat_history)
+            'chat_history': chat_history,
+            'continuation': token
         }
-    
+
     except Exception as e:
         return {
             'status': 400,
             'detail': f'Error Fetching Chat History. Error: {e}'
-        }
\ No newline at end of file
+        }
+
+# Returns one chat with its full history
+@router.get("/chat_history/{chat_id}", tags=["Chat History"])
+def get_chat_history_detail(chat_id: str, email: str = Depends(jwt_dependency)):
+    try:
+        # Get Cosmos Container
+        container = get_cosmos_container(os.environ['COSMOS_CHAT_CONTAINER_NAME'])
+
+        # Get Chat Header
+        try:
+            chat = container.read_item(item=chat_id, partition_key=email)
+        except CosmosHttpResponseError as e:
+            if e.status_code == 404:
+                return {
+                    'status': 404,
+                    'detail': 'Chat Not Found.'
+                }
+            raise
+
+        # Return Chat & History
+        return {
+            'status': 200,
+            'chat': attach_history(container, email, [chat])[0]
+        }
+
+    except Exception as e:
+        return {
+            'status': 400,
+            'detail': f'Error Fetching Chat History. Error: {e}'
+        }
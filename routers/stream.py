@@ -2,6 +2,7 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from dotenv import load_dotenv
 import os
+import time
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
@@ -9,10 +10,13 @@ from langchain_openai import ChatOpenAI, AzureChatOpenAI
 import logging
 
 # In-App Dependencies
-from dependencies import jwt_dependency, get_user_container_or_index_name
-from routers.chat_history import save_msg_to_cosmos
-from routers.ai_search import search_vector_index
-from routers.chat_history import get_chat_history_by_id
+from services.session import ChatSession
+from services.prompt import build_prompt
+from services.response_cache import response_cache, iter_token_frames
+from routers.ai_search import embed_query
+from services.metrics import metrics, span, start_trace, error_frame, record_error
+from services.streaming import FrameCoalescer, negotiate_frame_mode
+from services.admission import chat_admission, openai_rate_limiter, AdmissionRejected, CHAT, CHAT_QUEUE_TIMEOUT, CHAT_COMPLETION_TOKEN_ESTIMATE
 
 # Load Environment Variables
 load_dotenv('.env')
@@ -22,6 +26,14 @@ load_dotenv('.env')
 ###############################################################################
 router = APIRouter()
 
+###############################################################################
+# Helper Functions
+###############################################################################
+# Sends an error frame (<<E:CODE>>, with the trace id if METRICS_TRACE_IDS is set)
+async def send_error(websocket: WebSocket, code: str):
+    metrics.inc('chat_error_frames_total', code=code)
+    await websocket.send_text(error_frame(code))
+
 ###############################################################################
 # Websocket Connection
 ###############################################################################
@@ -32,104 +44,156 @@ router = APIRouter()
 #   "jwt": "<JWT token>",
 #   "email": "test@test.com"
 # }
+# The JWT may also be sent once at connect time (Authorization header or ?jwt=Bearer%20<token>);
+# messages may then omit "jwt". A token is validated once and again only after it expires.
+# The connection keeps a session (services/session.py): the index name and each chat's recent
+# turns are loaded once and then kept up to date locally; every answer is saved as it completes.
+# Answers are streamed in coalesced frames; send ?frames=token at connect time (or "frames": "token"
+# in a message) for one frame per token. <<END>> and <<E:...>> are always frames of their own.
+# A message that cannot be admitted (see services/admission.py) gets <<E:BUSY>>; the socket stays open.
 @router.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     
-    # Initialize Needed Variables
-    resp = ''
-    premature_disconnect = True
+    # Connection's session (authenticated user, LLM, index name & recent turns)
+    auth_token = websocket.headers.get('authorization') or websocket.query_params.get('jwt')
+    session = ChatSession(auth_token)
+    
+    # Connection's requested frame mode
+    connection_frame_mode = websocket.query_params.get('frames')
+    frames = None
     
     try:
+        # Authenticate at connect time
+        if auth_token:
+            try:
+                session.authenticate()
+            except Exception:
+                await send_error(websocket, 'INVALID_JWT')
+                await websocket.close()
+                return
+        
         while True:
             # Receive data from the Frontend
             data = await websocket.receive_json()
+            received_at = time.perf_counter()
+            start_trace()
             
             # Check if the request data contains proper keys
             if 'query' not in data:
-                await websocket.send_text('<<E:NO_QUERY>>')
+                await send_error(websocket, 'NO_QUERY')
                 break
             if 'chatId' not in data:
-                await websocket.send_text('<<E:NO_CHAT_ID>>')
+                await send_error(websocket, 'NO_CHAT_ID')
                 break
-            if 'jwt' not in data:
-                await websocket.send_text('<<E:INVALID_JWT>>')
+            if 'jwt' not in data and not session.auth_token:
+                await send_error(websocket, 'INVALID_JWT')
                 break
             if 'email' not in data:
-                await websocket.send_text('<<E:NO_EMAIL>>')
+                await send_error(websocket, 'NO_EMAIL')
                 break
             
-            # Ensure the JWT is valid
+            # Ensure the JWT is valid (only re-validated for a new or expired token)
             try:
-                user_email = jwt_dependency(authorization=data['jwt'])
-                if not user_email or user_email.lower() != data['email'].lower():
-                    await websocket.send_text('<<E:INVALID_JWT>>')
-                    break
+                user_email = session.authenticate(data.get('jwt'))
             except Exception as e:
-                await websocket.send_text('<<E:INVALID_JWT>>')
+                await send_error(websocket, 'INVALID_JWT')
+                break
+            if user_email != data['email'].lower():
+                await send_error(websocket, 'INVALID_JWT')
                 break
             
-            # Initialize the LLM
-            llm = AzureChatOpenAI(
-                openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
-                azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
-                temperature=0.7
-            )
-            
-            # Get Chat History using data["chatId"]
-            chat_history_list = get_chat_history_by_id(
-                chat_id=data["chatId"],
-                user_email=user_email.lower()
-            )
-            chat_history_str = ''
-            if chat_history_list:
-                for obj in chat_history_list:
-                    chat_history_str += f'Human: {obj.get("human")}\nai: {obj.get("ai")}\n'
-            
-            # Get Container/Index name
-            index_name = get_user_container_or_index_name(user_email.lower())
-            
-            # Get Context from AI Search
-            similar_docs = search_vector_index(
-                query=data['query'],
-                index_name=index_name
-            )
-            
-            # Create Context String
-            context_str = ''
-            if similar_docs:
-                for doc in similar_docs:
-                    context_str += f'File name: {str(doc.metadata["file_name"])}\nContent:\n```{doc.page_content}```\n'
-            
-            # CREATE PROMPT FOR LLM STREAM
-            prompt = f'You are "Capgemin.AI", a helpful, friendly chatbot. You are here to help the user with any questions they may have. You are knowledgeable and can provide information on a wide range of topics. You are patient and understanding. You are here to help the user and make their experience as positive as possible. Use the chat history and context to help answer questions, if applicable - but do not rely soley on them. Do not mention anything about the context to the user, just use the information it provides if it is relevant to answering the query.\n====\nContext:\n====\n{context_str}\n====\nChat History:\n====\n{chat_history_str}\n====\nCurrent Human Query:\n{str(data["query"])}\n====\nai: '
-            
-            # print(prompt)
-            
-            # Message Complete
-            premature_disconnect = False
-            
-            # Stream the response
-            for token in llm.stream(prompt):
-                await websocket.send_text(token.content)
-                resp += token.content
-            
-            # Send Successful Completion response to the Frontend
-            await websocket.send_text('<<END>>')
+            # Answer once admitted (<<E:BUSY>> if this worker is saturated; the socket stays open)
+            try:
+                async with chat_admission.slot(user_email):
+                    # Get Context (and Chat History & Index Name unless the session has them) concurrently
+                    retrieval = await session.retrieve(chat_id=data['chatId'], query=data['query'])
+                    
+                    # Check the response cache (same index & retrieved chunks, similar query)
+                    query_vector = None
+                    cacheable = response_cache.enabled and bool(retrieval['similar_docs']) and not retrieval['degraded']
+                    cached_response = None
+                    if cacheable:
+                        query_vector = await embed_query(data['query'])
+                        cached_response = await response_cache.get(
+                            user_email, retrieval['index_name'], query_vector, retrieval['similar_docs']
+                        )
+                    
+                    # Frames of this answer (tokens buffered and flushed on size or age)
+                    frame_mode = negotiate_frame_mode(data.get('frames'), connection_frame_mode)
+                    frames = FrameCoalescer(websocket.send_text, mode=frame_mode)
+                    
+                    # Stream the cached response in token-sized pieces
+                    resp = ''
+                    tokens = 0
+                    first_frame_at = None
+                    if cached_response is not None:
+                        for piece in iter_token_frames(cached_response):
+                            await frames.write(piece)
+                            tokens += 1
+                            first_frame_at = first_frame_at or time.perf_counter()
+                        resp = cached_response
+                    
+                    else:
+                        # CREATE PROMPT FOR LLM STREAM (fit to the token budget)
+                        with span('chat_stage_seconds', stage='prompt'):
+                            prompt, usage = build_prompt(
+                                query=data["query"],
+                                similar_docs=retrieval['similar_docs'],
+                                chat_history=retrieval['chat_history']
+                            )
+                        logging.info(f"Prompt token usage for <{user_email}>: {usage}")
+                    
+                        # Wait for Azure OpenAI quota (shared by all workers, chat has priority)
+                        await openai_rate_limiter.acquire(
+                            usage['prompt_tokens'] + CHAT_COMPLETION_TOKEN_ESTIMATE, priority=CHAT, timeout=CHAT_QUEUE_TIMEOUT
+                        )
+                    
+                        # Stream the response
+                        async for token in session.llm.astream(prompt):
+                            await frames.write(token.content)
+                            resp += token.content
+                            tokens += 1
+                            first_frame_at = first_frame_at or time.perf_counter()
+                    
+                        # Cache the response for similar queries
+                        if cacheable and resp.strip() != '':
+                            await response_cache.set(
+                                user_email, retrieval['index_name'], query_vector, retrieval['similar_docs'], resp
+                            )
+                    
+                    # Send Successful Completion response to the Frontend (after the buffered text)
+                    await frames.close()
+                    await websocket.send_text('<<END>>')
+                    
+                    # Record time to first token & generation speed
+                    source = 'cache' if cached_response is not None else 'llm'
+                    metrics.inc('chat_messages_total', source=source)
+                    if first_frame_at is not None:
+                        generation = time.perf_counter() - first_frame_at
+                        metrics.observe('chat_time_to_first_token_seconds', first_frame_at - received_at, source=source)
+                        metrics.observe('chat_generation_seconds', generation, source=source)
+                        if generation > 0:
+                            metrics.observe('chat_tokens_per_second', tokens / generation, source=source)
+                    metrics.inc('chat_frames_total', frames.frames, mode=frame_mode)
+                    
+                    # Queue QUERY & Response for saving (never waits on Cosmos) & add it to the session's history
+                    if resp.strip() != '':
+                        session.record_turn(data['chatId'], data['query'], resp)
+            except AdmissionRejected:
+                await send_error(websocket, 'BUSY')
+                continue
     
     # WebSocket Disconnected
     except WebSocketDisconnect:
         logging.info("Websocket Disconnected")
-        
-        # Save QUERY & Response
-        if not premature_disconnect and resp.strip() != '':
-            save_msg_to_cosmos(
-                chat_id=data['chatId'],
-                user_email=user_email,
-                user_query=data['query'],
-                ai_response=resp
-            )
     
     # Any other Error/Exception
     except Exception as e:
-        logging.error(f"Error in WebSocket Connection: {e}")
\ No newline at end of file
+        record_error('websocket', f"Error in WebSocket Connection: {e}")
+        if frames is not None:
+            frames.discard()
+        try:
+            await send_error(websocket, 'INTERNAL')
+        except Exception:
+            pass
\ No newline at end of file
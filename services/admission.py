@@ -0,0 +1,235 @@
+# Imports
+import os
+import time
+import fcntl
+import struct
+import asyncio
+import tempfile
+from collections import deque
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+# In-App Dependencies
+from services.metrics import metrics
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Admission Settings
+###############################################################################
+# Chat answers streamed at once per worker, and per user per worker
+CHAT_MAX_CONCURRENT = int(os.getenv('CHAT_MAX_CONCURRENT', '64'))
+CHAT_MAX_PER_USER = int(os.getenv('CHAT_MAX_PER_USER', '2'))
+# Chat messages allowed to wait for a slot per worker (more are answered with <<E:BUSY>>)
+CHAT_QUEUE_SIZE = int(os.getenv('CHAT_QUEUE_SIZE', '128'))
+# Seconds a chat message may wait for a slot or for model quota before <<E:BUSY>>
+CHAT_QUEUE_TIMEOUT = float(os.getenv('CHAT_QUEUE_TIMEOUT', '10'))
+# Completion tokens reserved per chat answer against the tokens-per-minute quota
+CHAT_COMPLETION_TOKEN_ESTIMATE = int(os.getenv('CHAT_COMPLETION_TOKEN_ESTIMATE', '512'))
+
+# Azure OpenAI quota shared by all workers on the host (0 disables the limit)
+OPENAI_TPM_LIMIT = int(os.getenv('OPENAI_TPM_LIMIT', '0'))
+OPENAI_RPM_LIMIT = int(os.getenv('OPENAI_RPM_LIMIT', '0'))
+# Share of the quota background ingestion may not use (kept for chat)
+OPENAI_CHAT_RESERVE = float(os.getenv('OPENAI_CHAT_RESERVE', '0.2'))
+# Token bucket state file (shared by all workers on the host)
+OPENAI_RATE_LIMIT_PATH = os.getenv('OPENAI_RATE_LIMIT_PATH', os.path.join(tempfile.gettempdir(), 'openai_rate_limit.bin'))
+
+# Priorities
+CHAT = 'chat'
+BACKGROUND = 'background'
+
+# Raised when a chat message cannot be admitted (queue full or waited too long)
+class AdmissionRejected(Exception):
+    pass
+
+###############################################################################
+# Shared Token Bucket
+###############################################################################
+# Tokens-per-minute & requests-per-minute buckets in a small file, updated under an
+# exclusive file lock so every worker on the host draws from the same quota.
+# Background work only takes quota while more than OPENAI_CHAT_RESERVE of it is left.
+class SharedRateLimiter:
+    STATE = struct.Struct('ddd')  # tpm tokens left, rpm requests left, last refill (epoch secs)
+    LOCK_RETRY_INTERVAL = 0.002  # seconds between tries while another worker holds the lock
+
+    def __init__(self, path: str = OPENAI_RATE_LIMIT_PATH, tpm: int = OPENAI_TPM_LIMIT, rpm: int = OPENAI_RPM_LIMIT, reserve: float = OPENAI_CHAT_RESERVE):
+        self.path = path
+        self.tpm = tpm
+        self.rpm = rpm
+        self.reserve = reserve
+        self._fd = None
+
+    @property
+    def enabled(self):
+        return self.tpm > 0 or self.rpm > 0
+
+    def _file(self):
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        return self._fd
+
+    # Takes the quota if available; otherwise returns the seconds until it could be.
+    # Never blocks the event loop: returns None if another worker holds the lock.
+    def _try_take(self, tokens: int, priority: str):
+        fd = self._file()
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        try:
+            now = time.time()
+            data = os.pread(fd, self.STATE.size, 0)
+            if len(data) == self.STATE.size:
+                tpm_left, rpm_left, updated_at = self.STATE.unpack(data)
+            else:
+                tpm_left, rpm_left, updated_at = float(self.tpm), float(self.rpm), now
+
+            # Refill for the time elapsed
+            elapsed = max(0.0, now - updated_at)
+            tpm_left = min(self.tpm, tpm_left + elapsed * self.tpm / 60)
+            rpm_left = min(self.rpm, rpm_left + elapsed * self.rpm / 60)
+
+            # Background work leaves the reserve for chat
+            floor = self.reserve if priority == BACKGROUND else 0.0
+            tpm_needed = min(tokens, self.tpm) + floor * self.tpm if self.tpm else 0
+            rpm_needed = 1 + floor * self.rpm if self.rpm else 0
+            wait = max(
+                (tpm_needed - tpm_left) * 60 / self.tpm if self.tpm else 0.0,
+                (rpm_needed - rpm_left) * 60 / self.rpm if self.rpm else 0.0,
+            )
+            if wait <= 0:
+                if self.tpm:
+                    tpm_left -= min(tokens, self.tpm)
+                if self.rpm:
+                    rpm_left -= 1
+            os.pwrite(fd, self.STATE.pack(tpm_left, rpm_left, now), 0)
+            return max(0.0, wait)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    # Waits until the quota for one request of `tokens` tokens is taken
+    # Raises AdmissionRejected if that would take longer than timeout seconds
+    async def acquire(self, tokens: int, priority: str = CHAT, timeout: float = None):
+        if not self.enabled:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        start = time.monotonic()
+        while True:
+            wait = self._try_take(tokens, priority)
+            if wait is None:
+                await asyncio.sleep(self.LOCK_RETRY_INTERVAL)
+                continue
+            if wait <= 0:
+                break
+            if deadline is not None and time.monotonic() + wait > deadline:
+                metrics.inc('admission_rejected_total', kind='quota', priority=priority)
+                raise AdmissionRejected('Azure OpenAI quota exhausted')
+            await asyncio.sleep(min(wait, 1.0))
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            metrics.observe('admission_quota_wait_seconds', waited, priority=priority)
+
+###############################################################################
+# Chat Admission (per worker)
+###############################################################################
+# Bounds the chat answers streamed at once (overall and per user) with a bounded FIFO queue
+class ChatAdmission:
+    def __init__(self, max_concurrent: int = CHAT_MAX_CONCURRENT, max_per_user: int = CHAT_MAX_PER_USER, queue_size: int = CHAT_QUEUE_SIZE):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self.active = 0
+        self._active_per_user = {}
+        self._waiters = deque()
+
+    # Number of chat messages waiting for a slot (background work yields while > 0)
+    @property
+    def waiting(self):
+        return len(self._waiters)
+
+    def _can_start(self, user_email: str):
+        return self.active < self.max_concurrent and self._active_per_user.get(user_email, 0) < self.max_per_user
+
+    def _start(self, user_email: str):
+        self.active += 1
+        self._active_per_user[user_email] = self._active_per_user.get(user_email, 0) + 1
+
+    # Wakes the oldest waiters that can now start
+    def _wake(self):
+        for waiter in list(self._waiters):
+            user_email, future = waiter
+            if future.done():
+                self._waiters.remove(waiter)
+            elif self._can_start(user_email):
+                self._waiters.remove(waiter)
+                self._start(user_email)
+                future.set_result(True)
+
+    # Holds a chat slot for the block; raises AdmissionRejected if the queue is full or the wait times out
+    @asynccontextmanager
+    async def slot(self, user_email: str, timeout: float = CHAT_QUEUE_TIMEOUT):
+        if self._can_start(user_email) and not self._waiters:
+            self._start(user_email)
+        else:
+            if len(self._waiters) >= self.queue_size:
+                metrics.inc('admission_rejected_total', kind='queue_full', priority=CHAT)
+                raise AdmissionRejected('Chat queue full')
+            waiter = (user_email, asyncio.get_running_loop().create_future())
+            self._waiters.append(waiter)
+            self._wake()
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter[1]), timeout=timeout)
+            except asyncio.TimeoutError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                if not (waiter[1].done() and not waiter[1].cancelled()):
+                    waiter[1].cancel()
+                    metrics.inc('admission_rejected_total', kind='timeout', priority=CHAT)
+                    raise AdmissionRejected('Timed out waiting for a chat slot')
+            except BaseException:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                if waiter[1].done() and not waiter[1].cancelled():
+                    self._finish(user_email)
+                else:
+                    waiter[1].cancel()
+                raise
+            metrics.observe('admission_queue_wait_seconds', time.monotonic() - start, priority=CHAT)
+        try:
+            yield
+        finally:
+            self._finish(user_email)
+
+    def _finish(self, user_email: str):
+        self.active -= 1
+        remaining = self._active_per_user.get(user_email, 1) - 1
+        if remaining:
+            self._active_per_user[user_email] = remaining
+        else:
+            self._active_per_user.pop(user_email, None)
+        self._wake()
+
+    def stats(self):
+        return {'active': self.active, 'waiting': self.waiting}
+
+###############################################################################
+# Background Priority
+###############################################################################
+# Waits while chat messages are queued on this worker (background work yields to chat)
+async def yield_to_chat(max_wait: float = CHAT_QUEUE_TIMEOUT):
+    deadline = time.monotonic() + max_wait
+    while chat_admission.waiting and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+
+# Worker-wide instances
+chat_admission = ChatAdmission()
+openai_rate_limiter = SharedRateLimiter()
+metrics.register_stats('chat_admission', chat_admission.stats, gauges=('active', 'waiting'))
+
+metrics.describe('admission_rejected_total', 'counter', 'Work rejected by admission control, by reason')
+metrics.describe('admission_queue_wait_seconds', 'histogram', 'Time chat messages waited for a slot')
+metrics.describe('admission_quota_wait_seconds', 'histogram', 'Time spent waiting for Azure OpenAI quota, by priority')
@@ -0,0 +1,127 @@
+# Imports
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Cache Settings
+###############################################################################
+# Optional SQLite file shared by all gunicorn workers on the host (disabled if unset)
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', '')
+
+###############################################################################
+# In-Process LRU/TTL Cache
+###############################################################################
+# Thread-safe LRU cache whose entries expire after a TTL (or a per-entry deadline)
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Returns the cached value, or default if missing/expired
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    # Stores a value; expires_at (epoch secs) overrides the cache-wide TTL
+    def set(self, key, value, expires_at: float = None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # Removes a key if present
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    # Removes all keys
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+###############################################################################
+# Shared Cross-Worker Cache Tier
+###############################################################################
+# SQLite-backed key/value tier so every worker on the host sees the same entries
+class SharedCache:
+    def __init__(self, path: str, namespace: str, ttl: float = None):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+            'expires_at REAL, PRIMARY KEY (namespace, key))'
+        )
+        conn.commit()
+
+    # One connection per thread (sqlite3 connections are not thread-safe)
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    # Returns the cached value, or default if missing/expired
+    def get(self, key: str, default=None):
+        row = self._conn().execute(
+            'SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?',
+            (self.namespace, key)
+        ).fetchone()
+        if row is None:
+            return default
+        if row[1] is not None and row[1] <= time.time():
+            self.delete(key)
+            return default
+        return json.loads(row[0])
+
+    # Stores a JSON-serializable value
+    def set(self, key: str, value, expires_at: float = None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        conn = self._conn()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+            (self.namespace, key, json.dumps(value), expires_at)
+        )
+        conn.commit()
+
+    # Removes a key if present
+    def delete(self, key: str):
+        conn = self._conn()
+        conn.execute('DELETE FROM cache WHERE namespace = ? AND key = ?', (self.namespace, key))
+        conn.commit()
+
+# Returns a shared tier for the namespace, or None if SHARED_CACHE_PATH is not set
+def get_shared_cache(namespace: str, ttl: float = None):
+    if not SHARED_CACHE_PATH:
+        return None
+    return SharedCache(SHARED_CACHE_PATH, namespace, ttl)
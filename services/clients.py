@@ -0,0 +1,256 @@
+# Imports
+import os
+import threading
+import importlib.util
+from collections import OrderedDict
+import aiohttp
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from azure.core.pipeline.transport import RequestsTransport, AioHttpTransport
+from azure.cosmos import CosmosClient
+from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
+from azure.storage.blob import BlobServiceClient
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents.aio import SearchClient
+from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Client Registry Settings
+###############################################################################
+# Max pooled keep-alive connections per Azure service, per gunicorn worker
+AZURE_CLIENT_POOL_SIZE = int(os.getenv('AZURE_CLIENT_POOL_SIZE', '20'))
+# Blob uploads larger than the single-put size are sent as staged blocks of this size
+BLOB_BLOCK_SIZE = int(os.getenv('BLOB_BLOCK_SIZE', str(4 * 1024 * 1024)))
+BLOB_SINGLE_PUT_SIZE = int(os.getenv('BLOB_SINGLE_PUT_SIZE', str(8 * 1024 * 1024)))
+# Use HTTP/2 to Azure OpenAI when the h2 package is installed
+OPENAI_HTTP2 = os.getenv('OPENAI_HTTP2', 'true').lower() == 'true' and importlib.util.find_spec('h2') is not None
+# Max per-index Search clients kept per worker (least recently used are dropped)
+SEARCH_CLIENT_CACHE_SIZE = int(os.getenv('SEARCH_CLIENT_CACHE_SIZE', '128'))
+# Sampling temperature of the chat model
+CHAT_TEMPERATURE = float(os.getenv('CHAT_TEMPERATURE', '0.7'))
+
+# Registry State (one set of clients per worker process)
+_lock = threading.Lock()
+_sessions = []
+_cosmos_client = None
+_blob_service_client = None
+_cosmos_databases = {}
+_cosmos_containers = {}
+_aio_sessions = []
+_async_cosmos_client = None
+_async_cosmos_containers = {}
+_openai_http_client = None
+_chat_llm = None
+_embeddings = {}
+_search_session = None
+_search_clients = OrderedDict()
+
+###############################################################################
+# Helper Functions
+###############################################################################
+# Builds a pooled keep-alive HTTP transport shared by all calls of one client
+def _build_transport():
+    adapter = HTTPAdapter(
+        pool_connections=AZURE_CLIENT_POOL_SIZE,
+        pool_maxsize=AZURE_CLIENT_POOL_SIZE
+    )
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    _sessions.append(session)
+    return RequestsTransport(session=session, session_owner=False)
+
+# Builds a pooled keep-alive aiohttp transport for the async clients
+def _build_async_transport():
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=AZURE_CLIENT_POOL_SIZE)
+    )
+    _aio_sessions.append(session)
+    return AioHttpTransport(session=session, session_owner=False)
+
+###############################################################################
+# Client Accessors
+###############################################################################
+# Returns the worker's Cosmos Client
+def get_cosmos_client():
+    global _cosmos_client
+    if _cosmos_client is None:
+        with _lock:
+            if _cosmos_client is None:
+                _cosmos_client = CosmosClient.from_connection_string(
+                    conn_str=os.environ['COSMOS_CONNECTION_STRING'],
+                    transport=_build_transport()
+                )
+    return _cosmos_client
+
+# Returns a cached Cosmos Database proxy
+def get_cosmos_database(database_name: str = None):
+    database_name = database_name or os.environ['COSMOS_DB_NAME']
+    database = _cosmos_databases.get(database_name)
+    if database is None:
+        database = get_cosmos_client().get_database_client(database_name)
+        _cosmos_databases[database_name] = database
+    return database
+
+# Returns a cached Cosmos Container proxy
+def get_cosmos_container(container_name: str):
+    container = _cosmos_containers.get(container_name)
+    if container is None:
+        container = get_cosmos_database().get_container_client(container_name)
+        _cosmos_containers[container_name] = container
+    return container
+
+# Returns the worker's Blob Service Client
+def get_blob_service_client():
+    global _blob_service_client
+    if _blob_service_client is None:
+        with _lock:
+            if _blob_service_client is None:
+                _blob_service_client = BlobServiceClient.from_connection_string(
+                    os.environ['AZURE_BLOB_CONN_STR'],
+                    transport=_build_transport(),
+                    max_block_size=BLOB_BLOCK_SIZE,
+                    max_single_put_size=BLOB_SINGLE_PUT_SIZE
+                )
+    return _blob_service_client
+
+# Returns the worker's async Cosmos Client (must be called inside the event loop)
+def get_async_cosmos_client():
+    global _async_cosmos_client
+    if _async_cosmos_client is None:
+        _async_cosmos_client = AsyncCosmosClient.from_connection_string(
+            conn_str=os.environ['COSMOS_CONNECTION_STRING'],
+            transport=_build_async_transport()
+        )
+    return _async_cosmos_client
+
+# Returns a cached async Cosmos Container proxy
+def get_async_cosmos_container(container_name: str):
+    container = _async_cosmos_containers.get(container_name)
+    if container is None:
+        database = get_async_cosmos_client().get_database_client(os.environ['COSMOS_DB_NAME'])
+        container = database.get_container_client(container_name)
+        _async_cosmos_containers[container_name] = container
+    return container
+
+# Returns the worker's pooled keep-alive HTTP client for Azure OpenAI (must be called inside the event loop)
+def get_openai_http_client():
+    global _openai_http_client
+    if _openai_http_client is None:
+        _openai_http_client = httpx.AsyncClient(
+            http2=OPENAI_HTTP2,
+            limits=httpx.Limits(
+                max_connections=AZURE_CLIENT_POOL_SIZE,
+                max_keepalive_connections=AZURE_CLIENT_POOL_SIZE
+            )
+        )
+    return _openai_http_client
+
+# Returns the worker's chat model
+def get_chat_llm():
+    global _chat_llm
+    if _chat_llm is None:
+        _chat_llm = AzureChatOpenAI(
+            openai_api_version=os.environ["AZURE_OPENAI_API_VERSION"],
+            azure_deployment=os.environ["AZURE_OPENAI_CHAT_DEPLOYMENT_NAME"],
+            temperature=CHAT_TEMPERATURE,
+            http_async_client=get_openai_http_client()
+        )
+    return _chat_llm
+
+# Returns the worker's embeddings client (one per batch size)
+def get_embeddings(chunk_size: int = None):
+    embeddings = _embeddings.get(chunk_size)
+    if embeddings is None:
+        options = {'chunk_size': chunk_size} if chunk_size else {}
+        embeddings = AzureOpenAIEmbeddings(
+            azure_deployment=os.environ['AZURE_OPENAI_EMBEDDING_DEPLOYMENT_NAME'],
+            openai_api_version=os.environ['AZURE_OPENAI_API_VERSION'],
+            azure_endpoint=os.environ['AZURE_OPENAI_ENDPOINT'],
+            api_key=os.environ['AZURE_OPENAI_API_KEY'],
+            http_async_client=get_openai_http_client(),
+            **options
+        )
+        _embeddings[chunk_size] = embeddings
+    return embeddings
+
+# Returns a cached async Search client for the index; all of them share one connection pool
+# Evicted clients are only dropped (the pool is closed at shutdown), so in-flight calls finish
+def get_search_client(index_name: str):
+    global _search_session
+    search_client = _search_clients.get(index_name)
+    if search_client is not None:
+        _search_clients.move_to_end(index_name)
+        return search_client
+
+    if _search_session is None:
+        _search_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=AZURE_CLIENT_POOL_SIZE)
+        )
+    search_client = SearchClient(
+        endpoint=os.environ['AZURE_SEARCH_SERVICE_ENDPOINT'],
+        index_name=index_name,
+        credential=AzureKeyCredential(os.environ['AZURE_SEARCH_ADMIN_KEY']),
+        transport=AioHttpTransport(session=_search_session, session_owner=False)
+    )
+    _search_clients[index_name] = search_client
+    while len(_search_clients) > SEARCH_CLIENT_CACHE_SIZE:
+        _search_clients.popitem(last=False)
+    return search_client
+
+###############################################################################
+# Lifespan Hooks
+###############################################################################
+# Builds all clients up front so the first request does not pay for it
+def init_clients():
+    get_cosmos_client()
+    get_cosmos_database()
+    get_blob_service_client()
+
+# Builds the async clients and models on the worker's event loop
+async def init_async_clients():
+    get_async_cosmos_client()
+    get_openai_http_client()
+    get_chat_llm()
+    get_embeddings()
+
+# Closes the async clients and their pooled connections
+async def close_async_clients():
+    global _async_cosmos_client, _openai_http_client, _chat_llm, _search_session
+    if _async_cosmos_client is not None:
+        await _async_cosmos_client.close()
+    for session in _aio_sessions:
+        await session.close()
+    _aio_sessions.clear()
+    _async_cosmos_containers.clear()
+    _async_cosmos_client = None
+
+    # Models & Search clients
+    _search_clients.clear()
+    if _search_session is not None:
+        await _search_session.close()
+    if _openai_http_client is not None:
+        await _openai_http_client.aclose()
+    _embeddings.clear()
+    _search_session = None
+    _openai_http_client = None
+    _chat_llm = None
+
+# Closes all clients and their pooled connections
+def close_clients():
+    global _cosmos_client, _blob_service_client
+    with _lock:
+        if _blob_service_client is not None:
+            _blob_service_client.close()
+        for session in _sessions:
+            session.close()
+        _sessions.clear()
+        _cosmos_containers.clear()
+        _cosmos_databases.clear()
+        _cosmos_client = None
+        _blob_service_client = None
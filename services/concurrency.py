@@ -0,0 +1,82 @@
+# Imports
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dotenv import load_dotenv
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Bounded Thread & Process Pools
+###############################################################################
+# Max threads per worker for blocking work that has no async equivalent
+SYNC_WORKER_THREADS = int(os.getenv('SYNC_WORKER_THREADS', '16'))
+# Processes per worker for CPU-bound work such as page-parallel PDF extraction (0 disables)
+CPU_WORKER_PROCESSES = int(os.getenv('CPU_WORKER_PROCESSES', '0'))
+
+_executor = None
+_process_pool = None
+
+# Returns the worker's bounded thread pool
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=SYNC_WORKER_THREADS,
+            thread_name_prefix='sync-worker'
+        )
+    return _executor
+
+# Runs a blocking function on the bounded thread pool without stalling the event loop
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+# Iterates a blocking iterator from async code, pulling up to batch_size items per thread hop
+async def iterate_blocking(iterable, batch_size: int = 32):
+    iterator = iter(iterable)
+
+    # Pulls the next batch of items (empty when exhausted)
+    def next_batch():
+        batch = []
+        for item in iterator:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                break
+        return batch
+
+    while True:
+        batch = await run_blocking(next_batch)
+        if not batch:
+            return
+        for item in batch:
+            yield item
+
+# Returns the worker's process pool, or None if CPU_WORKER_PROCESSES is 0
+def get_process_pool():
+    global _process_pool
+    if _process_pool is None and CPU_WORKER_PROCESSES > 0:
+        _process_pool = ProcessPoolExecutor(max_workers=CPU_WORKER_PROCESSES)
+    return _process_pool
+
+# Returns True if a process id is still running (used to spot exited workers' leftovers)
+def pid_alive(pid: int):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+# Shuts the thread and process pools down on worker exit
+def shutdown_executor():
+    global _executor, _process_pool
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True)
+        _process_pool = None
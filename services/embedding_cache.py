@@ -0,0 +1,182 @@
+# Imports
+import os
+import fcntl
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+import numpy as np
+from dotenv import load_dotenv
+
+# In-App Dependencies
+from services.cache import TTLCache
+from services.concurrency import run_blocking
+from services.metrics import metrics
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Embedding Cache Settings
+###############################################################################
+EMBEDDING_DIMENSIONS = 1536
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '4096'))
+# Optional directory for the on-disk tier (disabled if unset)
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', '')
+# Number of vectors kept on disk before the oldest slots are reused
+EMBEDDING_CACHE_DISK_SLOTS = int(os.getenv('EMBEDDING_CACHE_DISK_SLOTS', '100000'))
+
+###############################################################################
+# Helper Functions
+###############################################################################
+# Normalizes query text so trivially different queries share an entry
+def normalize_query(text: str):
+    text = unicodedata.normalize('NFKC', text)
+    return ' '.join(text.split()).casefold()
+
+# Content-addressed cache key for (deployment, normalized query)
+def embedding_cache_key(deployment: str, text: str):
+    payload = f'{deployment}\x00{normalize_query(text)}'.encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+###############################################################################
+# On-Disk Tier
+###############################################################################
+# Memory-mapped float32 vector file + SQLite key -> slot index, used as a ring buffer
+class DiskEmbeddingStore:
+    def __init__(self, directory: str, slots: int, dimensions: int = EMBEDDING_DIMENSIONS):
+        os.makedirs(directory, exist_ok=True)
+        self.slots = slots
+        self.dimensions = dimensions
+        self.index_path = os.path.join(directory, 'index.sqlite')
+        vectors_path = os.path.join(directory, f'vectors_{dimensions}.f32')
+
+        # Map the vector file (created zero-filled on first use). Workers starting together
+        # create and size it under a lock and never truncate a file another worker has mapped.
+        fd = os.open(vectors_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            if os.fstat(fd).st_size < slots * dimensions * 4:
+                os.ftruncate(fd, slots * dimensions * 4)
+        finally:
+            os.close(fd)
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode='r+', shape=(slots, dimensions))
+
+        # Create slot index
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS slots ('
+            'key TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, ready INTEGER NOT NULL DEFAULT 0)'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('next_slot', 0)")
+        conn.commit()
+
+    # One connection per thread (sqlite3 connections are not thread-safe)
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    # Returns a copy of the stored vector or None. The slot is checked again after the copy
+    # (seqlock style): if another worker reclaimed it meanwhile, the copy may be another key's vector.
+    def get(self, key: str):
+        conn = self._conn()
+        row = conn.execute(
+            'SELECT slot FROM slots WHERE key = ? AND ready = 1', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        vector = np.array(self.vectors[row[0]])
+        if conn.execute('SELECT 1 FROM slots WHERE key = ? AND slot = ? AND ready = 1', (key, row[0])).fetchone() is None:
+            return None
+        return vector
+
+    # Claims the next ring-buffer slot for key and writes the vector into it
+    def set(self, key: str, vector):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT ready FROM slots WHERE key = ?', (key,)).fetchone()
+            if row is not None and row[0]:
+                conn.execute('ROLLBACK')
+                return
+            if row is not None:
+                # Never published (a crash, or a writer still at it): claim a fresh slot
+                conn.execute('DELETE FROM slots WHERE key = ?', (key,))
+            slot = conn.execute("SELECT value FROM meta WHERE name = 'next_slot'").fetchone()[0]
+            conn.execute('DELETE FROM slots WHERE slot = ?', (slot,))
+            conn.execute('INSERT INTO slots (key, slot, ready) VALUES (?, ?, 0)', (key, slot))
+            conn.execute("UPDATE meta SET value = ? WHERE name = 'next_slot'", ((slot + 1) % self.slots,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        # Write the vector, then publish it (only if the key still owns this slot)
+        self.vectors[slot] = np.asarray(vector, dtype=np.float32)
+        self.vectors.flush()
+        conn.execute('UPDATE slots SET ready = 1 WHERE key = ? AND slot = ?', (key, slot))
+
+###############################################################################
+# Query Embedding Cache
+###############################################################################
+# Bounded in-memory LRU in front of an optional on-disk store, with hit/miss counters
+class EmbeddingCache:
+    def __init__(self, maxsize: int = EMBEDDING_CACHE_SIZE, disk_store: DiskEmbeddingStore = None):
+        self.memory = TTLCache(maxsize=maxsize)
+        self.disk = disk_store
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # Returns the cached embedding for query or computes it through embeddings.aembed_query
+    async def aembed_query(self, embeddings, deployment: str, query: str):
+        key = embedding_cache_key(deployment, query)
+
+        # Check Memory
+        vector = self.memory.get(key)
+        if vector is not None:
+            self.memory_hits += 1
+            return vector
+
+        # Check Disk
+        if self.disk is not None:
+            stored = await run_blocking(self.disk.get, key)
+            if stored is not None:
+                self.disk_hits += 1
+                vector = stored.tolist()
+                self.memory.set(key, vector)
+                return vector
+
+        # Embed & Store
+        self.misses += 1
+        vector = await embeddings.aembed_query(query)
+        self.memory.set(key, vector)
+        if self.disk is not None:
+            await run_blocking(self.disk.set, key, vector)
+        return vector
+
+    # Hit/miss metrics
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            'memory_entries': len(self.memory),
+        }
+
+# Worker-wide cache instance
+embedding_cache = EmbeddingCache(
+    disk_store=DiskEmbeddingStore(EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_DISK_SLOTS) if EMBEDDING_CACHE_DIR else None
+)
+metrics.register_stats(
+    'embedding_cache', embedding_cache.stats,
+    counters=('memory_hits', 'disk_hits', 'misses'), gauges=('memory_entries',)
+)
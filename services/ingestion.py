@@ -0,0 +1,202 @@
+# Imports
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import openai
+from dotenv import load_dotenv
+from azure.core.exceptions import HttpResponseError
+
+# In-App Dependencies
+from services.clients import get_embeddings
+from services.vector_store import get_vector_store
+from services.metrics import span
+from services.prompt import count_tokens
+from services.admission import openai_rate_limiter, yield_to_chat, BACKGROUND
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Ingestion Settings
+###############################################################################
+# Chunks sent per embeddings API call
+EMBEDDING_BATCH_SIZE = int(os.getenv('EMBEDDING_BATCH_SIZE', '16'))
+# Embedding batches in flight at once (per ingestion)
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv('EMBEDDING_MAX_CONCURRENCY', '4'))
+# Documents per AI Search upload call (service max is 1000)
+SEARCH_UPLOAD_BATCH_SIZE = int(os.getenv('SEARCH_UPLOAD_BATCH_SIZE', '500'))
+# Attempts per batch before giving up on rate limiting
+INGESTION_MAX_RETRIES = int(os.getenv('INGESTION_MAX_RETRIES', '8'))
+
+###############################################################################
+# Adaptive Backoff
+###############################################################################
+# Shared by all batches of one ingestion: a 429 on any batch pauses them all and
+# lowers the number of batches in flight; successes slowly raise it back
+class AdaptiveBackoff:
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self.delay = 1.0
+        self._resume_at = 0.0
+
+    # Waits out any active pause
+    async def wait(self):
+        remaining = self._resume_at - time.monotonic()
+        if remaining > 0:
+            await asyncio.sleep(remaining)
+
+    # Records a rate-limit response (retry_after in seconds, if the service sent one)
+    def throttled(self, retry_after: float = None):
+        delay = retry_after if retry_after else self.delay * (1 + random.random())
+        self._resume_at = max(self._resume_at, time.monotonic() + delay)
+        self.delay = min(self.delay * 2, 60.0)
+        self.concurrency = max(1, self.concurrency // 2)
+        return delay
+
+    # Records a successful call
+    def succeeded(self):
+        self.delay = max(1.0, self.delay / 2)
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+# Returns the Retry-After seconds from a throttled response, if present
+def _retry_after(response):
+    try:
+        return float(response.headers.get('retry-after'))
+    except Exception:
+        return None
+
+###############################################################################
+# Helper Functions
+###############################################################################
+# Returns the embeddings client used for ingestion
+def get_ingestion_embeddings():
+    return get_embeddings(chunk_size=EMBEDDING_BATCH_SIZE)
+
+# Wraps an in-memory iterable as an async iterable
+async def _as_async_iterable(iterable):
+    for item in iterable:
+        yield item
+
+# Embeds one batch of documents through the batch API, backing off on 429s
+# (yields to queued chat messages and only uses quota outside the chat reserve)
+async def _embed_batch(embeddings, documents: list, backoff: AdaptiveBackoff):
+    tokens = sum(doc.metadata.get('token_count') or count_tokens(doc.page_content) for doc in documents)
+    for attempt in range(INGESTION_MAX_RETRIES):
+        await backoff.wait()
+        await yield_to_chat()
+        await openai_rate_limiter.acquire(tokens, priority=BACKGROUND)
+        try:
+            with span('ingestion_batch_seconds', kind='embedding'):
+                vectors = await embeddings.aembed_documents(
+                    [doc.page_content for doc in documents],
+                    chunk_size=len(documents)
+                )
+            backoff.succeeded()
+            return [
+                {
+                    'id': doc.metadata.get('chunk_id') or uuid.uuid4().hex,
+                    'content': doc.page_content,
+                    'content_vector': vector,
+                    'metadata': json.dumps(doc.metadata),
+                }
+                for doc, vector in zip(documents, vectors)
+            ]
+        except openai.RateLimitError as e:
+            delay = backoff.throttled(_retry_after(e.response))
+            logging.warning(f"Embedding batch throttled (attempt {attempt + 1}), backing off {delay:.1f}s")
+    raise RuntimeError(f'Embedding batch still throttled after {INGESTION_MAX_RETRIES} attempts')
+
+# Uploads one batch of documents to the vector store, backing off on 429/503s
+async def _upload_batch(index_name: str, documents: list, backoff: AdaptiveBackoff):
+    for attempt in range(INGESTION_MAX_RETRIES):
+        await backoff.wait()
+        try:
+            with span('ingestion_batch_seconds', kind='index'):
+                return await get_vector_store().add(index_name, documents)
+        except HttpResponseError as e:
+            if e.status_code not in (429, 503):
+                raise
+            delay = backoff.throttled(_retry_after(e.response))
+            logging.warning(f"Index upload throttled (attempt {attempt + 1}), backing off {delay:.1f}s")
+    raise RuntimeError(f'Index upload still throttled after {INGESTION_MAX_RETRIES} attempts')
+
+###############################################################################
+# Ingestion Engine
+###############################################################################
+# Embeds documents in concurrent batches and bulk-uploads them to the vector store
+# documents: any iterable or async iterable of langchain Documents (consumed incrementally)
+# Returns: number of documents indexed
+async def embed_and_index_documents(documents, index_name: str):
+    embeddings = get_ingestion_embeddings()
+    backoff = AdaptiveBackoff(EMBEDDING_MAX_CONCURRENCY)
+    pending = set()
+    upload_buffer = []
+    batch = []
+    indexed = 0
+
+    # Moves finished embedding batches to the upload buffer and flushes full uploads
+    async def collect(done, flush_all=False):
+        nonlocal indexed
+        for task in done:
+            upload_buffer.extend(task.result())
+        while len(upload_buffer) >= SEARCH_UPLOAD_BATCH_SIZE or (flush_all and upload_buffer):
+            chunk = upload_buffer[:SEARCH_UPLOAD_BATCH_SIZE]
+            del upload_buffer[:SEARCH_UPLOAD_BATCH_SIZE]
+            indexed += await _upload_batch(index_name, chunk, backoff)
+
+    # Schedules one embedding batch, waiting while too many are in flight
+    async def schedule(documents_batch):
+        nonlocal pending
+        while len(pending) >= backoff.concurrency:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            await collect(done)
+        pending.add(asyncio.create_task(_embed_batch(embeddings, documents_batch, backoff)))
+
+    # Accept plain iterables as well as async streams
+    if not hasattr(documents, '__aiter__'):
+        documents = _as_async_iterable(documents)
+
+    try:
+        async for doc in documents:
+            batch.append(doc)
+            if len(batch) >= EMBEDDING_BATCH_SIZE:
+                await schedule(batch)
+                batch = []
+        if batch:
+            await schedule(batch)
+
+        # Drain remaining batches
+        if pending:
+            done, pending = await asyncio.wait(pending)
+            await collect(done)
+        await collect([], flush_all=True)
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return indexed
+
+# Deletes documents from the index by id, in bulk batches
+async def delete_documents_from_index(document_ids, index_name: str):
+    document_ids = list(document_ids)
+    backoff = AdaptiveBackoff(1)
+    deleted = 0
+    for start in range(0, len(document_ids), SEARCH_UPLOAD_BATCH_SIZE):
+        batch = document_ids[start:start + SEARCH_UPLOAD_BATCH_SIZE]
+        for attempt in range(INGESTION_MAX_RETRIES):
+            await backoff.wait()
+            try:
+                deleted += await get_vector_store().delete(index_name, batch)
+                break
+            except HttpResponseError as e:
+                if e.status_code not in (429, 503):
+                    raise
+                backoff.throttled(_retry_after(e.response))
+        else:
+            raise RuntimeError(f'Index delete still throttled after {INGESTION_MAX_RETRIES} attempts')
+    return deleted
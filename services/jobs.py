@@ -0,0 +1,295 @@
+# Imports
+import os
+import time
+import uuid
+import sqlite3
+import asyncio
+import logging
+import tempfile
+import threading
+from dotenv import load_dotenv
+
+# In-App Dependencies
+from services.concurrency import run_blocking, pid_alive
+from services.metrics import metrics, record_error
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Job Settings
+###############################################################################
+# Directory holding the job database and spooled upload files (shared by all workers)
+INGESTION_JOB_DIR = os.getenv('INGESTION_JOB_DIR', os.path.join(tempfile.gettempdir(), 'ingestion_jobs'))
+# Files processed concurrently per gunicorn worker
+INGESTION_WORKERS = int(os.getenv('INGESTION_WORKERS', '2'))
+# Seconds an idle ingestion worker waits before polling for new files
+INGESTION_POLL_INTERVAL = float(os.getenv('INGESTION_POLL_INTERVAL', '1'))
+# Files processed at once per user, and overall, across all workers (0 = unlimited)
+INGESTION_MAX_PER_USER = int(os.getenv('INGESTION_MAX_PER_USER', '2'))
+INGESTION_MAX_GLOBAL = int(os.getenv('INGESTION_MAX_GLOBAL', '0'))
+
+# File & Job statuses
+QUEUED = 'queued'
+PROCESSING = 'processing'
+COMPLETED = 'completed'
+FAILED = 'failed'
+COMPLETED_WITH_ERRORS = 'completed_with_errors'
+TERMINAL_STATUSES = (COMPLETED, FAILED, COMPLETED_WITH_ERRORS)
+
+###############################################################################
+# Job Store
+###############################################################################
+_local = threading.local()
+
+# One connection per thread (sqlite3 connections are not thread-safe)
+def _conn():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(INGESTION_JOB_DIR, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(INGESTION_JOB_DIR, 'jobs.sqlite'), timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        _local.conn = conn
+    return conn
+
+# Creates the job tables
+def init_job_store():
+    conn = _conn()
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS jobs ('
+        'id TEXT PRIMARY KEY, user_email TEXT NOT NULL, index_name TEXT NOT NULL, '
+        'status TEXT NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)'
+    )
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS job_files ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, job_id TEXT NOT NULL, file_name TEXT NOT NULL, '
+        'path TEXT NOT NULL, status TEXT NOT NULL, stage TEXT, chunks INTEGER NOT NULL DEFAULT 0, '
+        'error TEXT, claimed_by INTEGER, updated_at REAL NOT NULL)'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS job_files_status ON job_files (status, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS job_files_job ON job_files (job_id)')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS index_generations ('
+        'index_name TEXT PRIMARY KEY, generation INTEGER NOT NULL)'
+    )
+
+# Returns a new spool path for an uploaded file
+def new_spool_path(file_name: str):
+    os.makedirs(os.path.join(INGESTION_JOB_DIR, 'files'), exist_ok=True)
+    extension = os.path.splitext(file_name)[1].lower()
+    return os.path.join(INGESTION_JOB_DIR, 'files', f'{uuid.uuid4().hex}{extension}')
+
+# Creates a job for already-spooled files; files: [(file_name, path)]
+def create_job(user_email: str, index_name: str, files: list):
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn = _conn()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(
+            'INSERT INTO jobs (id, user_email, index_name, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, user_email, index_name, QUEUED, now, now)
+        )
+        conn.executemany(
+            'INSERT INTO job_files (job_id, file_name, path, status, updated_at) VALUES (?, ?, ?, ?, ?)',
+            [(job_id, file_name, path, QUEUED, now) for file_name, path in files]
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return job_id
+
+# Returns a job with per-file progress, or None
+def get_job(job_id: str):
+    conn = _conn()
+    job = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    if job is None:
+        return None
+    files = conn.execute(
+        'SELECT file_name, status, stage, chunks, error FROM job_files WHERE job_id = ? ORDER BY id',
+        (job_id,)
+    ).fetchall()
+    return {
+        'job_id': job['id'],
+        'user_email': job['user_email'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+        'files': [dict(file) for file in files],
+        'total_chunks': sum(file['chunks'] for file in files),
+        'failed_files': sum(1 for file in files if file['status'] == FAILED),
+    }
+
+# Atomically claims the oldest queued file for this worker
+def _claim_next_file():
+    conn = _conn()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Nothing is claimed while the global limit is reached
+        if INGESTION_MAX_GLOBAL > 0:
+            (processing,) = conn.execute('SELECT COUNT(*) FROM job_files WHERE status = ?', (PROCESSING,)).fetchone()
+            if processing >= INGESTION_MAX_GLOBAL:
+                conn.execute('COMMIT')
+                return None
+        # Oldest queued file of a user below their limit (one user's large upload can't starve the others),
+        # skipping files whose name is being processed for the same index: they share a manifest,
+        # so uploads of one file name are ingested one after another
+        row = conn.execute(
+            'SELECT f.id, f.job_id, f.file_name, f.path, j.user_email, j.index_name '
+            'FROM job_files f JOIN jobs j ON j.id = f.job_id '
+            'WHERE f.status = ? AND (? <= 0 OR ('
+            '  SELECT COUNT(*) FROM job_files pf JOIN jobs pj ON pj.id = pf.job_id '
+            '  WHERE pf.status = ? AND pj.user_email = j.user_email'
+            ') < ?) AND NOT EXISTS ('
+            '  SELECT 1 FROM job_files sf JOIN jobs sj ON sj.id = sf.job_id '
+            '  WHERE sf.status = ? AND sj.index_name = j.index_name AND sf.file_name = f.file_name'
+            ') ORDER BY f.id LIMIT 1',
+            (QUEUED, INGESTION_MAX_PER_USER, PROCESSING, INGESTION_MAX_PER_USER, PROCESSING)
+        ).fetchone()
+        if row is None:
+            conn.execute('COMMIT')
+            return None
+        now = time.time()
+        conn.execute(
+            'UPDATE job_files SET status = ?, claimed_by = ?, updated_at = ? WHERE id = ?',
+            (PROCESSING, os.getpid(), now, row['id'])
+        )
+        conn.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?', (PROCESSING, now, row['job_id']))
+        conn.execute('COMMIT')
+        return dict(row)
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+# Records progress for a file (stage name and/or chunk count)
+def _update_file(file_id: int, stage: str = None, chunks: int = None):
+    _conn().execute(
+        'UPDATE job_files SET stage = COALESCE(?, stage), chunks = COALESCE(?, chunks), updated_at = ? WHERE id = ?',
+        (stage, chunks, time.time(), file_id)
+    )
+
+# Marks a file done/failed (with its final chunk count) and rolls the job status up once all files are finished
+def _finish_file(file_id: int, job_id: str, status: str, error: str = None, chunks: int = None):
+    conn = _conn()
+    now = time.time()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(
+            'UPDATE job_files SET status = ?, error = ?, stage = NULL, chunks = COALESCE(?, chunks), updated_at = ? WHERE id = ?',
+            (status, error, chunks, now, file_id)
+        )
+        counts = dict(conn.execute(
+            'SELECT status, COUNT(*) FROM job_files WHERE job_id = ? GROUP BY status', (job_id,)
+        ).fetchall())
+        if not counts.get(QUEUED) and not counts.get(PROCESSING):
+            if not counts.get(FAILED):
+                job_status = COMPLETED
+            elif not counts.get(COMPLETED):
+                job_status = FAILED
+            else:
+                job_status = COMPLETED_WITH_ERRORS
+            conn.execute('UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?', (job_status, now, job_id))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+# Records that an index's documents changed; returns its new generation.
+# Every worker reads generations from here, so a change made by one is seen by all.
+def bump_index_generation(index_name: str):
+    generation = time.time_ns()
+    _conn().execute(
+        'INSERT INTO index_generations (index_name, generation) VALUES (?, ?) '
+        'ON CONFLICT (index_name) DO UPDATE SET generation = MAX(generation, excluded.generation)',
+        (index_name, generation)
+    )
+    return generation
+
+# Returns an index's generation (0 if its documents never changed)
+def get_index_generation(index_name: str):
+    row = _conn().execute('SELECT generation FROM index_generations WHERE index_name = ?', (index_name,)).fetchone()
+    return row['generation'] if row else 0
+
+# Requeues files left mid-processing by workers that have exited (e.g. max_requests recycle)
+def requeue_orphaned_files():
+    conn = _conn()
+    rows = conn.execute('SELECT id, claimed_by FROM job_files WHERE status = ?', (PROCESSING,)).fetchall()
+    orphaned = [row['id'] for row in rows if row['claimed_by'] is None or not pid_alive(row['claimed_by'])]
+    for file_id in orphaned:
+        conn.execute(
+            'UPDATE job_files SET status = ?, stage = NULL, chunks = 0, claimed_by = NULL, updated_at = ? '
+            'WHERE id = ? AND status = ?',
+            (QUEUED, time.time(), file_id, PROCESSING)
+        )
+    return len(orphaned)
+
+###############################################################################
+# Worker Pool
+###############################################################################
+_worker_tasks = []
+
+# Ingests one claimed file and records its outcome
+# processor: async (user_email, index_name, file_name, path, progress) -> chunk count
+async def _process_file(processor, file: dict):
+
+    # Reports stage/chunk progress for this file
+    async def progress(stage: str = None, chunks: int = None):
+        await run_blocking(_update_file, file['id'], stage, chunks)
+
+    try:
+        chunks = await processor(
+            file['user_email'], file['index_name'], file['file_name'], file['path'], progress
+        )
+        status, error = COMPLETED, None
+    except asyncio.CancelledError:
+        # Keep the spooled file so the file can be requeued
+        raise
+    except Exception as e:
+        record_error('ingestion', f"Ingestion of <{file['file_name']}> for job <{file['job_id']}> failed: {e}")
+        chunks, status, error = None, FAILED, str(e)
+    await run_blocking(_finish_file, file['id'], file['job_id'], status, error, chunks)
+
+    # Metrics never change the recorded outcome
+    try:
+        metrics.inc('ingestion_files_total', outcome=status)
+        if status == COMPLETED:
+            metrics.inc('ingestion_bytes_total', os.path.getsize(file['path']))
+    except OSError:
+        pass
+
+    # Remove the spooled file once it is finished either way
+    try:
+        os.remove(file['path'])
+    except OSError:
+        pass
+
+# Processes queued files until cancelled; an error (e.g. a locked job store) never ends the task
+async def _ingestion_worker(processor):
+    while True:
+        try:
+            file = await run_blocking(_claim_next_file)
+            if file is None:
+                await asyncio.sleep(INGESTION_POLL_INTERVAL)
+                continue
+            await _process_file(processor, file)
+        except Exception as e:
+            record_error('ingestion', f"Ingestion worker error (retrying in {INGESTION_POLL_INTERVAL}s): {e}")
+            await asyncio.sleep(INGESTION_POLL_INTERVAL)
+
+# Starts this worker's ingestion tasks
+async def start_ingestion_workers(processor):
+    await run_blocking(init_job_store)
+    requeued = await run_blocking(requeue_orphaned_files)
+    if requeued:
+        logging.info(f"Requeued {requeued} orphaned ingestion files")
+    for _ in range(INGESTION_WORKERS):
+        _worker_tasks.append(asyncio.create_task(_ingestion_worker(processor)))
+
+# Stops this worker's ingestion tasks (in-flight files are requeued by the next worker to start)
+async def stop_ingestion_workers():
+    for task in _worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
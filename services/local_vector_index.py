@@ -0,0 +1,436 @@
+# Imports
+import os
+import re
+import time
+import fcntl
+import shutil
+import sqlite3
+import threading
+import numpy as np
+from dotenv import load_dotenv
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Local Index Settings
+###############################################################################
+# Rows scored per matrix product during exact search
+LOCAL_VECTOR_SEARCH_BLOCK = int(os.getenv('LOCAL_VECTOR_SEARCH_BLOCK', '65536'))
+# Indexes with at least this many vectors are searched through IVF lists instead of exactly
+LOCAL_VECTOR_IVF_MIN_ROWS = int(os.getenv('LOCAL_VECTOR_IVF_MIN_ROWS', '50000'))
+# IVF lists probed per query (more is slower and closer to exact)
+LOCAL_VECTOR_IVF_PROBES = int(os.getenv('LOCAL_VECTOR_IVF_PROBES', '8'))
+
+INITIAL_CAPACITY = 1024
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_SIZE = 10000
+# IVF lists are retrained once live rows reach this multiple of the rows they were trained on
+IVF_RETRAIN_GROWTH = 4
+
+###############################################################################
+# Helper Functions
+###############################################################################
+# Returns unit-length float32 rows
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors[None, :]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+# Indexes of the k largest scores, best first
+def top_k(scores, k: int):
+    if len(scores) <= k:
+        return np.argsort(-scores)
+    best = np.argpartition(-scores, k)[:k]
+    return best[np.argsort(-scores[best])]
+
+# Trains IVF centroids on a sample of rows with a few rounds of spherical k-means
+def train_centroids(vectors, rows, lists: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(vectors[np.sort(rng.choice(rows, size=min(len(rows), KMEANS_SAMPLE_SIZE), replace=False))])
+    centroids = sample[rng.choice(len(sample), size=lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(lists):
+            members = sample[assignments == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids
+
+###############################################################################
+# Local Vector Index
+###############################################################################
+# One index on local disk: vectors in a memory-mapped float32 file, ids/content/metadata
+# in a SQLite sidecar. Writers are serialized by SQLite (BEGIN IMMEDIATE) and every write
+# bumps a version, so readers in other workers reload only when something changed.
+# Deleted rows leave a hole in the vector file until holes outnumber live rows.
+# Compaction writes a new vector file; readers hold a shared lock on the file they map, and
+# a replaced file is removed by a later write once no reader holds it any more.
+class LocalVectorIndex:
+    def __init__(self, directory: str, index_name: str, dimensions: int):
+        if not re.fullmatch(r'[a-z0-9][a-z0-9-]*', index_name):
+            raise ValueError(f'Invalid index name: {index_name}')
+        self.path = os.path.join(directory, index_name)
+        self.dimensions = dimensions
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        # Reader state (reloaded when the version changes)
+        self._state = None
+
+    # Returns True if the index was created
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, 'sidecar.sqlite'))
+
+    # One connection per thread (sqlite3 connections are not thread-safe)
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.path, 'sidecar.sqlite'), timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    # Returns a meta value
+    def _meta(self, conn, name: str):
+        return conn.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()[0]
+
+    # Maps a vector file (capacity follows the file size)
+    def _map(self, file_name: str, mode: str = 'r+'):
+        path = os.path.join(self.path, file_name)
+        rows = os.path.getsize(path) // (self.dimensions * 4)
+        return np.memmap(path, dtype=np.float32, mode=mode, shape=(rows, self.dimensions))
+
+    ###########################################################################
+    # Management
+    ###########################################################################
+    # Creates an empty index (for an existing index, only adds what older versions lack)
+    def create(self):
+        os.makedirs(self.path, exist_ok=True)
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS docs ('
+                'row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, content TEXT NOT NULL, metadata TEXT)'
+            )
+
+            # Full-text index over content (kept in sync by triggers, built for older indexes)
+            has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'docs_fts'").fetchone()
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(content, content='docs', content_rowid='row')")
+            conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS docs_fts_insert AFTER INSERT ON docs BEGIN '
+                'INSERT INTO docs_fts (rowid, content) VALUES (new.row, new.content); END'
+            )
+            conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS docs_fts_delete AFTER DELETE ON docs BEGIN '
+                "INSERT INTO docs_fts (docs_fts, rowid, content) VALUES ('delete', old.row, old.content); END"
+            )
+            conn.execute(
+                'CREATE TRIGGER IF NOT EXISTS docs_fts_update AFTER UPDATE ON docs BEGIN '
+                "INSERT INTO docs_fts (docs_fts, rowid, content) VALUES ('delete', old.row, old.content); "
+                'INSERT INTO docs_fts (rowid, content) VALUES (new.row, new.content); END'
+            )
+            if not has_fts:
+                conn.execute("INSERT INTO docs_fts (docs_fts) VALUES ('rebuild')")
+
+            if conn.execute("SELECT 1 FROM meta WHERE name = 'vectors_file'").fetchone() is None:
+                file_name = f'vectors.{time.time_ns()}.f32'
+                with open(os.path.join(self.path, file_name), 'wb') as f:
+                    f.truncate(INITIAL_CAPACITY * self.dimensions * 4)
+                conn.executemany('INSERT INTO meta (name, value) VALUES (?, ?)', [
+                    ('version', 0), ('vectors_file', file_name), ('next_row', 0), ('dimensions', self.dimensions)
+                ])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # Releases this worker's reader state (and its lock on the vector file)
+    def close(self):
+        with self._lock:
+            if self._state is not None:
+                os.close(self._state['pin_fd'])
+                self._state = None
+
+    # Deletes the index and its files
+    def drop(self):
+        self.close()
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    ###########################################################################
+    # Writes
+    ###########################################################################
+    # Adds or replaces documents: [{'id', 'content', 'content_vector', 'metadata'}]
+    def add(self, documents: list):
+        if not documents:
+            return 0
+        vectors = normalize_rows([doc['content_vector'] for doc in documents])
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Replaced ids leave a hole
+            conn.executemany('DELETE FROM docs WHERE id = ?', [(doc['id'],) for doc in documents])
+
+            # Grow the vector file if needed
+            file_name = self._meta(conn, 'vectors_file')
+            start = self._meta(conn, 'next_row')
+            path = os.path.join(self.path, file_name)
+            capacity = os.path.getsize(path) // (self.dimensions * 4)
+            if start + len(documents) > capacity:
+                capacity = max(start + len(documents), capacity * 2)
+                os.truncate(path, capacity * self.dimensions * 4)
+
+            # Write vectors before publishing their rows
+            mapped = self._map(file_name)
+            mapped[start:start + len(documents)] = vectors
+            mapped.flush()
+            del mapped
+            conn.executemany(
+                'INSERT INTO docs (row, id, content, metadata) VALUES (?, ?, ?, ?)',
+                [
+                    (start + i, doc['id'], doc['content'], doc.get('metadata'))
+                    for i, doc in enumerate(documents)
+                ]
+            )
+            conn.execute("UPDATE meta SET value = ? WHERE name = 'next_row'", (start + len(documents),))
+            conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'version'")
+            self._remove_unpinned_files(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._compact_if_sparse()
+        return len(documents)
+
+    # Deletes documents by id
+    def delete(self, ids):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            deleted = conn.executemany('DELETE FROM docs WHERE id = ?', [(i,) for i in ids]).rowcount
+            conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'version'")
+            self._remove_unpinned_files(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._compact_if_sparse()
+        return deleted
+
+    # Rewrites the vector file without holes once they outnumber live rows
+    def _compact_if_sparse(self):
+        conn = self._conn()
+        live = conn.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
+        if self._meta(conn, 'next_row') - live <= max(live, INITIAL_CAPACITY):
+            return
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = np.array([row for (row,) in conn.execute('SELECT row FROM docs ORDER BY row')], dtype=np.int64)
+            old_file = self._meta(conn, 'vectors_file')
+            new_file = f'vectors.{time.time_ns()}.f32'
+            with open(os.path.join(self.path, new_file), 'wb') as f:
+                f.truncate(max(len(rows) * 2, INITIAL_CAPACITY) * self.dimensions * 4)
+            mapped = self._map(new_file)
+            old = self._map(old_file, mode='r')
+            for start in range(0, len(rows), LOCAL_VECTOR_SEARCH_BLOCK):
+                block = old[rows[start:start + LOCAL_VECTOR_SEARCH_BLOCK]]
+                mapped[start:start + len(block)] = block
+            mapped.flush()
+            del old
+            del mapped
+
+            # Renumber rows (through negatives to keep the primary key unique)
+            conn.executemany('UPDATE docs SET row = ? WHERE row = ?', [(-i - 1, int(row)) for i, row in enumerate(rows)])
+            conn.execute('UPDATE docs SET row = -row - 1')
+            conn.executemany('UPDATE meta SET value = ? WHERE name = ?', [
+                (new_file, 'vectors_file'), (len(rows), 'next_row')
+            ])
+            conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'version'")
+            self._remove_unpinned_files(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # Removes replaced vector files no reader holds any more (call inside a write transaction,
+    # so the current file is settled and no compaction is writing a new one)
+    def _remove_unpinned_files(self, conn):
+        current_file = self._meta(conn, 'vectors_file')
+        for file_name in os.listdir(self.path):
+            if not file_name.startswith('vectors.') or file_name == current_file:
+                continue
+            path = os.path.join(self.path, file_name)
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.remove(path)
+            except BlockingIOError:
+                pass  # still mapped by a reader at an older version
+            finally:
+                os.close(fd)
+
+    ###########################################################################
+    # Reads
+    ###########################################################################
+    # Takes a shared lock on a vector file for as long as this worker maps it
+    def _pin(self, file_name: str):
+        fd = os.open(os.path.join(self.path, file_name), os.O_RDONLY)
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        return fd
+
+    # Returns the reader state for the version visible in conn's read transaction,
+    # reloading the mapping and live rows if another writer changed the index
+    def _snapshot(self, conn):
+        version = self._meta(conn, 'version')
+        with self._lock:
+            state = self._state
+            if state is not None and state['version'] == version:
+                return state
+
+            # Reload (the same vector file keeps its lock, mapping and IVF centroids)
+            file_name = self._meta(conn, 'vectors_file')
+            live_rows = np.array([row for (row,) in conn.execute('SELECT row FROM docs ORDER BY row')], dtype=np.int64)
+            same_file = state is not None and state['vectors_file'] == file_name
+            pin_fd = state['pin_fd'] if same_file else self._pin(file_name)
+            try:
+                vectors = state['vectors'] if same_file else None
+                if vectors is None or (len(live_rows) and live_rows[-1] >= len(vectors)):
+                    vectors = self._map(file_name, mode='r')
+                ivf = None
+                if len(live_rows) >= LOCAL_VECTOR_IVF_MIN_ROWS:
+                    ivf = self._build_ivf(vectors, live_rows, state['ivf'] if same_file else None)
+            except BaseException:
+                if not same_file:
+                    os.close(pin_fd)  # a leaked lock would keep the file forever
+                raise
+            if state is not None and not same_file:
+                os.close(state['pin_fd'])  # the replaced file can go once every reader moved on
+            self._state = {
+                'version': version, 'vectors_file': file_name, 'pin_fd': pin_fd,
+                'vectors': vectors, 'live_rows': live_rows, 'ivf': ivf
+            }
+            return self._state
+
+    # Groups live rows into IVF lists. Centroids are trained per vector file (compaction
+    # retrains) and again once the index grows IVF_RETRAIN_GROWTH times past them (so the list
+    # count keeps up with sqrt(rows)); otherwise only rows added since the previous state are
+    # assigned, since rows are append-only within a file (a replaced document gets a new row).
+    def _build_ivf(self, vectors, rows, previous: dict = None):
+        assignments = np.empty(len(rows), dtype=np.int32)
+        if previous is not None and len(rows) < IVF_RETRAIN_GROWTH * previous['trained_rows']:
+            centroids = previous['centroids']
+            trained_rows = previous['trained_rows']
+            known = rows < previous['assigned_upto']
+            assignments[known] = previous['assignments'][np.searchsorted(previous['assigned_rows'], rows[known])]
+            new = np.flatnonzero(~known)
+        else:
+            centroids = train_centroids(vectors, rows, lists=int(np.sqrt(len(rows))))
+            trained_rows = len(rows)
+            new = np.arange(len(rows))
+
+        # Assign new rows in blocks
+        for start in range(0, len(new), LOCAL_VECTOR_SEARCH_BLOCK):
+            positions = new[start:start + LOCAL_VECTOR_SEARCH_BLOCK]
+            assignments[positions] = np.argmax(vectors[rows[positions]] @ centroids.T, axis=1)
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        return {
+            'centroids': centroids, 'trained_rows': trained_rows, 'assigned_rows': rows, 'assignments': assignments,
+            'assigned_upto': int(rows[-1]) + 1, 'rows': rows[order], 'offsets': offsets
+        }
+
+    # Returns the candidate rows for a query (all live rows, or the probed IVF lists)
+    def _candidates(self, state: dict, query):
+        ivf = state['ivf']
+        if ivf is None:
+            return state['live_rows']
+        probes = top_k(ivf['centroids'] @ query, LOCAL_VECTOR_IVF_PROBES)
+        return np.concatenate([ivf['rows'][ivf['offsets'][i]:ivf['offsets'][i + 1]] for i in probes])
+
+    # Returns the k most similar documents: [{'id', 'content', 'metadata', 'score'}] (cosine, best first)
+    def search(self, vector, k: int):
+        query = normalize_rows(vector)[0]
+
+        # One read transaction, so row numbers match the sidecar even during a compaction
+        conn = self._conn()
+        conn.execute('BEGIN')
+        try:
+            try:
+                state = self._snapshot(conn)
+            except FileNotFoundError:
+                # A compaction removed the file this transaction still sees; look again
+                conn.execute('COMMIT')
+                conn.execute('BEGIN')
+                state = self._snapshot(conn)
+            vectors = state['vectors']
+            candidates = self._candidates(state, query)
+            if not len(candidates):
+                return []
+
+            # Batched dot products, keeping the running top k
+            best_rows = np.empty(0, dtype=np.int64)
+            best_scores = np.empty(0, dtype=np.float32)
+            for start in range(0, len(candidates), LOCAL_VECTOR_SEARCH_BLOCK):
+                rows = candidates[start:start + LOCAL_VECTOR_SEARCH_BLOCK]
+                scores = vectors[rows] @ query
+                best = top_k(scores, k)
+                best_rows = np.concatenate([best_rows, rows[best]])
+                best_scores = np.concatenate([best_scores, scores[best]])
+                keep = top_k(best_scores, k)
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+            # Fetch documents from the sidecar
+            found = {
+                row: (doc_id, content, metadata)
+                for row, doc_id, content, metadata in conn.execute(
+                    f'SELECT row, id, content, metadata FROM docs WHERE row IN ({",".join("?" * len(best_rows))})',
+                    [int(row) for row in best_rows]
+                )
+            }
+        finally:
+            conn.execute('COMMIT')
+
+        return [
+            {'id': found[row][0], 'content': found[row][1], 'metadata': found[row][2], 'score': float(score)}
+            for row, score in zip(best_rows.tolist(), best_scores.tolist())
+            if row in found
+        ]
+
+    # Returns the k best keyword (BM25) matches: [{'id', 'content', 'metadata', 'score'}] (best first)
+    def keyword_search(self, text: str, k: int):
+        terms = re.findall(r'\w+', text.lower())
+        if not terms:
+            return []
+        match = ' OR '.join(f'"{term}"' for term in dict.fromkeys(terms))
+        return [
+            {'id': doc_id, 'content': content, 'metadata': metadata, 'score': -rank}
+            for doc_id, content, metadata, rank in self._conn().execute(
+                'SELECT docs.id, docs.content, docs.metadata, bm25(docs_fts) AS rank '
+                'FROM docs_fts JOIN docs ON docs.row = docs_fts.rowid '
+                'WHERE docs_fts MATCH ? ORDER BY rank LIMIT ?',
+                (match, k)
+            )
+        ]
+
+    # Document/row counts and search mode
+    def stats(self):
+        conn = self._conn()
+        return {
+            'documents': conn.execute('SELECT COUNT(*) FROM docs').fetchone()[0],
+            'rows': self._meta(conn, 'next_row'),
+            'ivf': self._state is not None and self._state['ivf'] is not None,
+        }
@@ -0,0 +1,50 @@
+# Imports
+import json
+import hashlib
+from azure.core.exceptions import ResourceNotFoundError
+
+# In-App Dependencies
+from services.clients import get_blob_service_client
+
+###############################################################################
+# Upload Manifest
+###############################################################################
+# Each indexed file has a manifest blob in the user's container:
+#   {"file_name": str, "file_hash": sha256 of the file, "chunk_ids": [ids of its index documents]}
+# Chunk ids are content hashes, so unchanged chunks keep their id across uploads
+MANIFEST_PREFIX = '.manifests/'
+HASH_READ_SIZE = 1024 * 1024
+
+# Returns the sha256 of a file on disk
+def hash_file(path: str):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_READ_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Returns the index document id for a chunk of a file
+def chunk_id(index_name: str, file_name: str, content: str):
+    payload = f'{index_name}\x00{file_name}\x00{content}'.encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+# Returns the manifest blob name for a file
+def _manifest_blob_name(file_name: str):
+    return MANIFEST_PREFIX + hashlib.sha256(file_name.encode('utf-8')).hexdigest() + '.json'
+
+# Returns the file's manifest, or None if it was never indexed
+def load_manifest(index_name: str, file_name: str):
+    container_client = get_blob_service_client().get_container_client(index_name)
+    try:
+        data = container_client.get_blob_client(_manifest_blob_name(file_name)).download_blob().readall()
+    except ResourceNotFoundError:
+        return None
+    return json.loads(data)
+
+# Saves the file's manifest
+def save_manifest(index_name: str, file_name: str, file_hash: str, chunk_ids: list):
+    container_client = get_blob_service_client().get_container_client(index_name)
+    container_client.get_blob_client(_manifest_blob_name(file_name)).upload_blob(
+        json.dumps({'file_name': file_name, 'file_hash': file_hash, 'chunk_ids': sorted(chunk_ids)}),
+        overwrite=True
+    )
@@ -0,0 +1,345 @@
+# Imports
+import os
+import json
+import time
+import uuid
+import fcntl
+import asyncio
+import logging
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# In-App Dependencies
+from services.concurrency import run_blocking, pid_alive
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Metrics Settings
+###############################################################################
+# Serve Prometheus metrics on /metrics
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+# Directory where every worker writes its metrics snapshot (shared by all workers on the host)
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'metrics'))
+# Seconds between snapshot writes
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+# Append the message's trace id to WebSocket error frames (<<E:CODE:trace_id>>)
+METRICS_TRACE_IDS = os.getenv('METRICS_TRACE_IDS', 'false').lower() == 'true'
+
+# Histogram bucket upper bounds (seconds), +Inf is implied
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Snapshot of workers that exited, so counters never go backwards
+ARCHIVE_FILE = 'metrics.archive.json'
+
+###############################################################################
+# Trace IDs
+###############################################################################
+_trace_id = contextvars.ContextVar('trace_id', default=None)
+
+# Starts a new trace for the current request/message; returns its id
+def start_trace():
+    trace_id = uuid.uuid4().hex[:16]
+    _trace_id.set(trace_id)
+    return trace_id
+
+# Returns the current trace id (None outside a trace)
+def current_trace_id():
+    return _trace_id.get()
+
+# WebSocket error frame, tagged with the trace id if METRICS_TRACE_IDS is set
+def error_frame(code: str):
+    trace_id = current_trace_id()
+    if METRICS_TRACE_IDS and trace_id:
+        return f'<<E:{code}:{trace_id}>>'
+    return f'<<E:{code}>>'
+
+###############################################################################
+# Multiprocess Registry
+###############################################################################
+# Per-worker counters, gauges & histograms; each worker writes a snapshot file and
+# /metrics merges the files of all workers on the host
+class MetricsRegistry:
+    def __init__(self, directory: str = METRICS_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._descriptions = {}
+        self._collectors = []
+
+    # Records a metric's type, help text and (for histograms) buckets
+    def describe(self, name: str, kind: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self._descriptions[name] = {'kind': kind, 'help': help_text, 'buckets': list(buckets)}
+
+    # Adds to a counter
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    # Adds an observation to a histogram
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = self._descriptions.get(name, {}).get('buckets', LATENCY_BUCKETS)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': list(buckets), 'counts': [0] * (len(buckets) + 1), 'sum': 0.0}
+            index = next((i for i, bound in enumerate(histogram['buckets']) if value <= bound), len(histogram['buckets']))
+            histogram['counts'][index] += 1
+            histogram['sum'] += value
+
+    # Registers a function returning [(name, kind, value, labels)] read at snapshot time
+    def register_collector(self, collector):
+        self._collectors.append(collector)
+
+    # Exposes a component's stats() dict: counter keys as <prefix>_<key>_total, gauge keys as <prefix>_<key>
+    # (keys that already start with the prefix are not prefixed twice)
+    def register_stats(self, prefix: str, stats, counters: tuple = (), gauges: tuple = ()):
+        def name(key: str):
+            return key if key.startswith(f'{prefix}_') else f'{prefix}_{key}'
+
+        def collect():
+            values = stats()
+            return [(f'{name(key)}_total', 'counter', values[key], {}) for key in counters] + \
+                   [(name(key), 'gauge', values[key], {}) for key in gauges]
+        self.register_collector(collect)
+
+    # This worker's metrics as a JSON-serializable dict
+    def snapshot(self):
+        with self._lock:
+            counters = [[name, dict(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [
+                [name, dict(labels), histogram['buckets'], list(histogram['counts']), histogram['sum']]
+                for (name, labels), histogram in self._histograms.items()
+            ]
+        gauges = []
+        for collector in self._collectors:
+            try:
+                for name, kind, value, labels in collector():
+                    (counters if kind == 'counter' else gauges).append([name, labels, value])
+            except Exception as e:
+                logging.warning(f"Metrics collector failed: {e}")
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms, 'descriptions': self._descriptions}
+
+    # Path of a worker's snapshot file
+    def _path(self, pid: int):
+        return os.path.join(self.directory, f'metrics.{pid}.json')
+
+    # Writes this worker's snapshot (atomically)
+    def flush(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(os.getpid())
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    # Returns the merged snapshot of every worker on the host (workers that exited are folded into the archive)
+    def collect_all(self):
+        self.flush()
+        lock_fd = os.open(os.path.join(self.directory, 'metrics.lock'), os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            archive = _read_snapshot(os.path.join(self.directory, ARCHIVE_FILE))
+            live = []
+            exited = []
+            for file_name in os.listdir(self.directory):
+                parts = file_name.split('.')
+                if len(parts) != 3 or parts[0] != 'metrics' or parts[2] != 'json' or not parts[1].isdigit():
+                    continue
+                snapshot = _read_snapshot(os.path.join(self.directory, file_name))
+                if pid_alive(int(parts[1])):
+                    live.append(snapshot)
+                else:
+                    exited.append((file_name, snapshot))
+
+            # Fold exited workers' counters & histograms into the archive (their gauges are gone)
+            if exited:
+                archive = merge_snapshots([archive] + [dict(snapshot, gauges=[]) for _, snapshot in exited])
+                with open(os.path.join(self.directory, f'{ARCHIVE_FILE}.tmp'), 'w', encoding='utf-8') as f:
+                    json.dump(archive, f)
+                os.replace(os.path.join(self.directory, f'{ARCHIVE_FILE}.tmp'), os.path.join(self.directory, ARCHIVE_FILE))
+                for file_name, _ in exited:
+                    os.remove(os.path.join(self.directory, file_name))
+        finally:
+            os.close(lock_fd)
+        return merge_snapshots([archive] + live)
+
+    # Prometheus text exposition of the host's merged metrics
+    def render(self):
+        return render_prometheus(self.collect_all())
+
+# Reads a snapshot file (empty if missing or unreadable)
+def _read_snapshot(path: str):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'counters': [], 'gauges': [], 'histograms': [], 'descriptions': {}}
+
+# Sums snapshots of several workers (counters, gauges and histogram buckets add up)
+def merge_snapshots(snapshots: list):
+    counters = {}
+    gauges = {}
+    histograms = {}
+    descriptions = {}
+    for snapshot in snapshots:
+        descriptions.update(snapshot.get('descriptions', {}))
+        for target, entries in ((counters, snapshot.get('counters', [])), (gauges, snapshot.get('gauges', []))):
+            for name, labels, value in entries:
+                key = (name, tuple(sorted(labels.items())))
+                target[key] = target.get(key, 0) + value
+        for name, labels, buckets, counts, total in snapshot.get('histograms', []):
+            key = (name, tuple(sorted(labels.items())))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = [buckets, list(counts), total]
+            elif merged[0] == buckets:
+                merged[1] = [a + b for a, b in zip(merged[1], counts)]
+                merged[2] += total
+    return {
+        'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+        'gauges': [[name, dict(labels), value] for (name, labels), value in gauges.items()],
+        'histograms': [[name, dict(labels), *histogram] for (name, labels), histogram in histograms.items()],
+        'descriptions': descriptions,
+    }
+
+# Escapes a label value for the text format
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# Formats a label set ({'a': 'b'} -> '{a="b"}')
+def _labels(labels: dict):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + '}'
+
+# Renders a merged snapshot in the Prometheus text format
+def render_prometheus(snapshot: dict):
+    families = {}
+    for kind in ('counters', 'gauges', 'histograms'):
+        for entry in snapshot.get(kind, []):
+            families.setdefault(entry[0], (kind, []))[1].append(entry)
+
+    lines = []
+    descriptions = snapshot.get('descriptions', {})
+    for name in sorted(families):
+        kind, entries = families[name]
+        if name in descriptions:
+            lines.append(f"# HELP {name} {descriptions[name]['help']}")
+        lines.append(f"# TYPE {name} {kind[:-1]}")
+        for entry in entries:
+            if kind != 'histograms':
+                lines.append(f'{name}{_labels(entry[1])} {entry[2]}')
+                continue
+            _, labels, buckets, counts, total = entry
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(dict(labels, le=bound))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+# Worker-wide registry
+metrics = MetricsRegistry()
+
+###############################################################################
+# Instrumentation Helpers
+###############################################################################
+# Times a block into a histogram (seconds); failures also count in <name>_errors_total
+# e.g. with span('chat_stage_seconds', stage='embedding'): ...
+@contextmanager
+def span(name: str, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        metrics.inc(f"{name.removesuffix('_seconds')}_errors_total", **labels)
+        raise
+    finally:
+        metrics.observe(name, time.perf_counter() - start, **labels)
+
+# Times the work done producing a (blocking) iterator's items; observed once when it is exhausted or closed
+def timed_iter(iterable, name: str, **labels):
+    iterator = iter(iterable)
+    elapsed = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed += time.perf_counter() - start
+            yield item
+    finally:
+        metrics.observe(name, elapsed, **labels)
+
+# Logs an error with the current trace id and counts it in errors_total{source}
+def record_error(source: str, message: str):
+    trace_id = current_trace_id()
+    logging.error(f"{message} [trace {trace_id}]" if trace_id else message)
+    metrics.inc('errors_total', source=source)
+
+###############################################################################
+# Snapshot Writer
+###############################################################################
+_flush_task = None
+
+# Writes this worker's snapshot every METRICS_FLUSH_INTERVAL seconds
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_INTERVAL)
+        try:
+            await run_blocking(metrics.flush)
+        except Exception as e:
+            logging.warning(f"Error writing metrics snapshot: {e}")
+
+# Starts the snapshot writer (no-op if METRICS_ENABLED is false)
+async def start_metrics():
+    global _flush_task
+    if METRICS_ENABLED and _flush_task is None:
+        _flush_task = asyncio.create_task(_flush_loop())
+
+# Stops the snapshot writer after a final write (the snapshot is archived once this worker has exited)
+async def stop_metrics():
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        await asyncio.gather(_flush_task, return_exceptions=True)
+        _flush_task = None
+        try:
+            await run_blocking(metrics.flush)
+        except Exception as e:
+            logging.warning(f"Error writing metrics snapshot: {e}")
+
+###############################################################################
+# Metric Descriptions
+###############################################################################
+metrics.describe('chat_stage_seconds', 'histogram', 'Duration of each chat pipeline stage')
+metrics.describe('chat_time_to_first_token_seconds', 'histogram', 'Time from a chat message to its first streamed frame')
+metrics.describe('chat_generation_seconds', 'histogram', 'Time from the first to the last streamed frame')
+metrics.describe(
+    'chat_tokens_per_second', 'histogram', 'Streamed tokens per second of generation',
+    buckets=(5, 10, 20, 40, 60, 80, 120, 160, 240, 320)
+)
+metrics.describe('chat_save_seconds', 'histogram', 'Duration of one chat history batch write to Cosmos')
+metrics.describe('chat_messages_total', 'counter', 'Chat messages answered')
+metrics.describe('chat_frames_total', 'counter', 'WebSocket answer frames sent (excluding markers), by frame mode')
+metrics.describe('chat_error_frames_total', 'counter', 'WebSocket error frames sent, by code')
+metrics.describe('chat_degraded_stages_total', 'counter', 'Retrieval stages dropped from the prompt (timeout or error)')
+metrics.describe('ingestion_stage_seconds', 'histogram', 'Per-file duration of each ingestion stage')
+metrics.describe('ingestion_batch_seconds', 'histogram', 'Duration of one embedding or index upload batch')
+metrics.describe('ingestion_files_total', 'counter', 'Ingested files, by outcome')
+metrics.describe('ingestion_bytes_total', 'counter', 'Bytes of successfully ingested files')
+metrics.describe('errors_total', 'counter', 'Logged errors, by source')
@@ -0,0 +1,279 @@
+# Imports
+import os
+import json
+import glob
+import time
+import fcntl
+import asyncio
+import logging
+import tempfile
+from datetime import datetime
+from dotenv import load_dotenv
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+
+# In-App Dependencies
+from routers.chat_history import build_turn_item, save_turns_to_cosmos
+from services.concurrency import run_blocking
+from services.metrics import span, record_error
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Write-Behind Settings
+###############################################################################
+# Directory for the per-worker crash-recovery journals
+CHAT_JOURNAL_DIR = os.getenv('CHAT_JOURNAL_DIR', os.path.join(tempfile.gettempdir(), 'chat_journal'))
+# Seconds between flushes to Cosmos
+CHAT_FLUSH_INTERVAL = float(os.getenv('CHAT_FLUSH_INTERVAL', '0.5'))
+# Turns that trigger an immediate flush
+CHAT_FLUSH_BATCH_SIZE = int(os.getenv('CHAT_FLUSH_BATCH_SIZE', '50'))
+# Journal size at which a fully flushed journal is truncated
+CHAT_JOURNAL_MAX_BYTES = int(os.getenv('CHAT_JOURNAL_MAX_BYTES', str(8 * 1024 * 1024)))
+# Failed saves of a turn before it is moved to the dead-letter file
+CHAT_SAVE_MAX_ATTEMPTS = int(os.getenv('CHAT_SAVE_MAX_ATTEMPTS', '8'))
+# Cap (seconds) of the exponential backoff between saves of a failing turn
+CHAT_SAVE_MAX_BACKOFF = float(os.getenv('CHAT_SAVE_MAX_BACKOFF', '60'))
+# Turns that could not be saved (shared by all workers)
+CHAT_DEAD_LETTER_PATH = os.getenv('CHAT_DEAD_LETTER_PATH', os.path.join(CHAT_JOURNAL_DIR, 'chat_dead_letter.jsonl'))
+
+# Cosmos transactional batches hold at most 100 operations (turns + 1 header op)
+MAX_TURNS_PER_BATCH = 99
+
+# Cosmos status codes worth retrying (timeout, throttled, retry-with, server errors)
+TRANSIENT_STATUS_CODES = (408, 429, 449)
+
+# Returns True if a failed save may succeed later (throttling, 5xx, timeouts, connection errors)
+def _is_transient(error: Exception):
+    if isinstance(error, (ServiceRequestError, ServiceResponseError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, HttpResponseError):
+        return error.status_code is None or error.status_code in TRANSIENT_STATUS_CODES or error.status_code >= 500
+    return False
+
+###############################################################################
+# Write-Behind Queue
+###############################################################################
+# Buffers completed chat turns in memory and flushes them to Cosmos in batches.
+# Every turn is appended to this worker's journal before it is buffered and an ack
+# is appended once it is saved, so turns left by a killed worker are replayed on startup.
+# Failing turns back off exponentially; a turn that keeps failing (or fails permanently,
+# e.g. a 400 or an oversized item) is moved to the dead-letter file and acked.
+class ChatWriteBehind:
+    def __init__(self, journal_dir: str = CHAT_JOURNAL_DIR, dead_letter_path: str = CHAT_DEAD_LETTER_PATH):
+        self.journal_dir = journal_dir
+        self.journal_path = None
+        self.dead_letter_path = dead_letter_path
+        self._journal_fd = None
+        self._pending = {}
+        self._failures = {}
+        self._wakeup = None
+        self._flusher = None
+        self._stopping = False
+
+    ###########################################################################
+    # Journal
+    ###########################################################################
+    # Opens (and locks) this worker's journal
+    def _open_journal(self):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self.journal_path = os.path.join(self.journal_dir, f'chat_journal_{os.getpid()}_{int(time.time())}.jsonl')
+        self._journal_fd = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        fcntl.flock(self._journal_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    # Appends records to the journal (one O_APPEND write survives a worker kill)
+    def _append(self, records: list):
+        if self._journal_fd is None:
+            return
+        os.write(self._journal_fd, ''.join(json.dumps(record) + '\n' for record in records).encode('utf-8'))
+
+    # Moves turns to the dead-letter file (one O_APPEND write) and acks them in the journal
+    def _dead_letter(self, turns: list, error: Exception):
+        os.makedirs(os.path.dirname(self.dead_letter_path) or '.', exist_ok=True)
+        fd = os.open(self.dead_letter_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, ''.join(
+                json.dumps({
+                    'turn': turn,
+                    'error': f'{type(error).__name__}: {error}',
+                    'attempts': self._failures.get(turn['id'], (0, 0))[0],
+                    'dead_lettered_at': datetime.now().isoformat()
+                }) + '\n'
+                for turn in turns
+            ).encode('utf-8'))
+        finally:
+            os.close(fd)
+        self._ack(turns)
+
+    # Acks saved (or dead-lettered) turns and drops them from the queue
+    def _ack(self, turns: list):
+        self._append([{'ack': turn['id']} for turn in turns])
+        for turn in turns:
+            self._pending.pop(turn['id'], None)
+            self._failures.pop(turn['id'], None)
+
+    # Truncates the journal once everything in it has been saved
+    def _compact_journal(self):
+        if self._journal_fd is not None and not self._pending and os.fstat(self._journal_fd).st_size > CHAT_JOURNAL_MAX_BYTES:
+            os.ftruncate(self._journal_fd, 0)
+
+    # Closes the journal, deleting it if nothing is left unsaved
+    def _close_journal(self):
+        if self._journal_fd is None:
+            return
+        os.fsync(self._journal_fd)
+        os.close(self._journal_fd)
+        self._journal_fd = None
+        if not self._pending:
+            os.remove(self.journal_path)
+
+    # Returns unsaved turns from journals of workers that are gone (their lock is free)
+    def _recover_orphaned_journals(self):
+        recovered = []
+        for path in glob.glob(os.path.join(self.journal_dir, 'chat_journal_*.jsonl')):
+            if path == self.journal_path:
+                continue
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # replayed by another worker since the glob
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            if os.fstat(fd).st_nlink == 0:
+                os.close(fd)
+                continue  # replayed & removed by another worker after we opened it
+
+            # Replay: turns without an ack
+            turns = {}
+            with os.fdopen(fd, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line
+                    if 'ack' in record:
+                        turns.pop(record['ack'], None)
+                    else:
+                        turns[record['id']] = record
+                recovered.extend(turns.values())
+                os.remove(path)
+        return recovered
+
+    ###########################################################################
+    # Queue
+    ###########################################################################
+    # Enqueues a completed turn; never waits on Cosmos
+    def enqueue(self, chat_id: str, user_email: str, user_query: str, ai_response: str):
+        turn = build_turn_item(chat_id, user_email, user_query, ai_response, datetime.now().isoformat())
+        self._append([turn])
+        self._pending[turn['id']] = turn
+        if self._wakeup is not None and len(self._pending) >= CHAT_FLUSH_BATCH_SIZE:
+            self._wakeup.set()
+        return turn
+
+    # Saves all pending turns: one transactional batch per partition key and chat.
+    # Chats with a turn still backing off are skipped unless `force` is set.
+    async def flush(self, force: bool = False):
+        if not self._pending:
+            return 0
+
+        # Group by (partition key, chat)
+        groups = {}
+        for turn in list(self._pending.values()):
+            groups.setdefault((turn['UserId'], turn['ChatId']), []).append(turn)
+
+        saved = 0
+        now = time.monotonic()
+        for (user_email, chat_id), turns in groups.items():
+            if not force and any(self._failures.get(turn['id'], (0, 0))[1] > now for turn in turns):
+                continue
+            for start in range(0, len(turns), MAX_TURNS_PER_BATCH):
+                batch = turns[start:start + MAX_TURNS_PER_BATCH]
+                saved_batch = await self._save_batch(chat_id, user_email, batch)
+                if saved_batch is None:
+                    break  # keep the chat's turns in order
+                saved += saved_batch
+
+        self._compact_journal()
+        return saved
+
+    # Saves one batch; a permanently failing batch is retried turn by turn to isolate the bad turn.
+    # Returns the number of turns saved, or None if the chat should wait for a retry.
+    async def _save_batch(self, chat_id: str, user_email: str, batch: list):
+        try:
+            with span('chat_save_seconds'):
+                await save_turns_to_cosmos(chat_id, user_email, batch)
+        except Exception as e:
+            if not _is_transient(e) and len(batch) > 1:
+                saved = 0
+                for turn in batch:
+                    saved_turn = await self._save_batch(chat_id, user_email, [turn])
+                    if saved_turn is None:
+                        return None
+                    saved += saved_turn
+                return saved
+            return self._record_failure(user_email, batch, e)
+        self._ack(batch)
+        return len(batch)
+
+    # Counts a failed save; backs off transient failures and dead-letters turns that are out of
+    # attempts or failed permanently. Returns 0 once dead-lettered, None while retrying.
+    def _record_failure(self, user_email: str, batch: list, error: Exception):
+        attempts = max(self._failures.get(turn['id'], (0, 0))[0] for turn in batch) + 1
+        if not _is_transient(error) or attempts >= CHAT_SAVE_MAX_ATTEMPTS:
+            for turn in batch:
+                self._failures[turn['id']] = (attempts, 0)
+            record_error('chat_save', f"Moving {len(batch)} chat turns of <{user_email}> to {self.dead_letter_path} after {attempts} attempts: {error}")
+            self._dead_letter(batch, error)
+            return 0
+
+        delay = min(CHAT_FLUSH_INTERVAL * 2 ** attempts, CHAT_SAVE_MAX_BACKOFF)
+        for turn in batch:
+            self._failures[turn['id']] = (attempts, time.monotonic() + delay)
+        record_error('chat_save', f"Error Saving Chat for <{user_email}> to Cosmos (attempt {attempts}, retrying in {delay:.1f}s): {error}")
+        return None
+
+    # Flushes every CHAT_FLUSH_INTERVAL seconds or as soon as a batch fills up
+    async def _flush_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=CHAT_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    ###########################################################################
+    # Lifespan Hooks
+    ###########################################################################
+    # Opens the journal, replays orphaned journals and starts the flusher
+    async def start(self):
+        await run_blocking(self._open_journal)
+        for turn in await run_blocking(self._recover_orphaned_journals):
+            self._append([turn])
+            self._pending[turn['id']] = turn
+        if self._pending:
+            logging.info(f"Recovered {len(self._pending)} unsaved chat turns from journals")
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    # Stops the flusher (letting an in-flight flush finish) and drains the queue
+    async def stop(self, attempts: int = 3):
+        if self._flusher is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        for _ in range(attempts):
+            await self.flush(force=True)
+            if not self._pending:
+                break
+        if self._pending:
+            logging.error(f"{len(self._pending)} chat turns left in {self.journal_path} for the next worker to replay")
+        await run_blocking(self._close_journal)
+
+# Worker-wide write-behind queue
+chat_write_behind = ChatWriteBehind()
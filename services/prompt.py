@@ -0,0 +1,183 @@
+# Imports
+import os
+import logging
+import threading
+from functools import lru_cache
+import tiktoken
+from dotenv import load_dotenv
+
+# In-App Dependencies
+from services.metrics import metrics
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Prompt Settings
+###############################################################################
+# Max input tokens for the whole prompt (system text + context + history + query)
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '6000'))
+# Tokenizer used for counting (cl100k_base matches the GPT-3.5/4 deployments)
+PROMPT_TOKEN_ENCODING = os.getenv('PROMPT_TOKEN_ENCODING', 'cl100k_base')
+# Items that would be cut below this many tokens are dropped instead
+MIN_TRUNCATED_TOKENS = int(os.getenv('MIN_TRUNCATED_TOKENS', '64'))
+
+SYSTEM_PROMPT = 'You are "Capgemin.AI", a helpful, friendly chatbot. You are here to help the user with any questions they may have. You are knowledgeable and can provide information on a wide range of topics. You are patient and understanding. You are here to help the user and make their experience as positive as possible. Use the chat history and context to help answer questions, if applicable - but do not rely soley on them. Do not mention anything about the context to the user, just use the information it provides if it is relevant to answering the query.'
+
+###############################################################################
+# Token Counting
+###############################################################################
+# Returns the worker's tokenizer
+@lru_cache(maxsize=1)
+def get_encoding():
+    return tiktoken.get_encoding(PROMPT_TOKEN_ENCODING)
+
+# Returns the number of tokens in text
+def count_tokens(text: str):
+    return len(get_encoding().encode(text or '', disallowed_special=()))
+
+# Token count of short, repeated strings (templates, file names)
+@lru_cache(maxsize=4096)
+def count_template_tokens(text: str):
+    return count_tokens(text)
+
+# Cuts text to at most max_tokens tokens
+def truncate_to_tokens(text: str, max_tokens: int):
+    tokens = get_encoding().encode(text or '', disallowed_special=())
+    return get_encoding().decode(tokens[:max_tokens])
+
+###############################################################################
+# Prompt Items
+###############################################################################
+# Renders one retrieved chunk
+def render_context(doc, content: str = None):
+    return f'File name: {str(doc.metadata["file_name"])}\nContent:\n```{doc.page_content if content is None else content}```\n'
+
+# Renders one history turn
+def render_turn(turn: dict, human: str = None, ai: str = None):
+    return f'Human: {turn.get("human") if human is None else human}\nai: {turn.get("ai") if ai is None else ai}\n'
+
+# Returns a chunk's token count (precomputed at ingestion, counted for older chunks)
+def context_tokens(doc):
+    content_tokens = doc.metadata.get('token_count')
+    if content_tokens is None:
+        content_tokens = count_tokens(doc.page_content)
+    return content_tokens + count_template_tokens(render_context(doc, ''))
+
+# Returns a turn's token count (precomputed when saved, counted for older turns)
+def turn_tokens(turn: dict):
+    human_tokens = turn.get('human_tokens')
+    ai_tokens = turn.get('ai_tokens')
+    if human_tokens is None:
+        human_tokens = count_tokens(str(turn.get('human')))
+    if ai_tokens is None:
+        ai_tokens = count_tokens(str(turn.get('ai')))
+    return human_tokens + ai_tokens + count_template_tokens(render_turn({}, '', ''))
+
+###############################################################################
+# Usage Metrics
+###############################################################################
+# Worker-wide prompt token totals
+class PromptTokenStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.dropped_items = 0
+        self.truncated_items = 0
+
+    def record(self, usage: dict):
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += usage['prompt_tokens']
+            self.dropped_items += usage['dropped_items']
+            self.truncated_items += usage['truncated_items']
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'prompt_tokens': self.prompt_tokens,
+            'avg_prompt_tokens': self.prompt_tokens / self.requests if self.requests else 0.0,
+            'dropped_items': self.dropped_items,
+            'truncated_items': self.truncated_items,
+        }
+
+prompt_token_stats = PromptTokenStats()
+metrics.register_stats(
+    'prompt', prompt_token_stats.stats,
+    counters=('requests', 'prompt_tokens', 'dropped_items', 'truncated_items')
+)
+
+###############################################################################
+# Prompt Builder
+###############################################################################
+# Builds the chat prompt within a token budget
+# similar_docs: retrieved chunks, best first; chat_history: turns, oldest first
+# Items are admitted best-first (top chunk, newest turn, next chunk, next turn, ...);
+# the first item that does not fit is truncated, everything ranked below it is dropped
+# Returns: (prompt, usage)
+def build_prompt(query: str, similar_docs: list = None, chat_history: list = None, budget: int = PROMPT_TOKEN_BUDGET):
+    similar_docs = similar_docs or []
+    chat_history = chat_history or []
+
+    # Fixed parts: system text, section headers and the query itself
+    template = f'{SYSTEM_PROMPT}\n====\nContext:\n====\n{{context}}\n====\nChat History:\n====\n{{history}}\n====\nCurrent Human Query:\n{{query}}\n====\nai: '
+    fixed_tokens = count_template_tokens(template.format(context='', history='', query=''))
+    query_tokens = count_tokens(str(query))
+    if fixed_tokens + query_tokens > budget:
+        query = truncate_to_tokens(str(query), max(0, budget - fixed_tokens))
+        query_tokens = budget - fixed_tokens
+    remaining = budget - fixed_tokens - query_tokens
+
+    # Interleave candidates by rank
+    docs = [('context', i, doc, context_tokens(doc)) for i, doc in enumerate(similar_docs)]
+    turns = [('history', i, turn, turn_tokens(turn)) for i, turn in reversed(list(enumerate(chat_history)))]
+    ranked = []
+    for i in range(max(len(docs), len(turns))):
+        ranked.extend(docs[i:i + 1])
+        ranked.extend(turns[i:i + 1])
+
+    # Admit best-first within the budget
+    rendered = {'context': {}, 'history': {}}
+    used = {'context': 0, 'history': 0}
+    dropped = 0
+    truncated = 0
+    for kind, position, item, tokens in ranked:
+        if tokens <= remaining:
+            text = render_context(item) if kind == 'context' else render_turn(item)
+        elif remaining >= MIN_TRUNCATED_TOKENS:
+            tokens = remaining
+            if kind == 'context':
+                overhead = count_template_tokens(render_context(item, ''))
+                text = render_context(item, truncate_to_tokens(item.page_content, max(0, remaining - overhead)))
+            else:
+                overhead = count_template_tokens(render_turn({}, '', ''))
+                human_tokens = min(count_tokens(str(item.get('human'))), max(0, remaining - overhead) // 2)
+                human = truncate_to_tokens(str(item.get('human')), human_tokens)
+                ai = truncate_to_tokens(str(item.get('ai')), max(0, remaining - overhead - human_tokens))
+                text = render_turn(item, human, ai)
+            truncated += 1
+        else:
+            dropped += 1
+            continue
+        rendered[kind][position] = text
+        used[kind] += tokens
+        remaining -= tokens
+
+    # Render in natural order: chunks by rank, history oldest first
+    context_str = ''.join(rendered['context'][i] for i in sorted(rendered['context']))
+    chat_history_str = ''.join(rendered['history'][i] for i in sorted(rendered['history']))
+    prompt = template.format(context=context_str, history=chat_history_str, query=str(query))
+
+    # Report usage
+    usage = {
+        'prompt_tokens': fixed_tokens + query_tokens + used['context'] + used['history'],
+        'context_tokens': used['context'],
+        'history_tokens': used['history'],
+        'query_tokens': query_tokens,
+        'budget': budget,
+        'dropped_items': dropped,
+        'truncated_items': truncated,
+    }
+    prompt_token_stats.record(usage)
+    return prompt, usage
@@ -0,0 +1,292 @@
+# Imports
+import os
+import uuid
+import fcntl
+import asyncio
+import logging
+import tempfile
+from dotenv import load_dotenv
+from azure.core import MatchConditions
+from azure.core.exceptions import HttpResponseError, ResourceExistsError, ResourceNotFoundError
+
+# In-App Dependencies
+from dependencies import get_uuid_for_blob_container, invalidate_user_container_or_index_name, MAPPING_TYPE, POOL_TYPE
+from services.clients import get_blob_service_client, get_cosmos_container
+from services.concurrency import run_blocking
+from services.vector_store import get_vector_store
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Provisioning Settings
+###############################################################################
+# Attempts per provisioning step before the saga is compensated
+PROVISIONING_RETRIES = int(os.getenv('PROVISIONING_RETRIES', '3'))
+# First retry delay in seconds (doubles per attempt)
+PROVISIONING_RETRY_DELAY = float(os.getenv('PROVISIONING_RETRY_DELAY', '0.5'))
+# Ready-made container + index pairs kept for new users (0 disables the pool)
+PROVISIONING_POOL_SIZE = int(os.getenv('PROVISIONING_POOL_SIZE', '0'))
+# Seconds between pool refills
+PROVISIONING_POOL_INTERVAL = float(os.getenv('PROVISIONING_POOL_INTERVAL', '30'))
+
+# Pool entries live in the user -> container name Cosmos container under this partition key
+# (typed POOL_TYPE, so they never match a user's index lookup; registration only accepts email addresses)
+POOL_PARTITION = '__pool__'
+# Only one worker per host refills the pool at a time
+POOL_LOCK_PATH = os.path.join(tempfile.gettempdir(), 'provisioning_pool.lock')
+
+# Raised when a saga failed (after its compensations ran)
+class ProvisioningError(Exception):
+    pass
+
+###############################################################################
+# Resource Names
+###############################################################################
+# Deterministic container/index name for a user: a retried registration targets the same
+# resources instead of leaking new ones, and no database round trip is needed
+def resource_name_for(user_email: str):
+    return uuid.uuid5(uuid.NAMESPACE_URL, f'user-resources:{user_email.lower()}').hex
+
+# Blob error code of an existing container (other 409s, e.g. ContainerBeingDeleted after a
+# compensated registration, are transient: the step is retried)
+CONTAINER_ALREADY_EXISTS = 'ContainerAlreadyExists'
+
+# Returns True for errors that mean the resource already exists (with error_code, only that code)
+def _already_exists(error: Exception, error_code: str = None):
+    return isinstance(error, ResourceExistsError) and (error_code is None or error.error_code == error_code)
+
+###############################################################################
+# Idempotent Steps (each paired with its compensation)
+###############################################################################
+# Blob Container
+def create_blob_container(name: str):
+    try:
+        get_blob_service_client().create_container(name)
+    except ResourceExistsError as e:
+        if not _already_exists(e, CONTAINER_ALREADY_EXISTS):
+            raise
+
+def delete_blob_container(name: str):
+    try:
+        get_blob_service_client().delete_container(name)
+    except ResourceNotFoundError:
+        pass
+
+# Search Index
+def create_search_index(name: str):
+    try:
+        get_vector_store().create_index(name)
+    except ResourceExistsError as e:
+        if not _already_exists(e):
+            raise
+
+def delete_search_index(name: str):
+    try:
+        get_vector_store().delete_index(name)
+    except ResourceNotFoundError:
+        pass
+
+# User -> Container/Index Name mapping (makes the resources visible to the user)
+def save_container_mapping(name: str, user_email: str):
+    get_cosmos_container(os.environ['COSMOS_USERCONTAINERNAME_CONTAINER_NAME']).upsert_item(body={
+        'id': name,
+        'UserId': user_email,
+        'type': MAPPING_TYPE
+    })
+    invalidate_user_container_or_index_name(user_email)
+
+def delete_container_mapping(name: str, user_email: str):
+    try:
+        get_cosmos_container(os.environ['COSMOS_USERCONTAINERNAME_CONTAINER_NAME']).delete_item(name, user_email)
+    except ResourceNotFoundError:
+        pass
+    invalidate_user_container_or_index_name(user_email)
+
+###############################################################################
+# Saga
+###############################################################################
+# A step: {'name': str, 'action': (callable, args), 'compensation': (callable, args)}
+def saga_step(name: str, action, compensation, *args):
+    return {'name': name, 'action': action, 'compensation': compensation, 'args': args}
+
+# Runs a blocking step, retrying with exponential backoff
+async def _run_step(step: dict):
+    for attempt in range(PROVISIONING_RETRIES):
+        try:
+            return await run_blocking(step['action'], *step['args'])
+        except Exception as e:
+            if attempt == PROVISIONING_RETRIES - 1:
+                raise
+            delay = PROVISIONING_RETRY_DELAY * 2 ** attempt
+            logging.warning(f"Provisioning step <{step['name']}> failed (attempt {attempt + 1}), retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+
+# Runs stages in order (the steps of one stage run concurrently). If a step still fails
+# after its retries, every started step is compensated (newest first) and ProvisioningError is raised.
+async def run_saga(stages: list):
+    started = []
+    for stage in stages:
+        results = await asyncio.gather(*(_run_step(step) for step in stage), return_exceptions=True)
+        started.extend(stage)
+        failures = [
+            f"{step['name']}: {result}"
+            for step, result in zip(stage, results)
+            if isinstance(result, BaseException)
+        ]
+        if failures:
+            await _compensate(started)
+            raise ProvisioningError('; '.join(failures))
+
+# Undoes started steps (compensations are idempotent, so failed steps are undone too)
+async def _compensate(steps: list):
+    for step in reversed(steps):
+        try:
+            await run_blocking(step['compensation'], *step['args'])
+        except Exception as e:
+            logging.error(f"Compensation of provisioning step <{step['name']}> failed: {e}")
+
+###############################################################################
+# User Provisioning
+###############################################################################
+# Creates a user's blob container & search index concurrently, then maps them to the user.
+# Uses a pre-provisioned pair when the pool has one. Returns the container/index name.
+async def provision_user_resources(user_email: str):
+    user_email = user_email.lower()
+
+    # Claim a ready container & index
+    if PROVISIONING_POOL_SIZE > 0:
+        name = await claim_pooled_resources(user_email)
+        if name:
+            return name
+
+    # Build them
+    name = resource_name_for(user_email)
+    await run_saga([
+        [
+            saga_step('blob_container', create_blob_container, delete_blob_container, name),
+            saga_step('search_index', create_search_index, delete_search_index, name),
+        ],
+        [
+            saga_step('container_mapping', save_container_mapping, delete_container_mapping, name, user_email),
+        ],
+    ])
+    return name
+
+###############################################################################
+# Pre-Provisioned Pool
+###############################################################################
+_pool_task = None
+_pool_wakeup = None
+
+# Removes one pool entry (atomically, via its etag) and returns its name, or None if the pool is empty
+def _take_pool_entry():
+    container = get_cosmos_container(os.environ['COSMOS_USERCONTAINERNAME_CONTAINER_NAME'])
+    for item in container.query_items(query='SELECT TOP 10 * FROM c', partition_key=POOL_PARTITION):
+        try:
+            container.delete_item(
+                item,
+                partition_key=POOL_PARTITION,
+                etag=item['_etag'],
+                match_condition=MatchConditions.IfNotModified
+            )
+            return item['id']
+        except HttpResponseError as e:
+            if e.status_code in (404, 412):
+                continue  # claimed by another worker
+            raise
+    return None
+
+# Adds a name to the pool
+def _return_pool_entry(name: str):
+    get_cosmos_container(os.environ['COSMOS_USERCONTAINERNAME_CONTAINER_NAME']).upsert_item(body={
+        'id': name,
+        'UserId': POOL_PARTITION,
+        'type': POOL_TYPE
+    })
+
+# Removes a name from the pool
+def _remove_pool_entry(name: str):
+    try:
+        get_cosmos_container(os.environ['COSMOS_USERCONTAINERNAME_CONTAINER_NAME']).delete_item(name, POOL_PARTITION)
+    except ResourceNotFoundError:
+        pass
+
+# Maps a pre-provisioned container & index to the user; returns its name or None if the pool is empty
+async def claim_pooled_resources(user_email: str):
+    name = await run_blocking(_take_pool_entry)
+    if _pool_wakeup is not None:
+        _pool_wakeup.set()
+    if not name:
+        return None
+    try:
+        await run_saga([
+            [saga_step('container_mapping', save_container_mapping, delete_container_mapping, name, user_email)],
+        ])
+    except ProvisioningError as e:
+        logging.error(f"Claiming pooled resources <{name}> for <{user_email}> failed: {e}")
+        await run_blocking(_return_pool_entry, name)
+        return None
+    return name
+
+# Number of ready entries
+def _pool_size():
+    container = get_cosmos_container(os.environ['COSMOS_USERCONTAINERNAME_CONTAINER_NAME'])
+    return list(container.query_items(query='SELECT VALUE COUNT(1) FROM c', partition_key=POOL_PARTITION))[0]
+
+# Tops the pool up to PROVISIONING_POOL_SIZE (skipped if another worker on the host is refilling)
+async def refill_pool():
+    lock_fd = os.open(POOL_LOCK_PATH, os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+        missing = PROVISIONING_POOL_SIZE - await run_blocking(_pool_size)
+        created = 0
+        for _ in range(max(0, missing)):
+            name = get_uuid_for_blob_container()
+            await run_saga([
+                [
+                    saga_step('blob_container', create_blob_container, delete_blob_container, name),
+                    saga_step('search_index', create_search_index, delete_search_index, name),
+                ],
+                [
+                    saga_step('pool_entry', _return_pool_entry, _remove_pool_entry, name),
+                ],
+            ])
+            created += 1
+        return created
+    finally:
+        os.close(lock_fd)
+
+# Refills the pool periodically and right after a claim
+async def _pool_loop():
+    while True:
+        try:
+            created = await refill_pool()
+            if created:
+                logging.info(f"Provisioned {created} pooled containers & indexes")
+        except Exception as e:
+            logging.error(f"Error refilling the provisioning pool: {e}")
+        try:
+            await asyncio.wait_for(_pool_wakeup.wait(), timeout=PROVISIONING_POOL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _pool_wakeup.clear()
+
+# Starts the pool refiller (no-op if PROVISIONING_POOL_SIZE is 0)
+async def start_provisioning_pool():
+    global _pool_task, _pool_wakeup
+    if PROVISIONING_POOL_SIZE <= 0:
+        return
+    _pool_wakeup = asyncio.Event()
+    _pool_task = asyncio.create_task(_pool_loop())
+
+# Stops the pool refiller
+async def stop_provisioning_pool():
+    global _pool_task
+    if _pool_task is not None:
+        _pool_task.cancel()
+        await asyncio.gather(_pool_task, return_exceptions=True)
+        _pool_task = None
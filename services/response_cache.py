@@ -0,0 +1,120 @@
+# Imports
+import os
+import hashlib
+import numpy as np
+from dotenv import load_dotenv
+
+# In-App Dependencies
+from services.cache import TTLCache
+from services.concurrency import run_blocking
+from services.jobs import bump_index_generation, get_index_generation
+from services.prompt import get_encoding
+from services.metrics import metrics
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Response Cache Settings
+###############################################################################
+# Serve repeated questions from cache (off by default)
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'false').lower() == 'true'
+# Max cached (user, index, retrieved chunks) keys per worker
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '1024'))
+# Seconds a cached answer stays valid
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '3600'))
+# Min cosine similarity between query embeddings for a hit
+RESPONSE_CACHE_THRESHOLD = float(os.getenv('RESPONSE_CACHE_THRESHOLD', '0.95'))
+# Answers kept per key (differently phrased questions over the same chunks)
+RESPONSE_CACHE_VARIANTS = int(os.getenv('RESPONSE_CACHE_VARIANTS', '8'))
+
+###############################################################################
+# Helper Functions
+###############################################################################
+# Order-independent digest of the retrieved chunk ids (content hash for chunks without one)
+def retrieved_chunks_key(similar_docs: list):
+    ids = sorted(
+        doc.metadata.get('chunk_id') or hashlib.sha256(doc.page_content.encode('utf-8')).hexdigest()
+        for doc in similar_docs
+    )
+    return hashlib.sha256('\x00'.join(ids).encode('utf-8')).hexdigest()
+
+# Unit-length float32 copy of a vector
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+# Splits an answer into token-sized frames (never splitting a multi-byte character)
+def iter_token_frames(text: str):
+    encoding = get_encoding()
+    pending = b''
+    for token in encoding.encode(text, disallowed_special=()):
+        pending += encoding.decode_single_token_bytes(token)
+        try:
+            frame = pending.decode('utf-8')
+        except UnicodeDecodeError:
+            continue
+        pending = b''
+        yield frame
+    if pending:
+        yield pending.decode('utf-8', errors='replace')
+
+###############################################################################
+# Semantic Response Cache
+###############################################################################
+# Per-user answer cache keyed by (user, index, index generation, retrieved chunk ids).
+# Within a key, a cached answer is a hit if its query embedding is similar enough.
+# Uploads bump the index generation in the job store, which every worker on the host reads,
+# so the index's entries are orphaned in all of them (not only in the worker that ingested).
+class ResponseCache:
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL, threshold: float = RESPONSE_CACHE_THRESHOLD, enabled: bool = RESPONSE_CACHE_ENABLED):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    # Returns the index's current generation (from the job store shared by all workers)
+    async def _generation(self, index_name: str):
+        return await run_blocking(get_index_generation, index_name)
+
+    # Marks every cached answer for the index as stale, in every worker
+    async def invalidate(self, index_name: str):
+        await run_blocking(bump_index_generation, index_name)
+
+    # Returns the cache key for a retrieval
+    async def _key(self, user_email: str, index_name: str, similar_docs: list):
+        return (user_email.lower(), index_name, await self._generation(index_name), retrieved_chunks_key(similar_docs))
+
+    # Returns a cached answer for a similar query over the same chunks, or None
+    async def get(self, user_email: str, index_name: str, query_vector, similar_docs: list):
+        variants = self.entries.get(await self._key(user_email, index_name, similar_docs)) or []
+        query_vector = _normalize(query_vector)
+        best = max(variants, key=lambda variant: float(np.dot(variant[0], query_vector)), default=None)
+        if best is not None and float(np.dot(best[0], query_vector)) >= self.threshold:
+            self.hits += 1
+            return best[1]
+        self.misses += 1
+        return None
+
+    # Caches an answer (the newest variants are kept)
+    async def set(self, user_email: str, index_name: str, query_vector, similar_docs: list, answer: str):
+        key = await self._key(user_email, index_name, similar_docs)
+        variants = list(self.entries.get(key) or [])
+        variants.append((_normalize(query_vector), answer))
+        self.entries.set(key, variants[-RESPONSE_CACHE_VARIANTS:])
+
+    # Hit/miss metrics
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+        }
+
+# Worker-wide response cache
+response_cache = ResponseCache()
+metrics.register_stats('response_cache', response_cache.stats, counters=('hits', 'misses'), gauges=('entries',))
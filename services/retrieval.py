@@ -0,0 +1,103 @@
+# Imports
+import os
+import time
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+# In-App Dependencies
+from dependencies import get_user_container_or_index_name
+from routers.chat_history import get_chat_history_by_id
+from routers.ai_search import search_vector_index
+from services.metrics import metrics, record_error
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Retrieval Settings
+###############################################################################
+# Per-stage deadlines in seconds; a stage that misses it is dropped from the prompt
+HISTORY_TIMEOUT = float(os.getenv('RETRIEVAL_HISTORY_TIMEOUT', '2'))
+INDEX_NAME_TIMEOUT = float(os.getenv('RETRIEVAL_INDEX_NAME_TIMEOUT', '2'))
+VECTOR_SEARCH_TIMEOUT = float(os.getenv('RETRIEVAL_VECTOR_SEARCH_TIMEOUT', '4'))
+
+###############################################################################
+# Helper Functions
+###############################################################################
+# Awaits one retrieval stage under its deadline and records how long it took
+async def _run_stage(stage: str, coro, timeout: float, timings: dict, degraded: list):
+    start = time.perf_counter()
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        logging.warning(f"Retrieval stage <{stage}> missed its {timeout}s deadline")
+        metrics.inc('chat_degraded_stages_total', stage=stage, reason='timeout')
+        degraded.append(stage)
+        return None
+    except Exception as e:
+        record_error('retrieval', f"Retrieval stage <{stage}> failed: {e}")
+        metrics.inc('chat_degraded_stages_total', stage=stage, reason='error')
+        degraded.append(stage)
+        return None
+    finally:
+        elapsed = time.perf_counter() - start
+        timings[stage] = round(elapsed * 1000, 2)
+        metrics.observe('chat_stage_seconds', elapsed, stage=stage)
+
+# Resolves the user's index (unless already known) and searches it (these two depend on each other)
+# Returns: (index_name, similar_docs)
+async def _get_similar_docs(query: str, user_email: str, index_name: str, timings: dict, degraded: list):
+    if not index_name:
+        index_name = await _run_stage(
+            'index_name',
+            get_user_container_or_index_name(user_email),
+            INDEX_NAME_TIMEOUT, timings, degraded
+        )
+    if not index_name:
+        return None, None
+
+    return index_name, await _run_stage(
+        'vector_search',
+        search_vector_index(query=query, index_name=index_name),
+        VECTOR_SEARCH_TIMEOUT, timings, degraded
+    )
+
+# Stands in for a stage whose result is already known
+async def _known(value):
+    return value
+
+###############################################################################
+# Retrieval Stage
+###############################################################################
+# Fetches chat history and vector context concurrently for one chat turn
+# chat_history / index_name: already known to the caller (e.g. a chat session), so not looked up
+# Returns: {'chat_history': list|None, 'index_name': str|None, 'similar_docs': list|None, 'timings': {stage: ms}, 'degraded': [stage]}
+async def retrieve_prompt_inputs(chat_id: str, user_email: str, query: str, chat_history: list = None, index_name: str = None, history_turns: int = 5):
+    timings = {}
+    degraded = []
+    start = time.perf_counter()
+
+    # History and Context do not depend on each other, so fan out
+    chat_history, (index_name, similar_docs) = await asyncio.gather(
+        _known(chat_history) if chat_history is not None else _run_stage(
+            'chat_history',
+            get_chat_history_by_id(chat_id=chat_id, user_email=user_email, n=history_turns),
+            HISTORY_TIMEOUT, timings, degraded
+        ),
+        _get_similar_docs(query, user_email, index_name, timings, degraded)
+    )
+    elapsed = time.perf_counter() - start
+    timings['total'] = round(elapsed * 1000, 2)
+    metrics.observe('chat_stage_seconds', elapsed, stage='retrieval')
+
+    # Report per-stage timings
+    logging.info(f"Retrieval timings (ms) for <{user_email}>: {timings} degraded: {degraded}")
+
+    return {
+        'chat_history': chat_history,
+        'index_name': index_name,
+        'similar_docs': similar_docs,
+        'timings': timings,
+        'degraded': degraded
+    }
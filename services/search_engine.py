@@ -0,0 +1,129 @@
+# Imports
+import os
+import re
+import time
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Retrieval Engine Settings
+###############################################################################
+# Chunks returned to the prompt
+RETRIEVAL_K = int(os.getenv('RETRIEVAL_K', '3'))
+# Candidates fetched from each of the vector and keyword searches
+RETRIEVAL_CANDIDATES = int(os.getenv('RETRIEVAL_CANDIDATES', '20'))
+# Fuse keyword (BM25) matches with the vector matches
+RETRIEVAL_HYBRID = os.getenv('RETRIEVAL_HYBRID', 'true').lower() == 'true'
+# Reciprocal rank fusion constant (higher flattens the rank curve)
+RRF_K = int(os.getenv('RRF_K', '60'))
+# Weight of query term coverage in the rerank score (0 keeps the fused order)
+RERANK_WEIGHT = float(os.getenv('RERANK_WEIGHT', '0.3'))
+# MMR trade-off between relevance (1.0) and diversity (0.0)
+MMR_LAMBDA = float(os.getenv('MMR_LAMBDA', '0.7'))
+# Candidates whose rerank score (0-1) is below this are never returned
+RETRIEVAL_SCORE_THRESHOLD = float(os.getenv('RETRIEVAL_SCORE_THRESHOLD', '0'))
+
+# Words too common to count as query term coverage
+STOPWORDS = frozenset(
+    'a an and are as at be but by can do does for from has have how i if in into is it its '
+    'me my of on or our so than that the their them then there these they this to was we '
+    'what when where which who why will with you your'.split()
+)
+
+###############################################################################
+# Ranking Functions
+###############################################################################
+# Lowercase word tokens
+def tokenize(text: str):
+    return re.findall(r'\w+', (text or '').lower())
+
+# Distinct non-stopword terms
+def content_terms(text: str):
+    return {term for term in tokenize(text) if term not in STOPWORDS}
+
+# Reciprocal rank fusion of ranked result lists -> [(candidate, fused score)], best first
+def rrf_fuse(result_lists: list, rrf_k: int = RRF_K):
+    fused = {}
+    for results in result_lists:
+        for rank, result in enumerate(results):
+            candidate, score = fused.get(result['id'], (result, 0.0))
+            fused[result['id']] = (candidate, score + 1.0 / (rrf_k + rank + 1))
+    return sorted(fused.values(), key=lambda item: item[1], reverse=True)
+
+# Scores fused candidates in [0, 1]: fused rank (relative to first place in every list)
+# blended with the share of query terms the chunk contains
+def rerank(query: str, fused: list, lists: int, rrf_k: int = RRF_K, weight: float = RERANK_WEIGHT):
+    query_terms = content_terms(query)
+    best_possible = lists / (rrf_k + 1)
+    reranked = []
+    for candidate, score in fused:
+        coverage = len(query_terms & content_terms(candidate['content'])) / len(query_terms) if query_terms else 0.0
+        reranked.append((candidate, (1 - weight) * score / best_possible + weight * coverage))
+    return sorted(reranked, key=lambda item: item[1], reverse=True)
+
+# Jaccard similarity of two term sets
+def jaccard(a: set, b: set):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+# Maximal marginal relevance: picks k candidates, trading relevance for novelty
+# (redundancy is the term overlap with what was already picked, which catches overlapping chunks)
+def mmr_select(scored: list, k: int, lambda_: float = MMR_LAMBDA):
+    remaining = [(candidate, score, content_terms(candidate['content'])) for candidate, score in scored]
+    selected = []
+    while remaining and len(selected) < k:
+        best = max(
+            range(len(remaining)),
+            key=lambda i: lambda_ * remaining[i][1] - (1 - lambda_) * max(
+                (jaccard(remaining[i][2], terms) for _, _, terms in selected), default=0.0
+            )
+        )
+        selected.append(remaining.pop(best))
+    return [(candidate, score) for candidate, score, _ in selected]
+
+###############################################################################
+# Hybrid Search
+###############################################################################
+# Vector + keyword search, fused, reranked, thresholded and diversified
+# Returns: [{'id', 'content', 'metadata', 'score'}] (score is the rerank score), best first
+async def hybrid_search(
+    store,
+    index_name: str,
+    query: str,
+    query_vector: list,
+    k: int = RETRIEVAL_K,
+    candidates: int = RETRIEVAL_CANDIDATES,
+    hybrid: bool = RETRIEVAL_HYBRID,
+    threshold: float = RETRIEVAL_SCORE_THRESHOLD,
+    rerank_weight: float = RERANK_WEIGHT,
+    mmr_lambda: float = MMR_LAMBDA
+):
+    start = time.perf_counter()
+
+    # Fetch candidates (keyword search failures only cost the keyword signal)
+    searches = [store.search(index_name, query_vector, candidates)]
+    if hybrid:
+        searches.append(store.keyword_search(index_name, query, candidates))
+    results = await asyncio.gather(*searches, return_exceptions=True)
+    if isinstance(results[0], Exception):
+        raise results[0]
+    result_lists = [results[0]]
+    if hybrid:
+        if isinstance(results[1], Exception):
+            logging.warning(f"Keyword search failed on <{index_name}>, using vector results only: {results[1]}")
+        elif results[1] is not None:  # None: the index has no full-text field
+            result_lists.append(results[1])
+
+    # Fuse, rerank, threshold and diversify
+    scored = rerank(query, rrf_fuse(result_lists), lists=len(result_lists), weight=rerank_weight)
+    scored = [(candidate, score) for candidate, score in scored if score >= threshold]
+    selected = mmr_select(scored, k, lambda_=mmr_lambda)
+
+    logging.debug(
+        f"Hybrid search on <{index_name}>: {sum(len(r) for r in result_lists)} candidates, "
+        f"{len(selected)} selected in {round((time.perf_counter() - start) * 1000, 2)}ms"
+    )
+    return [dict(candidate, score=score) for candidate, score in selected]
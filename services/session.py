@@ -0,0 +1,98 @@
+# Imports
+import os
+import time
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+# In-App Dependencies
+from dependencies import validate_authorization
+from services.clients import get_chat_llm
+from services.persistence import chat_write_behind
+from services.retrieval import retrieve_prompt_inputs
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Session Settings
+###############################################################################
+# Recent turns of a chat kept in memory per connection (and added to the prompt)
+CHAT_SESSION_HISTORY_TURNS = int(os.getenv('CHAT_SESSION_HISTORY_TURNS', '5'))
+# Chats whose recent turns a connection keeps (least recently used are dropped)
+CHAT_SESSION_MAX_CHATS = int(os.getenv('CHAT_SESSION_MAX_CHATS', '8'))
+
+###############################################################################
+# Chat Session
+###############################################################################
+# State of one chat WebSocket, created once per connection: the authenticated user, the
+# worker's LLM, the user's resolved index and a rolling window of each chat's recent turns.
+# History and index name are loaded from Cosmos on first use and kept up to date locally,
+# so later messages on the socket only retrieve context. Each turn is queued for saving
+# as soon as it is answered.
+class ChatSession:
+    def __init__(self, auth_token: str = None):
+        self.auth_token = auth_token
+        self.user_email = None
+        self.expires_at = None
+        self.llm = get_chat_llm()
+        self.index_name = None
+        self._histories = OrderedDict()
+
+    # Validates a "Bearer <token>" only if it is new or the current one expired
+    # Returns the authenticated email (raises if the token is invalid)
+    def authenticate(self, token: str = None):
+        token = token or self.auth_token
+        if token != self.auth_token or self.user_email is None or (self.expires_at is not None and self.expires_at <= time.time()):
+            payload = validate_authorization(token)
+            email = str(payload.get('sub')).lower()
+            if self.user_email is not None and email != self.user_email:
+                # Another user's token: nothing cached belongs to them
+                self.index_name = None
+                self._histories.clear()
+            self.auth_token, self.user_email, self.expires_at = token, email, payload.get('exp')
+        return self.user_email
+
+    # The chat's recent turns (None until loaded from Cosmos)
+    def history(self, chat_id: str):
+        window = self._histories.get(chat_id)
+        if window is None:
+            return None
+        self._histories.move_to_end(chat_id)
+        return list(window)
+
+    def _remember_history(self, chat_id: str, turns: list):
+        self._histories[chat_id] = deque(turns or [], maxlen=CHAT_SESSION_HISTORY_TURNS)
+        self._histories.move_to_end(chat_id)
+        while len(self._histories) > CHAT_SESSION_MAX_CHATS:
+            self._histories.popitem(last=False)
+
+    # Fetches prompt inputs, skipping the history & index name lookups the session already has
+    async def retrieve(self, chat_id: str, query: str):
+        known_history = self.history(chat_id)
+        retrieval = await retrieve_prompt_inputs(
+            chat_id=chat_id,
+            user_email=self.user_email,
+            query=query,
+            chat_history=known_history,
+            index_name=self.index_name,
+            history_turns=CHAT_SESSION_HISTORY_TURNS
+        )
+
+        # Keep what was loaded (a degraded stage is retried on the next message)
+        if known_history is None and 'chat_history' not in retrieval['degraded']:
+            self._remember_history(chat_id, retrieval['chat_history'])
+        if self.index_name is None and 'index_name' not in retrieval['degraded']:
+            self.index_name = retrieval['index_name']
+        return retrieval
+
+    # Queues a completed turn for saving and adds it to the chat's window
+    def record_turn(self, chat_id: str, user_query: str, ai_response: str):
+        turn = chat_write_behind.enqueue(
+            chat_id=chat_id,
+            user_email=self.user_email,
+            user_query=user_query,
+            ai_response=ai_response
+        )
+        if chat_id in self._histories:
+            self._histories[chat_id].append(turn)
+        return turn
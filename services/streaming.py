@@ -0,0 +1,111 @@
+# Imports
+import os
+import time
+import asyncio
+from dotenv import load_dotenv
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Streaming Settings
+###############################################################################
+# Default frame mode for chat answers: 'coalesced' (buffered tokens) or 'token' (one frame per token)
+STREAM_FRAME_MODE = os.getenv('STREAM_FRAME_MODE', 'coalesced').lower()
+# Buffered text is sent once it reaches this many bytes...
+STREAM_FLUSH_BYTES = int(os.getenv('STREAM_FLUSH_BYTES', '512'))
+# ...or once the oldest buffered token is this many seconds old, whichever comes first
+STREAM_FLUSH_INTERVAL = float(os.getenv('STREAM_FLUSH_INTERVAL', '0.05'))
+
+FRAME_MODES = ('coalesced', 'token')
+
+###############################################################################
+# Frame Coalescer
+###############################################################################
+# Buffers streamed text and sends it in fewer, larger frames. The first token is sent at once
+# (time to first token is unchanged); later tokens are flushed on size or age. Call close()
+# before sending a protocol marker (<<END>>, <<E:...>>) so markers always travel as their own
+# frame, after all of the text.
+class FrameCoalescer:
+    def __init__(self, send, mode: str = STREAM_FRAME_MODE, flush_bytes: int = STREAM_FLUSH_BYTES, flush_interval: float = STREAM_FLUSH_INTERVAL):
+        self.send = send
+        self.coalesce = mode == 'coalesced'
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.frames = 0
+        self._parts = []
+        self._size = 0
+        self._oldest = None
+        self._timer = None
+        self._sent_first = False
+        self._error = None
+        self._lock = asyncio.Lock()
+
+    # Adds text to the stream
+    async def write(self, text: str):
+        if self._error is not None:
+            raise self._error
+        if not text:
+            return
+        if not self.coalesce or not self._sent_first:
+            self._sent_first = True
+            async with self._lock:
+                await self._send(text)
+            return
+
+        self._parts.append(text)
+        self._size += len(text.encode('utf-8'))
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+            self._timer = asyncio.get_running_loop().call_later(
+                self.flush_interval, lambda: asyncio.ensure_future(self._timed_flush())
+            )
+        if self._size >= self.flush_bytes or time.monotonic() - self._oldest >= self.flush_interval:
+            await self.flush()
+
+    # Sends whatever is buffered
+    async def flush(self):
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._parts:
+                return
+            text = ''.join(self._parts)
+            self._parts = []
+            self._size = 0
+            self._oldest = None
+            await self._send(text)
+
+    # Flush fired by the time window (a failed send is raised by the next write/close)
+    async def _timed_flush(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            self._error = e
+
+    # Flushes the remaining text; the stream can then be ended with a marker
+    async def close(self):
+        if self._error is not None:
+            raise self._error
+        await self.flush()
+
+    # Drops buffered text (e.g. when the answer failed)
+    def discard(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._parts = []
+        self._size = 0
+        self._oldest = None
+
+    async def _send(self, text: str):
+        await self.send(text)
+        self.frames += 1
+
+# Frame mode requested by the client (connect-time ?frames= or a message's "frames"), else the default
+def negotiate_frame_mode(*requested):
+    for mode in requested:
+        if mode and str(mode).lower() in FRAME_MODES:
+            return str(mode).lower()
+    return STREAM_FRAME_MODE
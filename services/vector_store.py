@@ -0,0 +1,233 @@
+# Imports
+import os
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents.indexes import SearchIndexClient
+from azure.search.documents.models import VectorizedQuery
+from azure.search.documents.indexes.models import (
+    SearchIndex,
+    SearchField,
+    SearchFieldDataType,
+    SimpleField,
+    SearchableField,
+    VectorSearch,
+    VectorSearchProfile,
+    HnswAlgorithmConfiguration,
+)
+
+# In-App Dependencies
+from services.cache import TTLCache
+from services.clients import get_search_client
+from services.concurrency import run_blocking
+from services.local_vector_index import LocalVectorIndex
+
+# Load Environment Variables
+load_dotenv('.env')
+
+###############################################################################
+# Vector Store Settings
+###############################################################################
+# 'azure' (Azure AI Search) or 'local' (memory-mapped indexes on this host)
+VECTOR_STORE_BACKEND = os.getenv('VECTOR_STORE_BACKEND', 'azure').lower()
+# Directory of the local indexes (shared by all workers on the host)
+LOCAL_VECTOR_DIR = os.getenv('LOCAL_VECTOR_DIR', os.path.join('data', 'vector_indexes'))
+# Local indexes kept open per worker (least recently used are closed)
+LOCAL_VECTOR_OPEN_INDEXES = int(os.getenv('LOCAL_VECTOR_OPEN_INDEXES', '64'))
+
+VECTOR_DIMENSIONS = 1536
+# Seconds an index's keyword-searchable flag is cached per worker
+KEYWORD_SEARCHABLE_TTL = 600
+
+###############################################################################
+# Vector Store Interface
+###############################################################################
+# Documents are dicts: {'id', 'content', 'content_vector', 'metadata' (json string)}
+# Search results are dicts: {'id', 'content', 'metadata', 'score'} (best first)
+class VectorStore:
+    # Creates an empty index for a user
+    def create_index(self, index_name: str):
+        raise NotImplementedError
+
+    # Deletes a user's index
+    def delete_index(self, index_name: str):
+        raise NotImplementedError
+
+    # Adds or replaces documents; returns the number indexed
+    async def add(self, index_name: str, documents: list):
+        raise NotImplementedError
+
+    # Deletes documents by id; returns the number deleted
+    async def delete(self, index_name: str, ids: list):
+        raise NotImplementedError
+
+    # Returns the k documents most similar to the vector
+    async def search(self, index_name: str, vector: list, k: int):
+        raise NotImplementedError
+
+    # Returns the k best full-text matches for the text, or None if the index has no full-text field
+    async def keyword_search(self, index_name: str, text: str, k: int):
+        raise NotImplementedError
+
+###############################################################################
+# Azure AI Search Backend
+###############################################################################
+class AzureSearchVectorStore(VectorStore):
+    def __init__(self):
+        self._keyword_searchable = TTLCache(maxsize=1024, ttl=KEYWORD_SEARCHABLE_TTL)
+
+    # Returns a Search Index Client
+    def _index_client(self):
+        return SearchIndexClient(
+            endpoint=os.environ['AZURE_SEARCH_SERVICE_ENDPOINT'],
+            credential=AzureKeyCredential(os.environ['AZURE_SEARCH_ADMIN_KEY'])
+        )
+
+    # Creates an AI Search Index w/ HNSW vector search
+    def create_index(self, index_name: str):
+        index = SearchIndex(
+            name=index_name,
+            fields=[
+                SimpleField(name="id", type=SearchFieldDataType.String, key=True),
+                SearchableField(name="content", type=SearchFieldDataType.String),
+                SearchableField(name="metadata", type=SearchFieldDataType.String),
+                SearchField(
+                    name="content_vector",
+                    type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+                    searchable=True,
+                    vector_search_dimensions=VECTOR_DIMENSIONS,
+                    vector_search_profile_name=f'{index_name}-vector-config'
+                )
+            ],
+            vector_search = VectorSearch(
+                profiles=[VectorSearchProfile(
+                    name=f'{index_name}-vector-config',
+                    algorithm_configuration_name=f'{index_name}-algorithms-config'
+                )],
+                algorithms=[HnswAlgorithmConfiguration(name=f'{index_name}-algorithms-config')],
+            )
+        )
+        self._index_client().create_index(index)
+
+    def delete_index(self, index_name: str):
+        self._index_client().delete_index(index_name)
+
+    # Raises on partial failures (throttling surfaces as HttpResponseError for the caller to retry)
+    async def add(self, index_name: str, documents: list):
+        results = await get_search_client(index_name).upload_documents(documents=documents)
+        failed = [result.key for result in results if not result.succeeded]
+        if failed:
+            raise RuntimeError(f'Failed to index {len(failed)} of {len(documents)} documents')
+        return len(documents)
+
+    async def delete(self, index_name: str, ids: list):
+        await get_search_client(index_name).delete_documents(documents=[{'id': doc_id} for doc_id in ids])
+        return len(ids)
+
+    async def search(self, index_name: str, vector: list, k: int):
+        results = await get_search_client(index_name).search(
+            search_text=None,
+            vector_queries=[VectorizedQuery(
+                vector=vector,
+                k_nearest_neighbors=k,
+                fields='content_vector'
+            )],
+            select=['id', 'content', 'metadata'],
+            top=k
+        )
+        return [
+            {'id': result['id'], 'content': result['content'], 'metadata': result.get('metadata'), 'score': result['@search.score']}
+            async for result in results
+        ]
+
+    # Returns True if the index's content field is full-text searchable. Indexes created before
+    # it was declared with SearchableField have it as a plain field, which Azure cannot change
+    # in place, so they stay vector-only until they are recreated.
+    async def _is_keyword_searchable(self, index_name: str):
+        searchable = self._keyword_searchable.get(index_name)
+        if searchable is None:
+            index = await run_blocking(self._index_client().get_index, index_name)
+            searchable = any(field.name == 'content' and field.searchable for field in index.fields)
+            self._keyword_searchable.set(index_name, searchable)
+        return searchable
+
+    # BM25 over the content field (None for indexes without a searchable content field)
+    async def keyword_search(self, index_name: str, text: str, k: int):
+        if not await self._is_keyword_searchable(index_name):
+            return None
+        results = await get_search_client(index_name).search(
+            search_text=text,
+            search_fields=['content'],
+            select=['id', 'content', 'metadata'],
+            top=k
+        )
+        return [
+            {'id': result['id'], 'content': result['content'], 'metadata': result.get('metadata'), 'score': result['@search.score']}
+            async for result in results
+        ]
+
+###############################################################################
+# Local Backend
+###############################################################################
+# Per-user indexes on local disk (see services/local_vector_index.py), searched in-process
+class LocalVectorStore(VectorStore):
+    def __init__(self, directory: str = LOCAL_VECTOR_DIR, max_open: int = LOCAL_VECTOR_OPEN_INDEXES):
+        self.directory = directory
+        self.max_open = max_open
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Returns the open index (least recently used indexes are dropped)
+    def _index(self, index_name: str):
+        with self._lock:
+            index = self._indexes.get(index_name)
+            if index is None:
+                index = LocalVectorIndex(self.directory, index_name, VECTOR_DIMENSIONS)
+                if not index.exists():
+                    raise LookupError(f'Vector index not found: {index_name}')
+                index.create()
+                self._indexes[index_name] = index
+            self._indexes.move_to_end(index_name)
+            while len(self._indexes) > self.max_open:
+                self._indexes.popitem(last=False)[1].close()
+            return index
+
+    def create_index(self, index_name: str):
+        LocalVectorIndex(self.directory, index_name, VECTOR_DIMENSIONS).create()
+
+    def delete_index(self, index_name: str):
+        with self._lock:
+            index = self._indexes.pop(index_name, None)
+        if index is not None:
+            index.close()
+        LocalVectorIndex(self.directory, index_name, VECTOR_DIMENSIONS).drop()
+
+    async def add(self, index_name: str, documents: list):
+        return await run_blocking(lambda: self._index(index_name).add(documents))
+
+    async def delete(self, index_name: str, ids: list):
+        return await run_blocking(lambda: self._index(index_name).delete(ids))
+
+    async def search(self, index_name: str, vector: list, k: int):
+        return await run_blocking(lambda: self._index(index_name).search(vector, k))
+
+    async def keyword_search(self, index_name: str, text: str, k: int):
+        return await run_blocking(lambda: self._index(index_name).keyword_search(text, k))
+
+###############################################################################
+# Backend Selection
+###############################################################################
+_vector_store = None
+
+# Returns the worker's vector store (VECTOR_STORE_BACKEND)
+def get_vector_store():
+    global _vector_store
+    if _vector_store is None:
+        if VECTOR_STORE_BACKEND == 'local':
+            _vector_store = LocalVectorStore()
+        elif VECTOR_STORE_BACKEND == 'azure':
+            _vector_store = AzureSearchVectorStore()
+        else:
+            raise ValueError(f'Unknown VECTOR_STORE_BACKEND: {VECTOR_STORE_BACKEND}')
+    return _vector_store